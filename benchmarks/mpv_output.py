@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+from randomvideoplayer.mpv_output import MpvOutputReader
+
+# Shaped like `mpv --msg-level=all=debug` output: mostly debug chatter,
+# a clip change every few hundred lines and the odd demuxer error.
+SAMPLE_LINES = (
+    b'[cplayer] Run command: loadfile, flags=64, args=[url="/media/clips/clip_%05d.webm"]\n',
+    b'[demux] Trying demuxers for level=normal.\n',
+    b'[ffmpeg/demuxer] matroska,webm: Stream #0: not enough frames to estimate rate\n',
+    b'[vo/gpu] Resize: 1920x1080\n',
+    b'[cache] read_chunk: 65536 bytes at 1048576\n',
+    b'AV: 00:00:%02d / 00:00:30 (10%%) A-V:  0.000 Cache: 9.8s/12MB\r',
+    b'[statusline] AV: 00:00:%02d / 00:00:30 (10%%)\n',
+)
+PLAYING_LINE = b'Playing: /media/clips/clip_%05d.webm\n'
+ERROR_LINE = b'[ffmpeg/video] vp9: Error parsing frame header (clip %05d)\n'
+
+
+def make_recording(lines: int, clip_every: int, error_every: int) -> bytes:
+    out = io.BytesIO()
+    for i in range(lines):
+        if i % clip_every == 0:
+            out.write(PLAYING_LINE % i)
+        elif i % error_every == 0:
+            out.write(ERROR_LINE % i)
+        else:
+            line = SAMPLE_LINES[i % len(SAMPLE_LINES)]
+            out.write(line % (i % 60) if b'%' in line else line)
+    return out.getvalue()
+
+
+def legacy_reader(stream: BinaryIO, parse: bool) -> int:
+    # The line-by-line text loop the session used before the chunked reader.
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')
+    lines = 0
+    for line in text:
+        lines += 1
+        if not parse:
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        if 'error' in line.lower() or 'failed' in line.lower():
+            pass
+        if line.startswith('Playing: '):
+            line[len('Playing: ') :].strip()
+    return lines
+
+
+def chunked_reader(stream: BinaryIO, parse: bool) -> int:
+    reader = MpvOutputReader(lambda line: None, lambda path: None, parse=lambda: parse)
+    reader.run(stream)
+    return reader.lines
+
+
+def feed_pipe(data: bytes, read: Callable[[BinaryIO, bool], int], parse: bool) -> tuple[int, float, float]:
+    read_fd, write_fd = os.pipe()
+
+    def write() -> None:
+        with os.fdopen(write_fd, 'wb') as f:
+            f.write(data)
+
+    writer = threading.Thread(target=write, daemon=True)
+    with os.fdopen(read_fd, 'rb') as stream:
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        writer.start()
+        lines = read(stream, parse)
+        cpu = time.thread_time() - cpu_started
+        elapsed = time.perf_counter() - started
+    writer.join()
+    return lines, elapsed, cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Measure mpv output draining at high line rates.',
+    )
+    parser.add_argument('--lines', type=int, default=500_000)
+    parser.add_argument('--clip-every', type=int, default=400)
+    parser.add_argument('--error-every', type=int, default=97)
+    parser.add_argument('--recording', type=Path, help='replay captured mpv output instead')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.recording is not None:
+        data = args.recording.read_bytes()
+    else:
+        data = make_recording(args.lines, args.clip_every, args.error_every)
+    newlines = data.count(b'\n')
+    print(f'input: {len(data) / 1e6:.1f} MB, {newlines} lines')
+
+    baseline: Optional[float] = None
+    for parse in (False, True):
+        for name, read in (('legacy', legacy_reader), ('chunked', chunked_reader)):
+            best = None
+            for _ in range(args.repeat):
+                lines, elapsed, cpu = feed_pipe(data, read, parse)
+                if best is None or elapsed < best[1]:
+                    best = (lines, elapsed, cpu)
+            assert best is not None
+            lines, elapsed, cpu = best
+            if name == 'legacy':
+                baseline = elapsed
+            assert baseline is not None
+            print(
+                f'{"parse" if parse else "drain"} {name:>8}  {elapsed * 1000:8.1f}ms  '
+                f'cpu {cpu * 1000:8.1f}ms  {lines / elapsed / 1e6:6.2f}M lines/s  '
+                f'x{baseline / elapsed:.1f}',
+            )
+
+
+if __name__ == '__main__':
+    main()
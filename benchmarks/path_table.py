@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator
+
+from randomvideoplayer.playlist_builder import write_playlist_file
+from randomvideoplayer.path_table import PathTable
+
+FILES_PER_DIR = 200
+
+
+def synthetic_batches(count: int) -> Iterator[tuple[str, list[str]]]:
+    dir_index = 0
+    remaining = count
+    while remaining > 0:
+        size = min(FILES_PER_DIR, remaining)
+        directory = f'/library/collection_{dir_index // 100:04d}/set_{dir_index:06d}'
+        yield directory, [f'clip_{dir_index:06d}_{i:04d}.webm' for i in range(size)]
+        remaining -= size
+        dir_index += 1
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        import tracemalloc
+
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1e6
+    return peak / 1e3
+
+
+def run_child(variant: str, count: int) -> dict[str, float]:
+    if sys.platform == 'win32':
+        import tracemalloc
+
+        tracemalloc.start()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if variant == 'path':
+        entries: list[Path] = []
+        for directory, names in synthetic_batches(count):
+            root_path = Path(directory)
+            for name in names:
+                entries.append(root_path / name)
+        built = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            playlist = Path(tmp) / 'playlist.m3u'
+            with playlist.open('w', encoding='utf-8') as f:
+                for path in entries:
+                    f.write(path.as_posix() + '\n')
+    else:
+        table = PathTable()
+        for directory, names in synthetic_batches(count):
+            table.extend(table.add_directory(directory), names)
+        built = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            write_playlist_file(table, Path(tmp) / 'playlist.m3u')
+    end = time.perf_counter()
+    return {
+        'build_s': built - start,
+        'write_s': end - built,
+        'entries_per_s': count / (end - start),
+        'peak_rss_mb': peak_rss_mb() - baseline,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Compare Path objects with PathTable for large libraries.',
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 5_000_000])
+    parser.add_argument('--child', nargs=2, metavar=('VARIANT', 'COUNT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], int(args.child[1]))))
+        return
+
+    # Each run gets a fresh interpreter so peak RSS is not shared.
+    for count in args.sizes:
+        for variant in ('path', 'table'):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.path_table', '--child', variant, str(count)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output)
+            print(
+                f'{count:>9} {variant:<6} build={result["build_s"]:7.2f}s '
+                f'write={result["write_s"]:7.2f}s '
+                f'{result["entries_per_s"]:10.0f} entries/s '
+                f'peak_rss=+{result["peak_rss_mb"]:.0f}MB',
+            )
+
+
+if __name__ == '__main__':
+    main()
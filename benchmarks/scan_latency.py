@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from randomvideoplayer.scanner import Listing, list_directory, walk_directories
+
+
+def make_tree(root: Path, depth: int, fanout: int, files_per_dir: int) -> int:
+    count = 0
+    for i in range(files_per_dir):
+        (root / f'clip_{i}.webm').touch()
+        count += 1
+    if depth > 0:
+        for i in range(fanout):
+            child = root / f'dir_{i}'
+            child.mkdir()
+            count += make_tree(child, depth - 1, fanout, files_per_dir)
+    return count
+
+
+def slow_lister(latency: float):
+    def list_dir(path: str) -> Optional[Listing]:
+        time.sleep(latency)
+        return list_directory(path)
+
+    return list_dir
+
+
+def run_scan(root: Path, workers: int, latency: float) -> tuple[int, float]:
+    list_dir = slow_lister(latency)
+    start = time.perf_counter()
+    count = 0
+    for _, files in walk_directories(str(root), True, workers, list_dir):
+        count += len(files)
+    return count, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Compare serial and parallel recursive scans with injected latency.',
+    )
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000.0
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        expected = make_tree(root, args.depth, args.fanout, args.files)
+        print(
+            f'tree: depth={args.depth} fanout={args.fanout} '
+            f'files={expected} latency={args.latency_ms}ms',
+        )
+        baseline: Optional[float] = None
+        for workers in args.workers:
+            count, elapsed = run_scan(root, workers, latency)
+            if count != expected:
+                raise RuntimeError(f'workers={workers} found {count}, expected {expected}')
+            if baseline is None:
+                baseline = elapsed
+            print(
+                f'workers={workers:>3}  {elapsed:8.3f}s  '
+                f'{count / elapsed:10.0f} files/s  x{baseline / elapsed:.1f}',
+            )
+
+
+if __name__ == '__main__':
+    main()
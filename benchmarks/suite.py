@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from randomvideoplayer.app_config import AppConfig
+from randomvideoplayer.library_index import LibraryIndex
+from randomvideoplayer.playlist_builder import (
+    build_path_table,
+    iter_webm_batches,
+    iter_webm_files,
+    write_playlist_file,
+)
+from randomvideoplayer.session import PlaybackSession
+
+MIXED_EXTENSIONS = ('.webm', '.mp4', '.mkv', '.jpg', '.txt', '.WEBM')
+
+STUB_MPV = '''import time
+
+time.sleep(30)
+'''
+
+
+def make_files(directory: Path, count: int, extensions: tuple[str, ...]) -> int:
+    directory.mkdir(parents=True, exist_ok=True)
+    webm = 0
+    for i in range(count):
+        ext = extensions[i % len(extensions)]
+        (directory / f'clip_{i:05d}{ext}').touch()
+        if ext.lower() == '.webm':
+            webm += 1
+    return webm
+
+
+def make_flat(root: Path, scale: int) -> int:
+    return make_files(root, 20 * scale, ('.webm',))
+
+
+def make_deep(root: Path, scale: int) -> int:
+    count = 0
+    current = root
+    for level in range(max(2, scale)):
+        count += make_files(current, 20, ('.webm',))
+        current = current / f'level_{level:03d}'
+    return count
+
+
+def make_wide(root: Path, scale: int) -> int:
+    count = 0
+    for i in range(10 * scale):
+        count += make_files(root / f'dir_{i:05d}', 2, ('.webm',))
+    return count
+
+
+def make_mixed(root: Path, scale: int) -> int:
+    count = 0
+    for i in range(scale):
+        for j in range(4):
+            count += make_files(
+                root / f'set_{i:04d}' / f'part_{j}',
+                6 * len(MIXED_EXTENSIONS),
+                MIXED_EXTENSIONS,
+            )
+    return count
+
+
+SHAPES: dict[str, Callable[[Path, int], int]] = {
+    'flat': make_flat,
+    'deep': make_deep,
+    'wide': make_wide,
+    'mixed': make_mixed,
+}
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> tuple[Any, dict[str, float]]:
+    result = None
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, {
+        'min_s': min(samples),
+        'median_s': statistics.median(samples),
+        'max_s': max(samples),
+    }
+
+
+def count_files(root: Path, recursive: bool, workers: int, index: Optional[LibraryIndex] = None) -> int:
+    return sum(1 for _ in iter_webm_files(root, recursive, index=index, workers=workers))
+
+
+def write_stub_mpv(directory: Path) -> Path:
+    script = directory / 'stub_mpv.py'
+    script.write_text(STUB_MPV, encoding='utf-8')
+    if sys.platform == 'win32':
+        launcher = directory / 'stub_mpv.cmd'
+        launcher.write_text(f'@"{sys.executable}" "{script}" %*\n', encoding='utf-8')
+    else:
+        launcher = directory / 'stub_mpv'
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n', encoding='utf-8')
+        launcher.chmod(0o755)
+    return launcher
+
+
+def bench_launch(root: Path, work: Path, mpv: Path, repeat: int) -> dict[str, Any]:
+    config = replace(
+        AppConfig(),
+        directory=str(root),
+        recursive=True,
+        fullscreen=False,
+        playlist_path=str(work / 'launch.m3u'),
+        mpv_path=str(mpv),
+        # Nothing may touch the user's config dir: no index, history,
+        # saved playback state or config watcher.
+        library_index_enabled=False,
+        playlist_cache_enabled=False,
+        history_enabled=False,
+        history_path=str(work / 'history.sqlite3'),
+        state_poll_interval=0.0,
+        resume_on_start=False,
+        config_reload=False,
+        watch_library=False,
+        metrics_enabled=False,
+        logging_enabled=False,
+        playback_log_enabled=False,
+    )
+    phases: dict[str, list[float]] = {}
+    totals: list[float] = []
+    for _ in range(repeat):
+        session = PlaybackSession(config)
+        start = time.perf_counter()
+        session.start()
+        totals.append(time.perf_counter() - start)
+        for name, seconds in session.timings.items():
+            phases.setdefault(name, []).append(seconds)
+        session.stop()
+        session.wait(timeout=5.0)
+        session.close()
+    result: dict[str, Any] = {
+        'min_s': min(totals),
+        'median_s': statistics.median(totals),
+        'max_s': max(totals),
+    }
+    for name, samples in phases.items():
+        result[f'{name}_median_s'] = statistics.median(samples)
+    return result
+
+
+def run_shape(shape: str, scale: int, repeat: int, workers: int, mpv: Path) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'library'
+        work = Path(tmp) / 'work'
+        work.mkdir()
+        expected = SHAPES[shape](root, scale)
+        result: dict[str, Any] = {'shape': shape, 'scale': scale, 'webm_files': expected}
+
+        found, result['scan_recursive'] = timed(lambda: count_files(root, True, 1), repeat)
+        if found != expected:
+            raise RuntimeError(f'{shape}: found {found}, expected {expected}')
+        _, result['scan_recursive_parallel'] = timed(
+            lambda: count_files(root, True, workers),
+            repeat,
+        )
+        _, result['scan_flat'] = timed(lambda: count_files(root, False, 1), repeat)
+
+        index = LibraryIndex(work / 'index.sqlite3')
+        try:
+            _, result['scan_index_cold'] = timed(lambda: count_files(root, True, workers, index), 1)
+            _, result['scan_index_warm'] = timed(
+                lambda: count_files(root, True, workers, index),
+                repeat,
+            )
+        finally:
+            index.close()
+
+        paths = list(iter_webm_files(root, True))
+        table = build_path_table(iter_webm_batches(root, True))
+        playlist = work / 'playlist.m3u'
+        _, result['write_paths'] = timed(lambda: write_playlist_file(paths, playlist), repeat)
+        _, result['write_table'] = timed(lambda: write_playlist_file(table, playlist), repeat)
+
+        result['launch'] = bench_launch(root, work, mpv, repeat)
+        return result
+
+
+def compare(results: dict[str, Any], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+    old = {(r['shape'], r['scale']): r for r in baseline['results']}
+    for current in results['results']:
+        previous = old.get((current['shape'], current['scale']))
+        if previous is None:
+            continue
+        for key, value in current.items():
+            if not isinstance(value, dict) or key not in previous:
+                continue
+            ratio = value['median_s'] / max(previous[key]['median_s'], 1e-9)
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f'{current["shape"]:<6} {key:<24} x{ratio:5.2f}{flag}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Time scanning, playlist writing and launch on synthetic libraries.',
+    )
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=list(SHAPES))
+    parser.add_argument('--scale', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--label', default='', help='free-form tag stored with the results')
+    parser.add_argument('--output', type=Path, help='write JSON results to this file')
+    parser.add_argument('--compare', type=Path, help='print median ratios against an earlier JSON run')
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {
+        'label': args.label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'workers': args.workers,
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        mpv = write_stub_mpv(Path(tmp))
+        for shape in args.shapes:
+            result = run_shape(shape, args.scale, args.repeat, args.workers, mpv)
+            results['results'].append(result)
+            print(
+                f'{shape:<6} files={result["webm_files"]:>6} '
+                f'scan={result["scan_recursive"]["median_s"] * 1000:8.1f}ms '
+                f'write={result["write_table"]["median_s"] * 1000:7.1f}ms '
+                f'launch={result["launch"]["median_s"] * 1000:7.1f}ms',
+                file=sys.stderr,
+            )
+
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(text, encoding='utf-8')
+    else:
+        print(text)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,25 @@
 from __future__ import annotations
 
-from gui import run_app
+import time
+
+STARTED = time.perf_counter()
+
+import multiprocessing
+import sys
 
 
 def main() -> None:
+    # Metadata probing uses a process pool, which frozen builds must bootstrap.
+    multiprocessing.freeze_support()
+    argv = sys.argv[1:]
+    if '--headless' in argv:
+        argv.remove('--headless')
+        from randomvideoplayer.headless import main as headless_main
+
+        sys.exit(headless_main(argv, started=STARTED))
+
+    from randomvideoplayer.gui import run_app
+
     run_app()
 
 
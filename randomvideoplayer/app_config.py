@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 import json
+import math
 import os
 import platform
+from typing import Any, Callable, Optional, get_args, get_origin, get_type_hints
 
 
 def _get_config_path() -> Path:
@@ -19,17 +21,87 @@ def _get_config_path() -> Path:
 
 
 CONFIG_PATH = _get_config_path()
+LIBRARY_INDEX_PATH = CONFIG_PATH.with_name('library_index.sqlite3')
+HISTORY_PATH = CONFIG_PATH.with_name('history.sqlite3')
+METADATA_CACHE_PATH = CONFIG_PATH.with_name('metadata_cache.sqlite3')
+DEDUP_INDEX_PATH = CONFIG_PATH.with_name('dedup_index.sqlite3')
+PLAYBACK_STATE_PATH = CONFIG_PATH.with_name('playback_state.json')
 
 
 @dataclass
 class AppConfig:
     directory: str = ''
     recursive: bool = False
+    roots: list[dict[str, Any]] = field(default_factory=list)
     fullscreen: bool = True
     loop_playlist: bool = True
     shuffle: bool = True
     playlist_path: str = str(Path.home() / 'webm_playlist.m3u')
     mpv_path: str = ''
+    library_index_enabled: bool = True
+    playlist_cache_enabled: bool = True
+    scan_workers: int = 8
+    follow_symlinks: bool = False
+    streaming_launch: bool = False
+    stream_initial_count: int = 50
+    stream_lookahead: int = 20
+    shuffle_engine: bool = False
+    shuffle_no_repeat_window: int = 500
+    shuffle_weight_horizon: int = 0
+    shuffle_queue_length: int = 5
+    screens: int = 1
+    restart_backoff_initial: float = 1.0
+    restart_backoff_max: float = 60.0
+    supervise: bool = True
+    restart_max_failures: int = 5
+    resume_on_start: bool = False
+    state_poll_interval: float = 5.0
+    watch_library: bool = False
+    watch_backend: str = 'auto'
+    watch_interval: float = 2.0
+    log_async: bool = True
+    log_queue_size: int = 10000
+    log_batch_size: int = 256
+    log_flush_interval: float = 0.5
+    log_overflow: str = 'drop_newest'
+    mpv_error_log_rate: float = 10.0
+    mpv_error_log_burst: int = 50
+    extensions: list[str] = field(default_factory=lambda: ['.webm'])
+    include_globs: list[str] = field(default_factory=list)
+    exclude_globs: list[str] = field(default_factory=list)
+    min_size_mb: float = 0.0
+    max_size_mb: float = 0.0
+    min_age_days: float = 0.0
+    max_age_days: float = 0.0
+    min_duration: float = 0.0
+    max_duration: float = 0.0
+    min_height: int = 0
+    max_height: int = 0
+    video_codecs: list[str] = field(default_factory=list)
+    dedup_enabled: bool = False
+    storage_profile: str = 'auto'
+    mpv_cache_secs: float = 0.0
+    mpv_readahead_secs: float = 0.0
+    mpv_demuxer_max_mb: int = 0
+    prewarm_enabled: bool = True
+    prewarm_count: int = 3
+    prewarm_budget_mb: int = 256
+    prewarm_mode: str = 'auto'
+    metadata_workers: int = 4
+    metadata_probe_bytes: int = 65536
+    history_enabled: bool = False
+    history_path: str = str(HISTORY_PATH)
+    history_max_rows: int = 10_000_000
+    metrics_enabled: bool = False
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 9464
+    metrics_json_path: str = ''
+    metrics_interval: float = 10.0
+    profiling_enabled: bool = False
+    profile_cprofile: bool = False
+    profile_tracemalloc: bool = False
+    config_reload: bool = True
+    config_reload_interval: float = 2.0
     logging_enabled: bool = False
     logging_path: str = str(Path.home() / 'randomvideoplayer.log')
     playback_log_enabled: bool = False
@@ -38,19 +110,258 @@ class AppConfig:
     )
 
 
-def load_config() -> AppConfig:
-    if CONFIG_PATH.is_file():
-        try:
-            data = json.loads(CONFIG_PATH.read_text(encoding='utf-8'))
-            return AppConfig(**data)
-        except Exception:
-            return AppConfig()
-    return AppConfig()
+CONFIG_VERSION = 1
+
+# Settings a running session picks up without restarting mpv. Filter changes
+# rescan the library when the shuffle engine owns the playlist.
+CACHE_FIELDS = frozenset({
+    'storage_profile',
+    'mpv_cache_secs',
+    'mpv_readahead_secs',
+    'mpv_demuxer_max_mb',
+})
+WORKER_FIELDS = frozenset({'scan_workers', 'metadata_workers'})
+PREWARM_FIELDS = frozenset({'prewarm_count', 'prewarm_budget_mb'})
+FILTER_FIELDS = frozenset({
+    'extensions',
+    'include_globs',
+    'exclude_globs',
+    'min_size_mb',
+    'max_size_mb',
+    'min_age_days',
+    'max_age_days',
+    'min_duration',
+    'max_duration',
+    'min_height',
+    'max_height',
+    'video_codecs',
+    'metadata_probe_bytes',
+})
+LIVE_FIELDS = CACHE_FIELDS | WORKER_FIELDS | PREWARM_FIELDS | FILTER_FIELDS
+
+_CHOICES = {
+    'watch_backend': ('auto', 'inotify', 'poll'),
+    'log_overflow': ('drop_newest', 'drop_oldest', 'block'),
+    'storage_profile': ('auto', 'local', 'rotational', 'network'),
+    'prewarm_mode': ('auto', 'fadvise', 'read'),
+}
+
+# Every numeric setting has a lower bound. Zero stays valid where the
+# setting documents it as off or unlimited: state polling, the no-repeat
+# window, the restart limit and history rotation.
+_MINIMUMS = {
+    'scan_workers': 1,
+    'stream_initial_count': 1,
+    'stream_lookahead': 1,
+    'shuffle_no_repeat_window': 0,
+    'shuffle_weight_horizon': 0,
+    'shuffle_queue_length': 1,
+    'screens': 1,
+    'restart_backoff_initial': 0.1,
+    'restart_backoff_max': 0.1,
+    'restart_max_failures': 0,
+    'state_poll_interval': 0.0,
+    'watch_interval': 0.2,
+    'log_queue_size': 1,
+    'log_batch_size': 1,
+    'log_flush_interval': 0.05,
+    'mpv_error_log_rate': 0.0,
+    'mpv_error_log_burst': 1,
+    'min_size_mb': 0.0,
+    'max_size_mb': 0.0,
+    'min_age_days': 0.0,
+    'max_age_days': 0.0,
+    'min_duration': 0.0,
+    'max_duration': 0.0,
+    'min_height': 0,
+    'max_height': 0,
+    'mpv_cache_secs': 0.0,
+    'mpv_readahead_secs': 0.0,
+    'mpv_demuxer_max_mb': 0,
+    'prewarm_count': 1,
+    'prewarm_budget_mb': 0,
+    'metadata_workers': 0,
+    'metadata_probe_bytes': 4096,
+    'history_max_rows': 0,
+    'metrics_port': 0,
+    'metrics_interval': 0.5,
+    'config_reload_interval': 0.2,
+}
+
+_MAXIMUMS = {
+    'scan_workers': 256,
+    'metadata_workers': 256,
+    'metadata_probe_bytes': 64 * 1024 * 1024,
+    'metrics_port': 65535,
+}
+
+_FIELD_TYPES = get_type_hints(AppConfig)
+
+_INVALID = object()
+
+# Schema version -> function upgrading a file of that version by one step.
+# Files written before the version key existed (version 0) already use the
+# version 1 field names, so they need no step.
+_MIGRATIONS: dict[int, Callable[[dict[str, Any]], dict[str, Any]]] = {}
+
+
+def root_problem(item: Any) -> Optional[str]:
+    if isinstance(item, str):
+        return None if item.strip() else 'empty path'
+    if not isinstance(item, dict):
+        return 'not a path or an object'
+    path = item.get('path')
+    if not isinstance(path, str) or not path.strip():
+        return 'missing path'
+    weight = item.get('weight', 1.0)
+    if (
+        isinstance(weight, bool)
+        or not isinstance(weight, (int, float))
+        or not math.isfinite(weight)
+        or weight < 0
+    ):
+        return f'invalid weight {weight!r}'
+    recursive = item.get('recursive', False)
+    if not isinstance(recursive, bool):
+        return f'invalid recursive {recursive!r}'
+    return None
+
+
+def _coerce(kind: Any, value: Any) -> Any:
+    if kind is bool:
+        return value if isinstance(value, bool) else _INVALID
+    if isinstance(value, bool):
+        return _INVALID
+    if kind is int:
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return _INVALID
+    if kind is float:
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            return float(value)
+        return _INVALID
+    if kind is str:
+        return value if isinstance(value, str) else _INVALID
+    if get_origin(kind) is list and isinstance(value, list):
+        (item,) = get_args(kind)
+        if item is str:
+            return value if all(isinstance(v, str) for v in value) else _INVALID
+        # Library roots are either a bare path or a dict with a path.
+        if all(root_problem(v) is None for v in value):
+            return value
+    return _INVALID
+
+
+def _validate(name: str, value: Any) -> Any:
+    value = _coerce(_FIELD_TYPES[name], value)
+    if value is _INVALID:
+        return _INVALID
+    choices = _CHOICES.get(name)
+    if choices is not None and value not in choices:
+        return _INVALID
+    minimum = _MINIMUMS.get(name)
+    if minimum is not None and value < minimum:
+        return _INVALID
+    maximum = _MAXIMUMS.get(name)
+    if maximum is not None and value > maximum:
+        return _INVALID
+    if name == 'prewarm_mode' and value == 'fadvise' and not hasattr(os, 'posix_fadvise'):
+        return _INVALID
+    return value
+
+
+def validate_changes(changes: dict[str, Any]) -> list[str]:
+    # Overrides from the command line get the same checks as the file.
+    return [
+        f'invalid value {value!r} for "{name}"'
+        for name, value in changes.items()
+        if _validate(name, value) is _INVALID
+    ]
+
+
+def migrate_config(data: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
+    problems: list[str] = []
+    version = data.pop('version', 0)
+    if not isinstance(version, int) or isinstance(version, bool) or version < 0:
+        problems.append(f'invalid version {version!r}, reading as version {CONFIG_VERSION}')
+        version = CONFIG_VERSION
+    if version > CONFIG_VERSION:
+        problems.append(
+            f'written by a newer version (schema {version}), unknown settings are ignored',
+        )
+    while version < CONFIG_VERSION:
+        migrate = _MIGRATIONS.get(version)
+        if migrate is not None:
+            data = migrate(data)
+        version += 1
+    return data, problems
+
+
+def parse_config(data: Any) -> tuple[AppConfig, list[str]]:
+    if not isinstance(data, dict):
+        return AppConfig(), ['config is not a JSON object, using defaults']
+    data, problems = migrate_config(dict(data))
+    values: dict[str, Any] = {}
+    for name, raw in data.items():
+        if name not in _FIELD_TYPES:
+            problems.append(f'unknown setting "{name}" ignored')
+            continue
+        if name == 'roots' and isinstance(raw, list):
+            # One bad root should not discard the others.
+            kept = []
+            for item in raw:
+                problem = root_problem(item)
+                if problem is None:
+                    kept.append(item)
+                else:
+                    problems.append(f'invalid library root {item!r} dropped: {problem}')
+            raw = kept
+        value = _validate(name, raw)
+        if value is _INVALID:
+            problems.append(f'invalid value {raw!r} for "{name}", using the default')
+            continue
+        values[name] = value
+    return AppConfig(**values), problems
+
+
+def read_config(path: Path = CONFIG_PATH) -> tuple[AppConfig, list[str]]:
+    return parse_config(json.loads(path.read_text(encoding='utf-8')))
+
+
+def load_config(problems: Optional[list[str]] = None) -> AppConfig:
+    if not CONFIG_PATH.is_file():
+        return AppConfig()
+    try:
+        config, found = read_config(CONFIG_PATH)
+    except (OSError, ValueError) as exc:
+        config, found = AppConfig(), [f'unreadable config, using defaults: {exc}']
+    if problems is not None:
+        problems.extend(found)
+    return config
 
 
 def save_config(config: AppConfig) -> None:
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    CONFIG_PATH.write_text(
-        json.dumps(asdict(config), indent=2),
+    data: dict[str, Any] = {'version': CONFIG_VERSION}
+    data.update(asdict(config))
+    # Settings from a newer version survive being saved by this one, and
+    # so does its version, so that it does not migrate its own keys again.
+    try:
+        previous = json.loads(CONFIG_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        previous = None
+    if isinstance(previous, dict):
+        stored = previous.get('version')
+        if isinstance(stored, int) and not isinstance(stored, bool) and stored > CONFIG_VERSION:
+            data['version'] = stored
+        for name, value in previous.items():
+            if name not in data:
+                data[name] = value
+    tmp_path = CONFIG_PATH.with_name(CONFIG_PATH.name + '.tmp')
+    tmp_path.write_text(
+        json.dumps(data, indent=2),
         encoding='utf-8',
     )
+    os.replace(tmp_path, CONFIG_PATH)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import random
+from typing import Optional
+
+
+class Backoff:
+    def __init__(
+        self,
+        initial: float = 1.0,
+        maximum: float = 60.0,
+        reset_after: float = 60.0,
+        jitter: float = 0.1,
+    ) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.reset_after = reset_after
+        self.jitter = jitter
+        self.delay = initial
+        self.failures = 0
+
+    def next_delay(self, ran_for: float) -> float:
+        # A run that stayed up long enough counts as healthy, so the next
+        # failure starts again from the shortest delay.
+        if ran_for >= self.reset_after:
+            self.delay = self.initial
+            self.failures = 0
+        delay = self.delay
+        self.delay = min(self.maximum, self.delay * 2)
+        self.failures += 1
+        return delay * (1.0 + random.uniform(0.0, self.jitter))
+
+
+def restart_delay(
+    backoff: Backoff,
+    code: Optional[int],
+    ran_for: float,
+    max_failures: int,
+) -> Optional[float]:
+    # Exit code 0 is a user quit or the end of the playlist; only crashes
+    # restart, and only until too many of them happen in a row.
+    if code == 0:
+        return None
+    delay = backoff.next_delay(ran_for)
+    if max_failures > 0 and backoff.failures > max_failures:
+        return None
+    return delay
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from randomvideoplayer.app_config import AppConfig, read_config
+from randomvideoplayer.file_logger import FileLogger
+
+ConfigChangeCallback = Callable[[dict[str, Any]], None]
+
+
+class ConfigWatcher:
+    def __init__(
+        self,
+        path: Path,
+        on_change: ConfigChangeCallback,
+        interval: float = 2.0,
+        logger: Optional[FileLogger] = None,
+    ) -> None:
+        self.path = path
+        self.on_change = on_change
+        self.interval = max(0.2, interval)
+        self.logger = logger
+        self.current: Optional[AppConfig] = None
+        self.stamp: Optional[tuple[int, int]] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def _stat(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> Optional[AppConfig]:
+        try:
+            config, problems = read_config(self.path)
+        except (OSError, ValueError) as exc:
+            # Usually an editor caught mid-save; the next write retries.
+            self._log(f'Config reload skipped: {exc}')
+            return None
+        for problem in problems:
+            self._log(f'Config: {problem}')
+        return config
+
+    def start(self) -> None:
+        # Changes are measured against the file, not the running config, so
+        # command line overrides stay until the same setting is edited.
+        self.stamp = self._stat()
+        self.current = self._read() if self.stamp is not None else None
+        self.thread = threading.Thread(
+            target=self._run,
+            name='config-watcher',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as exc:
+                self._log(f'Config reload failed: {exc}')
+
+    def poll(self) -> None:
+        stamp = self._stat()
+        if stamp is None or stamp == self.stamp:
+            return
+        self.stamp = stamp
+        config = self._read()
+        if config is None:
+            return
+        previous = self.current
+        self.current = config
+        if previous is None:
+            return
+        changes = {
+            f.name: getattr(config, f.name)
+            for f in fields(config)
+            if getattr(config, f.name) != getattr(previous, f.name)
+        }
+        if changes:
+            self.on_change(changes)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable, Iterable, Optional
+
+from randomvideoplayer.playlist_builder import ScanCancelled
+
+PARTIAL_BLOCK_SIZE = 64 * 1024
+FULL_CHUNK_SIZE = 1 << 20
+STAT_CHUNK_SIZE = 256
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    partial BLOB,
+    full BLOB
+) WITHOUT ROWID
+'''
+
+FileKey = tuple[str, int, int]
+
+
+def _stat_keys(paths: list[str]) -> list[FileKey]:
+    keys = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        keys.append((path, st.st_size, st.st_mtime_ns))
+    return keys
+
+
+def partial_hash(path: str, size: int) -> bytes:
+    digest = hashlib.blake2b(size.to_bytes(8, 'little'), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BLOCK_SIZE))
+        if size > 2 * PARTIAL_BLOCK_SIZE:
+            f.seek(size - PARTIAL_BLOCK_SIZE)
+            digest.update(f.read(PARTIAL_BLOCK_SIZE))
+        elif size > PARTIAL_BLOCK_SIZE:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def full_hash(path: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), FULL_CHUNK_SIZE):
+                    digest.update(view[offset : offset + FULL_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.digest()
+
+
+class DedupIndex:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(path),
+            check_same_thread=False,
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS hashes')
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def get(self, key: FileKey) -> tuple[Optional[bytes], Optional[bytes]]:
+        path, size, mtime_ns = key
+        with self.lock:
+            if self.conn is None:
+                return None, None
+            row = self.conn.execute(
+                'SELECT size, mtime_ns, partial, full FROM hashes WHERE path = ?',
+                (path,),
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None, None
+        return row[2], row[3]
+
+    def put(self, key: FileKey, partial: Optional[bytes], full: Optional[bytes]) -> None:
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.execute(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                (*key, partial, full),
+            )
+
+    def commit(self) -> None:
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+
+
+class DuplicateFinder:
+    def __init__(
+        self,
+        index: Optional[DedupIndex] = None,
+        workers: int = 4,
+        cancel_event: Optional[Event] = None,
+    ) -> None:
+        self.index = index
+        self.workers = max(1, workers)
+        self.cancel_event = cancel_event
+        self.partial_hashed = 0
+        self.full_hashed = 0
+        self.cached = 0
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScanCancelled('Scan cancelled')
+
+    def _stat_keys(self, paths: list[str]) -> list[FileKey]:
+        self.check_cancelled()
+        return _stat_keys(paths)
+
+    def _hash(self, key: FileKey, stage: str) -> Optional[bytes]:
+        self.check_cancelled()
+        cached_partial, cached_full = (None, None)
+        if self.index is not None:
+            cached_partial, cached_full = self.index.get(key)
+        cached = cached_partial if stage == 'partial' else cached_full
+        if cached is not None:
+            self.cached += 1
+            return cached
+        path, size, _ = key
+        try:
+            if stage == 'partial':
+                value = partial_hash(path, size)
+                self.partial_hashed += 1
+            else:
+                value = full_hash(path)
+                self.full_hashed += 1
+        except OSError:
+            return None
+        if self.index is not None:
+            if stage == 'partial':
+                self.index.put(key, value, cached_full)
+            else:
+                self.index.put(key, cached_partial, value)
+        return value
+
+    def _group(
+        self,
+        groups: list[list[FileKey]],
+        stage: str,
+    ) -> list[list[FileKey]]:
+        keys = [key for group in groups for key in group]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dedup') as pool:
+            hashes = list(pool.map(lambda key: self._hash(key, stage), keys))
+        buckets: dict[tuple[int, bytes], list[FileKey]] = {}
+        for key, value in zip(keys, hashes):
+            if value is not None:
+                buckets.setdefault((key[1], value), []).append(key)
+        return [group for group in buckets.values() if len(group) > 1]
+
+    def find(self, paths: Iterable[str]) -> list[list[str]]:
+        paths = list(paths)
+        chunks = [
+            paths[start : start + STAT_CHUNK_SIZE]
+            for start in range(0, len(paths), STAT_CHUNK_SIZE)
+        ]
+        # Every build stats the whole playlist before the index is asked,
+        # so on network shares the stats run on the pool like the hashing.
+        by_size: dict[int, list[FileKey]] = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dedup') as pool:
+            for keys in pool.map(self._stat_keys, chunks):
+                for key in keys:
+                    by_size.setdefault(key[1], []).append(key)
+
+        candidates = [group for group in by_size.values() if len(group) > 1]
+        if not candidates:
+            return []
+        groups = self._group(candidates, 'partial')
+        # Files that fit inside the partial blocks were already hashed whole.
+        small = [g for g in groups if g[0][1] <= 2 * PARTIAL_BLOCK_SIZE]
+        large = [g for g in groups if g[0][1] > 2 * PARTIAL_BLOCK_SIZE]
+        if large:
+            small.extend(self._group(large, 'full'))
+        if self.index is not None:
+            self.index.commit()
+        return [sorted(key[0] for key in group) for group in small]
+
+
+def find_duplicates(
+    paths: Iterable[str],
+    index: Optional[DedupIndex] = None,
+    workers: int = 4,
+    log: Optional[Callable[[str], None]] = None,
+    cancel_event: Optional[Event] = None,
+) -> set[str]:
+    finder = DuplicateFinder(index, workers, cancel_event)
+    groups = finder.find(paths)
+    # The lexicographically first path of each group is kept so repeated
+    # builds keep the same copy regardless of scan order.
+    redundant = {path for group in groups for path in group[1:]}
+    if log is not None:
+        log(
+            f'Dedup: {len(groups)} duplicate groups, {len(redundant)} files dropped, '
+            f'{finder.partial_hashed} partial and {finder.full_hashed} full hashes, '
+            f'{finder.cached} cached',
+        )
+    return redundant
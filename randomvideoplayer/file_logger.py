@@ -1,30 +1,131 @@
 from __future__ import annotations
 
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from threading import Lock
+from threading import Condition, Lock, Thread
 from typing import Optional
 
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
 
 class FileLogger:
-    def __init__(self, enabled: bool, path: Optional[Path]) -> None:
+    def __init__(
+        self,
+        enabled: bool,
+        path: Optional[Path],
+        async_mode: bool = False,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        overflow: str = 'drop_newest',
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy "{overflow}"')
         self.enabled = enabled and path is not None
         self.path = path
         self.lock = Lock()
         self.file = None
+        self.async_mode = async_mode
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue: deque[str] = deque()
+        self.cond = Condition(self.lock)
+        self.closing = False
+        self.thread: Optional[Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
         if self.enabled and self.path is not None:
             self.path.parent.mkdir(parents=True, exist_ok=True)
-            self.file = self.path.open('a', encoding='utf-8', buffering=1)
+            if self.async_mode:
+                self.file = self.path.open('a', encoding='utf-8')
+                self.thread = Thread(
+                    target=self._run,
+                    name=f'log-writer-{self.path.name}',
+                    daemon=True,
+                )
+                self.thread.start()
+            else:
+                self.file = self.path.open('a', encoding='utf-8', buffering=1)
 
     def log(self, message: str) -> None:
         if not self.enabled or self.file is None:
             return
         timestamp = datetime.now().isoformat(timespec='seconds')
         line = f'{timestamp}\t{message}\n'
-        with self.lock:
-            self.file.write(line)
+        if not self.async_mode:
+            with self.lock:
+                if self.file is not None:
+                    self.file.write(line)
+                    self.written += 1
+            return
+        with self.cond:
+            if self.closing:
+                return
+            if len(self.queue) >= self.queue_size:
+                if self.overflow == 'drop_newest':
+                    self.dropped += 1
+                    return
+                if self.overflow == 'drop_oldest':
+                    self.queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self.queue) >= self.queue_size and not self.closing:
+                        self.cond.wait()
+                    if self.closing:
+                        return
+            self.queue.append(line)
+            if len(self.queue) >= self.batch_size:
+                self.cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                if not self.closing and len(self.queue) < self.batch_size:
+                    self.cond.wait(self.flush_interval)
+                lines = list(self.queue)
+                self.queue.clear()
+                closing = self.closing
+                # Wakes producers blocked by the 'block' overflow policy.
+                self.cond.notify_all()
+            if lines:
+                self._write(lines)
+            if closing:
+                return
+
+    def _write(self, lines: list[str]) -> None:
+        if self.file is None:
+            return
+        try:
+            self.file.write(''.join(lines))
+            self.file.flush()
+        except OSError:
+            self.dropped += len(lines)
+            return
+        self.written += len(lines)
+        self.batches += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': len(self.queue),
+            'batches': self.batches,
+        }
 
     def close(self) -> None:
+        if self.thread is not None:
+            with self.cond:
+                self.closing = True
+                self.cond.notify_all()
+            self.thread.join()
+            self.thread = None
+            if self.dropped and self.file is not None:
+                timestamp = datetime.now().isoformat(timespec='seconds')
+                self._write([f'{timestamp}\tLogger dropped {self.dropped} records\n'])
         if self.file is not None:
             with self.lock:
                 self.file.close()
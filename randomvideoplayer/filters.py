@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import sys
+import time
+from typing import Callable, Optional, Sequence
+
+from randomvideoplayer.app_config import AppConfig
+from randomvideoplayer.metadata import MediaInfo, MetadataCache
+
+MetadataPredicate = Callable[[MediaInfo], bool]
+
+SECONDS_PER_DAY = 86400.0
+BYTES_PER_MB = 1024 * 1024
+
+
+def compile_globs(
+    include: Sequence[str],
+    exclude: Sequence[str],
+) -> Optional[re.Pattern[str]]:
+    if not include and not exclude:
+        return None
+    # One pattern: a negative lookahead for the excludes in front of an
+    # alternation of the includes, so each path is matched exactly once.
+    pattern = ''
+    if exclude:
+        pattern += '(?!' + '|'.join(fnmatch.translate(g) for g in exclude) + ')'
+    if include:
+        pattern += '(?:' + '|'.join(fnmatch.translate(g) for g in include) + ')'
+    flags = re.IGNORECASE if sys.platform == 'win32' else 0
+    return re.compile(pattern, flags)
+
+
+def _prefix(directory: str) -> str:
+    return directory.replace(os.sep, '/').rstrip('/') + '/'
+
+
+def metadata_predicates(config: AppConfig) -> list[MetadataPredicate]:
+    predicates: list[MetadataPredicate] = []
+    if config.min_duration > 0:
+        predicates.append(
+            lambda info: info.duration is None or info.duration >= config.min_duration,
+        )
+    if config.max_duration > 0:
+        predicates.append(
+            lambda info: info.duration is None or info.duration <= config.max_duration,
+        )
+    if config.min_height > 0:
+        predicates.append(
+            lambda info: info.height is None or info.height >= config.min_height,
+        )
+    if config.max_height > 0:
+        predicates.append(
+            lambda info: info.height is None or info.height <= config.max_height,
+        )
+    if config.video_codecs:
+        codecs = {codec.upper() for codec in config.video_codecs}
+        predicates.append(
+            lambda info: info.video_codec is None or info.video_codec.upper() in codecs,
+        )
+    return predicates
+
+
+class MediaFilter:
+    def __init__(
+        self,
+        extensions: Sequence[str] = ('.webm',),
+        include_globs: Sequence[str] = (),
+        exclude_globs: Sequence[str] = (),
+        min_size: int = 0,
+        max_size: int = 0,
+        min_age: float = 0.0,
+        max_age: float = 0.0,
+        predicates: Sequence[MetadataPredicate] = (),
+        metadata: Optional[MetadataCache] = None,
+        probe_bytes: int = 65536,
+    ) -> None:
+        self.extensions = tuple(
+            ext.lower() if ext.startswith('.') else '.' + ext.lower()
+            for ext in extensions
+        )
+        self.pattern = compile_globs(include_globs, exclude_globs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_age = min_age
+        self.max_age = max_age
+        self.predicates = list(predicates) if metadata is not None else []
+        self.metadata = metadata
+        self.probe_bytes = probe_bytes
+        self.needs_stat = bool(min_size or max_size or min_age or max_age)
+        self.probes = bool(self.predicates)
+        self.rejected = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        config: AppConfig,
+        metadata: Optional[MetadataCache] = None,
+    ) -> MediaFilter:
+        return cls(
+            extensions=config.extensions,
+            include_globs=config.include_globs,
+            exclude_globs=config.exclude_globs,
+            min_size=int(config.min_size_mb * BYTES_PER_MB),
+            max_size=int(config.max_size_mb * BYTES_PER_MB),
+            min_age=config.min_age_days * SECONDS_PER_DAY,
+            max_age=config.max_age_days * SECONDS_PER_DAY,
+            predicates=metadata_predicates(config),
+            metadata=metadata,
+            probe_bytes=config.metadata_probe_bytes,
+        )
+
+    def match_name(self, name: str) -> bool:
+        return not self.extensions or name.lower().endswith(self.extensions)
+
+    def _stat_ok(self, path: str) -> bool:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if self.min_size and st.st_size < self.min_size:
+            return False
+        if self.max_size and st.st_size > self.max_size:
+            return False
+        if not (self.min_age or self.max_age):
+            return True
+        # Ages are measured when the file is checked, so a long-running
+        # watcher keeps the window moving with the clock.
+        age = time.time() - st.st_mtime
+        if self.min_age and age < self.min_age:
+            return False
+        if self.max_age and age > self.max_age:
+            return False
+        return True
+
+    def prefilter(self, directory: str, names: list[str]) -> list[str]:
+        total = len(names)
+        if self.extensions:
+            names = [name for name in names if name.lower().endswith(self.extensions)]
+        if not names:
+            self.rejected += total
+            return names
+        prefix = _prefix(directory)
+        if self.pattern is not None:
+            match = self.pattern.match
+            names = [name for name in names if match(prefix + name)]
+        # Everything above works on names alone; stat and probing only see
+        # files that already passed the cheap checks.
+        if names and self.needs_stat:
+            names = [name for name in names if self._stat_ok(prefix + name)]
+        self.rejected += total - len(names)
+        return names
+
+    def filter_probed(
+        self,
+        batches: list[tuple[str, list[str]]],
+    ) -> list[tuple[str, list[str]]]:
+        if not self.probes or self.metadata is None:
+            return batches
+        # One probe call for several directories keeps the process pool
+        # busy even when each directory only holds a few clips.
+        infos = self.metadata.probe_many(
+            [_prefix(directory) + name for directory, names in batches for name in names],
+            probe_bytes=self.probe_bytes,
+        )
+        result = []
+        for directory, names in batches:
+            prefix = _prefix(directory)
+            kept = []
+            for name in names:
+                info = infos.get(prefix + name)
+                # Files the EBML reader cannot parse (e.g. mp4) are not
+                # constrained by metadata predicates.
+                if info is None or all(predicate(info) for predicate in self.predicates):
+                    kept.append(name)
+            self.rejected += len(names) - len(kept)
+            result.append((directory, kept))
+        return result
+
+    def filter_batch(self, directory: str, names: list[str]) -> list[str]:
+        names = self.prefilter(directory, names)
+        if not names or not self.probes:
+            return names
+        return self.filter_probed([(directory, names)])[0][1]
@@ -1,17 +1,16 @@
 from __future__ import annotations
 
-import subprocess
 import threading
+from dataclasses import replace
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
 from randomvideoplayer.app_config import AppConfig, load_config, save_config
-from randomvideoplayer.file_logger import FileLogger
-from randomvideoplayer.mpv_utils import find_mpv_executable, build_mpv_command
-from randomvideoplayer.playlist_builder import iter_webm_files, write_playlist_file
+from randomvideoplayer.playlist_builder import ScanProgress
+from randomvideoplayer.session import PlaybackSession, SessionCancelled, SessionError
 
 
 class WebmPlayerApp:
@@ -19,24 +18,41 @@ class WebmPlayerApp:
         self.root = root
         self.root.title('Random Video Player (mpv)')
 
-        self.config: AppConfig = load_config()
+        problems: list[str] = []
+        self.config: AppConfig = load_config(problems)
 
-        self.mpv_process: Optional[subprocess.Popen] = None
-        self.mpv_thread: Optional[threading.Thread] = None
-        self.app_logger: Optional[FileLogger] = None
-        self.playback_logger: Optional[FileLogger] = None
+        self.session: Optional[PlaybackSession] = None
+        self.start_thread: Optional[threading.Thread] = None
+        self.closing = False
 
         self.create_widgets()
         self.apply_config_to_widgets()
+        if problems:
+            more = f' (+{len(problems) - 1} more)' if len(problems) > 1 else ''
+            self.status_var.set(f'Config: {problems[0]}{more}')
 
         self.root.protocol('WM_DELETE_WINDOW', self.on_close)
 
     def apply_config_to_widgets(self) -> None:
         self.dir_var.set(self.config.directory)
+        if self.config.roots:
+            paths = ', '.join(
+                item if isinstance(item, str) else str(item.get('path'))
+                for item in self.config.roots
+            )
+            self.roots_var.set(f'Library roots from the config are used instead: {paths}')
+        else:
+            self.roots_var.set('')
         self.recursive_var.set(1 if self.config.recursive else 0)
         self.fullscreen_var.set(1 if self.config.fullscreen else 0)
         self.loop_var.set(1 if self.config.loop_playlist else 0)
         self.shuffle_var.set(1 if self.config.shuffle else 0)
+        self.index_var.set(1 if self.config.library_index_enabled else 0)
+        self.streaming_var.set(1 if self.config.streaming_launch else 0)
+        self.engine_var.set(1 if self.config.shuffle_engine else 0)
+        self.watch_var.set(1 if self.config.watch_library else 0)
+        self.supervise_var.set(1 if self.config.supervise else 0)
+        self.history_var.set(1 if self.config.history_enabled else 0)
         self.playlist_var.set(self.config.playlist_path)
         self.mpv_var.set(self.config.mpv_path)
         self.log_enabled_var.set(1 if self.config.logging_enabled else 0)
@@ -50,12 +66,19 @@ class WebmPlayerApp:
         self.set_status('Idle')
 
     def read_widgets_to_config(self) -> AppConfig:
-        return AppConfig(
+        return replace(
+            self.config,
             directory=self.dir_var.get(),
             recursive=bool(self.recursive_var.get()),
             fullscreen=bool(self.fullscreen_var.get()),
             loop_playlist=bool(self.loop_var.get()),
             shuffle=bool(self.shuffle_var.get()),
+            library_index_enabled=bool(self.index_var.get()),
+            streaming_launch=bool(self.streaming_var.get()),
+            shuffle_engine=bool(self.engine_var.get()),
+            watch_library=bool(self.watch_var.get()),
+            supervise=bool(self.supervise_var.get()),
+            history_enabled=bool(self.history_var.get()),
             playlist_path=self.playlist_var.get(),
             mpv_path=self.mpv_var.get(),
             logging_enabled=bool(self.log_enabled_var.get()),
@@ -89,6 +112,16 @@ class WebmPlayerApp:
         )
         row += 1
 
+        # Roots are only edited in the config file but take precedence
+        # over the directory above, so the window says so.
+        self.roots_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.roots_var, wraplength=400).grid(
+            row=row,
+            column=1,
+            sticky='w',
+        )
+        row += 1
+
         self.recursive_var = tk.IntVar(value=0)
         recursive_check = ttk.Checkbutton(
             main_frame,
@@ -135,6 +168,12 @@ class WebmPlayerApp:
         self.fullscreen_var = tk.IntVar(value=1)
         self.loop_var = tk.IntVar(value=1)
         self.shuffle_var = tk.IntVar(value=1)
+        self.index_var = tk.IntVar(value=1)
+        self.streaming_var = tk.IntVar(value=0)
+        self.engine_var = tk.IntVar(value=0)
+        self.watch_var = tk.IntVar(value=0)
+        self.supervise_var = tk.IntVar(value=1)
+        self.history_var = tk.IntVar(value=0)
 
         ttk.Checkbutton(
             options_frame,
@@ -151,6 +190,36 @@ class WebmPlayerApp:
             text='Shuffle',
             variable=self.shuffle_var,
         ).grid(row=0, column=2, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='Use library index',
+            variable=self.index_var,
+        ).grid(row=0, column=3, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='Start while scanning',
+            variable=self.streaming_var,
+        ).grid(row=1, column=0, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='No-repeat shuffle',
+            variable=self.engine_var,
+        ).grid(row=1, column=1, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='Watch for new files',
+            variable=self.watch_var,
+        ).grid(row=1, column=2, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='Restart mpv if it crashes',
+            variable=self.supervise_var,
+        ).grid(row=1, column=3, sticky='w')
+        ttk.Checkbutton(
+            options_frame,
+            text='Remember played clips',
+            variable=self.history_var,
+        ).grid(row=2, column=0, sticky='w')
 
         row += 1
 
@@ -226,6 +295,30 @@ class WebmPlayerApp:
         )
         self.stop_button.grid(row=0, column=1, padx=5, sticky='ew')
 
+        self.pause_button = ttk.Button(
+            buttons_frame,
+            text='Pause',
+            command=self.toggle_pause,
+            state='disabled',
+        )
+        self.pause_button.grid(row=0, column=2, padx=5, sticky='ew')
+
+        self.next_button = ttk.Button(
+            buttons_frame,
+            text='Next',
+            command=self.skip_clip,
+            state='disabled',
+        )
+        self.next_button.grid(row=0, column=3, padx=5, sticky='ew')
+
+        self.cancel_button = ttk.Button(
+            buttons_frame,
+            text='Cancel',
+            command=self.cancel_start,
+            state='disabled',
+        )
+        self.cancel_button.grid(row=0, column=4, padx=5, sticky='ew')
+
         row += 1
 
         self.status_var = tk.StringVar(value='Idle')
@@ -293,173 +386,125 @@ class WebmPlayerApp:
             self.playback_log_path_var.set(path)
 
     def set_status(self, text: str) -> None:
-        self.status_var.set(text)
-        if self.app_logger is not None:
-            self.app_logger.log(text)
+        if self.session is not None:
+            self.session.set_status(text)
+        else:
+            self.status_var.set(text)
+
+    def call_in_main(self, fn: Callable[..., Any], *args: Any) -> None:
+        if self.closing:
+            return
+        if threading.current_thread() is threading.main_thread():
+            fn(*args)
+        else:
+            try:
+                self.root.after(0, fn, *args)
+            except RuntimeError:
+                pass
+
+    def show_status(self, text: str) -> None:
+        self.call_in_main(self.status_var.set, text)
+
+    def show_progress(self, progress: ScanProgress) -> None:
+        self.call_in_main(
+            self.status_var.set,
+            f'Scanning: {progress.files} files found, {progress.dirs} directories '
+            f'({progress.dirs_per_second():.0f} dirs/s)',
+        )
 
     def start_playback(self) -> None:
-        if self.mpv_process is not None:
+        if self.start_thread is not None or (
+            self.session is not None and self.session.mpv_process is not None
+        ):
             messagebox.showwarning('Already running', 'mpv is already running.')
             return
 
-        if self.app_logger is not None:
-            self.app_logger.close()
-        if self.playback_logger is not None:
-            self.playback_logger.close()
+        if self.session is not None:
+            self.session.close()
 
         self.config = self.read_widgets_to_config()
         save_config(self.config)
 
-        directory = Path(self.config.directory).expanduser()
-        if not directory.is_dir():
-            messagebox.showerror('Error', f'"{directory}" is not a directory.')
-            return
-
-        playlist_path = Path(self.config.playlist_path).expanduser()
-
-        self.app_logger = FileLogger(
-            enabled=self.config.logging_enabled,
-            path=Path(self.config.logging_path).expanduser()
-            if self.config.logging_enabled
-            else None,
+        self.session = PlaybackSession(
+            self.config,
+            on_status=self.show_status,
+            on_exit=lambda code: self.call_in_main(self.on_mpv_exit),
+            on_ipc_ready=lambda: self.call_in_main(self.on_ipc_connected),
+            on_progress=self.show_progress,
         )
-        self.playback_logger = FileLogger(
-            enabled=self.config.playback_log_enabled,
-            path=Path(self.config.playback_log_path).expanduser()
-            if self.config.playback_log_enabled
-            else None,
+        self.start_button.configure(state='disabled')
+        self.cancel_button.configure(state='normal')
+        self.start_thread = threading.Thread(
+            target=self.run_start,
+            args=(self.session,),
+            name='playback-start',
+            daemon=True,
         )
+        self.start_thread.start()
 
-        if self.app_logger is not None:
-            self.app_logger.log(
-                f'Start playback with dir={directory}, '
-                f'recursive={self.config.recursive}, fullscreen={self.config.fullscreen}, '
-                f'loop={self.config.loop_playlist}, shuffle={self.config.shuffle}',
-            )
-
+    def run_start(self, session: PlaybackSession) -> None:
         try:
-            mpv_executable = find_mpv_executable(
-                self.config.mpv_path.strip() or None,
-            )
-        except FileNotFoundError as exc:
-            if self.app_logger is not None:
-                self.app_logger.log(str(exc))
-            messagebox.showerror('Error', str(exc))
-            return
-
-        self.set_status('Building playlist...')
-        self.root.update_idletasks()
-
-        try:
-            files_iter = iter_webm_files(directory, recursive=self.config.recursive)
-            count = write_playlist_file(
-                files_iter,
-                playlist_path,
-                logger=self.app_logger,
-            )
+            session.start()
+        except SessionCancelled:
+            self.call_in_main(self.on_start_finished, None, True)
+        except SessionError as exc:
+            self.call_in_main(self.on_start_finished, str(exc), False)
         except Exception as exc:
-            msg = f'Failed to write playlist: {exc}'
-            if self.app_logger is not None:
-                self.app_logger.log(msg)
-            messagebox.showerror('Error', msg)
+            self.call_in_main(self.on_start_finished, f'Unexpected error: {exc}', False)
+        else:
+            self.call_in_main(self.on_start_finished, None, False)
+
+    def on_start_finished(self, error: Optional[str], cancelled: bool) -> None:
+        self.start_thread = None
+        self.cancel_button.configure(state='disabled')
+        if cancelled:
+            self.start_button.configure(state='normal')
+            self.set_status('Cancelled')
             return
-
-        if count == 0:
-            messagebox.showerror('Error', 'No .webm files found.')
+        if error is not None:
+            self.start_button.configure(state='normal')
+            self.set_status('Idle')
+            messagebox.showerror('Error', error)
             return
+        if self.session is not None and self.session.mpv_process is not None:
+            self.stop_button.configure(state='normal')
 
-        cmd = build_mpv_command(
-            mpv_executable=mpv_executable,
-            playlist_path=playlist_path,
-            fullscreen=self.config.fullscreen,
-            loop_playlist=self.config.loop_playlist,
-            shuffle=self.config.shuffle,
-        )
+    def cancel_start(self) -> None:
+        if self.session is not None and self.start_thread is not None:
+            self.set_status('Cancelling...')
+            self.session.cancel()
 
-        if self.app_logger is not None:
-            self.app_logger.log(
-                f'Starting mpv: exe={mpv_executable}, playlist={playlist_path}, count={count}',
-            )
-
-        self.set_status(f'Starting mpv with {count} files...')
-        try:
-            self.mpv_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-            )
-        except Exception as exc:
-            msg = f'Failed to start mpv: {exc}'
-            if self.app_logger is not None:
-                self.app_logger.log(msg)
-            messagebox.showerror('Error', msg)
-            self.mpv_process = None
+    def on_ipc_connected(self) -> None:
+        if self.session is None or self.session.mpv_process is None:
             return
+        self.pause_button.configure(state='normal')
+        self.next_button.configure(state='normal')
 
-        self.start_button.configure(state='disabled')
-        self.stop_button.configure(state='normal')
+    def toggle_pause(self) -> None:
+        if self.session is not None:
+            self.session.toggle_pause()
 
-        self.mpv_thread = threading.Thread(
-            target=self.read_mpv_output,
-            daemon=True,
-        )
-        self.mpv_thread.start()
-        self.set_status('mpv running')
-
-    def read_mpv_output(self) -> None:
-        assert self.mpv_process is not None
-        proc = self.mpv_process
-        if proc.stdout is None:
-            return
-
-        for line in proc.stdout:
-            line = line.strip()
-            if not line:
-                continue
-
-            if 'error' in line.lower() or 'failed' in line.lower():
-                if self.app_logger is not None:
-                    self.app_logger.log(f'mpv: {line}')
-
-            if line.startswith('Playing: '):
-                path_str = line[len('Playing: ') :].strip()
-                if self.playback_logger is not None:
-                    self.playback_logger.log(path_str)
-
-        code = proc.wait()
-        if self.app_logger is not None:
-            self.app_logger.log(f'mpv exited with code {code}')
-        self.root.after(0, self.on_mpv_exit)
+    def skip_clip(self) -> None:
+        if self.session is not None:
+            self.session.skip()
 
     def on_mpv_exit(self) -> None:
-        self.mpv_process = None
+        if self.session is not None:
+            self.session.release(wait=False)
         self.start_button.configure(state='normal')
         self.stop_button.configure(state='disabled')
+        self.pause_button.configure(state='disabled')
+        self.next_button.configure(state='disabled')
         self.set_status('mpv exited')
 
     def stop_playback(self) -> None:
-        if self.mpv_process is None:
-            return
-        if self.app_logger is not None:
-            self.app_logger.log('Stop playback requested by user')
-        try:
-            self.mpv_process.terminate()
-        except Exception:
-            pass
+        if self.session is not None:
+            self.session.stop()
 
     def on_close(self) -> None:
-        if self.mpv_process is not None:
-            try:
-                self.mpv_process.terminate()
-            except Exception:
-                pass
-        if self.app_logger is not None:
-            self.app_logger.close()
-        if self.playback_logger is not None:
-            self.playback_logger.close()
+        self.closing = True
+        if self.session is not None:
+            self.session.close()
         self.root.destroy()
 
 
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import argparse
+import signal
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Optional, Sequence
+
+from randomvideoplayer.app_config import AppConfig, load_config, validate_changes
+from randomvideoplayer.orchestrator import Orchestrator
+from randomvideoplayer.session import PlaybackSession, SessionCancelled, SessionError
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='randomvideoplayer --headless',
+        description='Play a shuffled .webm library with mpv without opening the GUI.',
+    )
+    parser.add_argument('--dir', help='video directory (default: saved config)')
+    parser.add_argument(
+        '--root',
+        action='append',
+        metavar='PATH[=WEIGHT]',
+        help='library root with an optional shuffle weight; repeat for several roots',
+    )
+    parser.add_argument(
+        '--recursive',
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help='search subdirectories',
+    )
+    parser.add_argument('--mpv', help='path to the mpv executable')
+    parser.add_argument('--playlist', help='playlist file to write')
+    parser.add_argument(
+        '--extensions',
+        nargs='+',
+        metavar='EXT',
+        help='file extensions to include (default: saved config, .webm)',
+    )
+    parser.add_argument(
+        '--screens',
+        type=int,
+        help='run one mpv per screen, each with its own disjoint shuffle',
+    )
+    parser.add_argument(
+        '--supervise',
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help='restart mpv with backoff if it crashes',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='continue from the clip and position saved by the last run',
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        metavar='PORT',
+        help='serve Prometheus metrics on this local port',
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='write phase timings next to the app log',
+    )
+    parser.add_argument('--windowed', action='store_true', help='do not start fullscreen')
+    parser.add_argument('--no-loop', action='store_true', help='stop after the playlist ends')
+    parser.add_argument('--no-shuffle', action='store_true', help='play in scan order')
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='rescan the library even if the cached playlist is current',
+    )
+    parser.add_argument(
+        '--build-only',
+        action='store_true',
+        help='write the playlist and exit without starting mpv',
+    )
+    return parser
+
+
+def parse_root(value: str) -> dict[str, object]:
+    path, sep, weight = value.rpartition('=')
+    if sep:
+        try:
+            return {'path': path, 'weight': float(weight)}
+        except ValueError:
+            pass
+    return {'path': value}
+
+
+def apply_args(config: AppConfig, args: argparse.Namespace) -> AppConfig:
+    changes: dict[str, object] = {}
+    if args.dir is not None:
+        changes['directory'] = args.dir
+        changes['roots'] = []
+    if args.root:
+        changes['roots'] = [parse_root(value) for value in args.root]
+    if args.recursive is not None:
+        changes['recursive'] = args.recursive
+    if args.mpv is not None:
+        changes['mpv_path'] = args.mpv
+    if args.playlist is not None:
+        changes['playlist_path'] = args.playlist
+    if args.extensions is not None:
+        changes['extensions'] = args.extensions
+    if args.screens is not None:
+        changes['screens'] = args.screens
+    if args.supervise is not None:
+        changes['supervise'] = args.supervise
+    if args.resume:
+        changes['resume_on_start'] = True
+    if args.metrics_port is not None:
+        changes['metrics_enabled'] = True
+        changes['metrics_port'] = args.metrics_port
+    if args.profile:
+        changes['profiling_enabled'] = True
+    if args.windowed:
+        changes['fullscreen'] = False
+    if args.no_loop:
+        changes['loop_playlist'] = False
+    if args.no_shuffle:
+        changes['shuffle'] = False
+    if args.rebuild:
+        changes['playlist_cache_enabled'] = False
+    problems = validate_changes(changes)
+    if problems:
+        raise ValueError('; '.join(problems))
+    return replace(config, **changes)
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    return ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in timings.items())
+
+
+def report(session: PlaybackSession, timings: dict[str, float]) -> None:
+    session.set_status(f'Startup: {format_timings(timings)}')
+
+
+def build_only(session: PlaybackSession, timings: dict[str, float]) -> int:
+    session.open_loggers()
+    try:
+        roots = session.resolve_roots()
+    except SessionError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    session.profiler.start()
+    started = time.perf_counter()
+    with session.profiler.phase('build_playlist'):
+        table = session.build_table(roots)
+        count = session.write_playlist(
+            table,
+            Path(session.config.playlist_path).expanduser(),
+        )
+    timings['build_playlist'] = time.perf_counter() - started
+    print(f'Wrote {count} entries to {session.config.playlist_path}', file=sys.stderr)
+    return 0 if count else 1
+
+
+def run_screens(
+    session: PlaybackSession,
+    timings: dict[str, float],
+    started: float,
+) -> int:
+    orchestrator = Orchestrator(session, session.config.screens)
+
+    def handle_signal(signum: int, frame: object) -> None:
+        session.cancel()
+        orchestrator.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        try:
+            orchestrator.start()
+        except SessionCancelled:
+            return 130
+        except SessionError as exc:
+            print(f'Error: {exc}', file=sys.stderr)
+            return 1
+        timings['total'] = time.perf_counter() - started
+        report(session, timings)
+        while not orchestrator.wait(timeout=0.5):
+            pass
+        return 0
+    finally:
+        orchestrator.close()
+
+
+def main(argv: Optional[Sequence[str]] = None, started: Optional[float] = None) -> int:
+    if started is None:
+        started = time.perf_counter()
+    timings: dict[str, float] = {'imports': time.perf_counter() - started}
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    mark = time.perf_counter()
+    problems: list[str] = []
+    try:
+        config = apply_args(load_config(problems), args)
+    except ValueError as exc:
+        parser.error(str(exc))
+    timings['config'] = time.perf_counter() - mark
+    for problem in problems:
+        print(f'Config: {problem}', file=sys.stderr)
+
+    session = PlaybackSession(
+        config,
+        on_status=lambda text: print(text, file=sys.stderr),
+    )
+
+    if args.build_only:
+        try:
+            code = build_only(session, timings)
+            timings['total'] = time.perf_counter() - started
+            report(session, timings)
+        finally:
+            session.close()
+        return code
+
+    if config.screens > 1:
+        return run_screens(session, timings, started)
+
+    def handle_signal(signum: int, frame: object) -> None:
+        session.cancel()
+        session.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        try:
+            session.start()
+        except SessionCancelled:
+            return 130
+        except SessionError as exc:
+            print(f'Error: {exc}', file=sys.stderr)
+            return 1
+        timings.update(session.timings)
+        timings['total'] = time.perf_counter() - started
+        report(session, timings)
+        exit_code: Optional[int] = None
+        # Short waits keep the main thread responsive to signals on Windows.
+        while exit_code is None:
+            exit_code = session.wait(timeout=0.5)
+        return exit_code
+    finally:
+        session.close()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable, NamedTuple, Optional
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.mpv_ipc import MpvIpcClient
+
+SCHEMA_VERSION = 1
+
+# Rotation deletes by rowid range, so it only runs every few hundred plays.
+ROTATE_EVERY = 500
+
+# A clip stopped this close to its end counts as watched, not skipped.
+SKIP_TOLERANCE_SECS = 1.0
+
+_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS paths (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS plays (
+        id INTEGER PRIMARY KEY,
+        path_id INTEGER NOT NULL,
+        started REAL NOT NULL,
+        ended REAL NOT NULL,
+        watched REAL NOT NULL,
+        duration REAL,
+        skipped INTEGER NOT NULL,
+        reason TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS path_stats (
+        path_id INTEGER PRIMARY KEY,
+        play_count INTEGER NOT NULL,
+        skip_count INTEGER NOT NULL,
+        watched_total REAL NOT NULL,
+        last_played REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS plays_path ON plays (path_id, started)',
+    'CREATE INDEX IF NOT EXISTS stats_last_played ON path_stats (last_played)',
+    'CREATE INDEX IF NOT EXISTS stats_play_count ON path_stats (play_count)',
+)
+
+
+class PlayRecord(NamedTuple):
+    path: str
+    started: float
+    ended: float
+    watched: float
+    duration: Optional[float]
+    skipped: bool
+    reason: Optional[str]
+
+
+class PlaybackHistory:
+    def __init__(self, path: Path, max_rows: int = 0) -> None:
+        self.path = path
+        self.max_rows = max(0, max_rows)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(path),
+            check_same_thread=False,
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        for statement in _SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+        self.inserts = 0
+
+    def _path_id(self, conn: sqlite3.Connection, path: str) -> int:
+        row = conn.execute('SELECT id FROM paths WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            return row[0]
+        cursor = conn.execute('INSERT INTO paths (path) VALUES (?)', (path,))
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def record(self, record: PlayRecord) -> None:
+        with self.lock:
+            conn = self.conn
+            if conn is None:
+                return
+            path_id = self._path_id(conn, record.path)
+            conn.execute(
+                'INSERT INTO plays (path_id, started, ended, watched, duration, skipped, reason) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    path_id,
+                    record.started,
+                    record.ended,
+                    record.watched,
+                    record.duration,
+                    int(record.skipped),
+                    record.reason,
+                ),
+            )
+            conn.execute(
+                'INSERT INTO path_stats (path_id, play_count, skip_count, watched_total, last_played) '
+                'VALUES (?, 1, ?, ?, ?) '
+                'ON CONFLICT (path_id) DO UPDATE SET '
+                'play_count = play_count + 1, '
+                'skip_count = skip_count + excluded.skip_count, '
+                'watched_total = watched_total + excluded.watched_total, '
+                'last_played = max(last_played, excluded.last_played)',
+                (path_id, int(record.skipped), record.watched, record.started),
+            )
+            self.inserts += 1
+            if self.max_rows and self.inserts % ROTATE_EVERY == 0:
+                self._rotate(conn)
+            conn.commit()
+
+    def _rotate(self, conn: sqlite3.Connection) -> None:
+        # Play ids only grow, so the oldest rows form a contiguous id range.
+        newest = conn.execute('SELECT max(id) FROM plays').fetchone()[0]
+        if newest is not None and newest > self.max_rows:
+            conn.execute('DELETE FROM plays WHERE id <= ?', (newest - self.max_rows,))
+
+    def recent(self, limit: int = 50) -> list[PlayRecord]:
+        with self.lock:
+            if self.conn is None:
+                return []
+            rows = self.conn.execute(
+                'SELECT paths.path, started, ended, watched, duration, skipped, reason '
+                'FROM plays JOIN paths ON paths.id = plays.path_id '
+                'ORDER BY plays.id DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+        return [
+            PlayRecord(path, started, ended, watched, duration, bool(skipped), reason)
+            for path, started, ended, watched, duration, skipped, reason in rows
+        ]
+
+    def recent_paths(self, limit: int) -> list[str]:
+        with self.lock:
+            if self.conn is None:
+                return []
+            rows = self.conn.execute(
+                'SELECT paths.path FROM path_stats '
+                'JOIN paths ON paths.id = path_stats.path_id '
+                'ORDER BY last_played DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def play_counts(self, paths: Iterable[str]) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        with self.lock:
+            if self.conn is None:
+                return counts
+            for path in paths:
+                row = self.conn.execute(
+                    'SELECT play_count FROM path_stats '
+                    'JOIN paths ON paths.id = path_stats.path_id WHERE paths.path = ?',
+                    (path,),
+                ).fetchone()
+                if row is not None:
+                    counts[path] = row[0]
+        return counts
+
+    def most_played(self, limit: int = 50) -> list[tuple[str, int]]:
+        with self.lock:
+            if self.conn is None:
+                return []
+            return self.conn.execute(
+                'SELECT paths.path, play_count FROM path_stats '
+                'JOIN paths ON paths.id = path_stats.path_id '
+                'ORDER BY play_count DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+
+
+class PlaybackTracker:
+    def __init__(
+        self,
+        history: PlaybackHistory,
+        logger: Optional[FileLogger] = None,
+    ) -> None:
+        self.history = history
+        self.logger = logger
+        self.lock = Lock()
+        self.path: Optional[str] = None
+        self.started = 0.0
+        self.paused_at: Optional[float] = None
+        self.paused_total = 0.0
+        self.duration: Optional[float] = None
+
+    def attach(self, client: MpvIpcClient) -> None:
+        client.add_event_handler('end-file', self.on_end_file)
+        client.observe_property('duration', self.on_duration)
+        client.observe_property('pause', self.on_pause)
+
+    def on_path(self, value: str) -> None:
+        now = time.time()
+        with self.lock:
+            self._finish(now, None)
+            self.path = value
+            self.started = now
+            self.paused_total = 0.0
+            self.paused_at = now if self.paused_at is not None else None
+            self.duration = None
+
+    def on_duration(self, name: str, value: Any) -> None:
+        if isinstance(value, (int, float)):
+            with self.lock:
+                self.duration = float(value)
+
+    def on_pause(self, name: str, value: Any) -> None:
+        now = time.time()
+        with self.lock:
+            if value and self.paused_at is None:
+                self.paused_at = now
+            elif not value and self.paused_at is not None:
+                self.paused_total += now - self.paused_at
+                self.paused_at = None
+
+    def on_end_file(self, event: dict[str, Any]) -> None:
+        with self.lock:
+            self._finish(time.time(), event.get('reason'))
+
+    def close(self) -> None:
+        with self.lock:
+            self._finish(time.time(), 'quit')
+
+    def _finish(self, now: float, reason: Optional[str]) -> None:
+        if self.path is None:
+            return
+        paused = self.paused_total
+        if self.paused_at is not None:
+            paused += now - self.paused_at
+        watched = max(0.0, now - self.started - paused)
+        if self.duration is not None:
+            watched = min(watched, self.duration)
+        skipped = reason == 'stop' and (
+            self.duration is None or watched < self.duration - SKIP_TOLERANCE_SECS
+        )
+        record = PlayRecord(
+            self.path,
+            self.started,
+            now,
+            watched,
+            self.duration,
+            skipped,
+            reason,
+        )
+        self.path = None
+        try:
+            self.history.record(record)
+        except sqlite3.Error as exc:
+            if self.logger is not None:
+                self.logger.log(f'Playback history write failed: {exc}')
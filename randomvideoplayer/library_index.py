@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Iterator, Optional
+
+from randomvideoplayer.scanner import Listing, list_directory, walk_directories
+
+SEPARATOR = '\0'
+
+# Directories modified this recently may change again within the same
+# mtime tick (FAT/SMB only have 2 second resolution), so they are not trusted.
+MTIME_SETTLE_NS = 2_000_000_000
+
+SCHEMA_VERSION = 2
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    files TEXT NOT NULL,
+    links TEXT NOT NULL
+) WITHOUT ROWID
+'''
+
+
+def _split(value: str) -> list[str]:
+    return value.split(SEPARATOR) if value else []
+
+
+class LibraryIndex:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(path),
+            check_same_thread=False,
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS dirs')
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+        self.dirs_listed = 0
+        self.dirs_cached = 0
+
+    def walk(
+        self,
+        directory: Path,
+        recursive: bool,
+        workers: int = 1,
+        follow_symlinks: bool = False,
+    ) -> Iterator[tuple[str, list[str]]]:
+        if self.conn is None:
+            raise RuntimeError('Library index is closed')
+        try:
+            yield from walk_directories(
+                os.path.realpath(directory),
+                recursive,
+                workers,
+                self.list_directory,
+                follow_symlinks,
+            )
+        finally:
+            with self.lock:
+                if self.conn is not None:
+                    self.conn.commit()
+
+    def list_directory(self, path: str) -> Optional[Listing]:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self.lock:
+            assert self.conn is not None
+            row = self.conn.execute(
+                'SELECT mtime_ns, subdirs, files, links FROM dirs WHERE path = ?',
+                (path,),
+            ).fetchone()
+            if row is not None and row[0] == mtime_ns:
+                self.dirs_cached += 1
+                return _split(row[1]), _split(row[2]), _split(row[3])
+
+        listing = list_directory(path)
+        if listing is None:
+            return None
+        subdirs, files, links = listing
+
+        if time.time_ns() - mtime_ns < MTIME_SETTLE_NS:
+            mtime_ns = -1
+        with self.lock:
+            assert self.conn is not None
+            self.dirs_listed += 1
+            if row is not None:
+                for name in set(_split(row[1])) - set(subdirs):
+                    self._forget_tree(os.path.join(path, name))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs, files, links) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (
+                    path,
+                    mtime_ns,
+                    SEPARATOR.join(subdirs),
+                    SEPARATOR.join(files),
+                    SEPARATOR.join(links),
+                ),
+            )
+        return listing
+
+    def directories(self, root: str, recursive: bool) -> list[str]:
+        with self.lock:
+            if self.conn is None:
+                raise RuntimeError('Library index is closed')
+            if not recursive:
+                rows = self.conn.execute('SELECT path FROM dirs WHERE path = ?', (root,))
+            else:
+                prefix = root.rstrip(os.sep) + os.sep
+                upper = root.rstrip(os.sep) + chr(ord(os.sep) + 1)
+                rows = self.conn.execute(
+                    'SELECT path FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                    (root, prefix, upper),
+                )
+            return [row[0] for row in rows]
+
+    def _forget_tree(self, path: str) -> None:
+        assert self.conn is not None
+        prefix = path + os.sep
+        upper = path + chr(ord(os.sep) + 1)
+        self.conn.execute(
+            'DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+            (path, prefix, upper),
+        )
+
+    def clear(self) -> None:
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.execute('DELETE FROM dirs')
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional
+
+PROBE_BYTES = 64 * 1024
+PROBE_CHUNK_SIZE = 64
+# Scans collect probe jobs across directories up to this many before
+# handing them to the process pool.
+PROBE_BATCH_SIZE = 512
+
+EBML_HEADER = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+TRACK_VIDEO = 1
+TRACK_AUDIO = 2
+
+UNKNOWN_SIZE = -1
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    video_codec TEXT,
+    audio_codec TEXT,
+    doc_type TEXT
+) WITHOUT ROWID
+'''
+
+
+class MediaInfo(NamedTuple):
+    duration: Optional[float]
+    width: Optional[int]
+    height: Optional[int]
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    doc_type: Optional[str]
+
+
+class EbmlError(Exception):
+    pass
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> tuple[int, int]:
+    if pos >= len(data):
+        raise EbmlError('Truncated element')
+    first = data[pos]
+    if first == 0:
+        raise EbmlError('Invalid variable-length integer')
+    length = 8 - first.bit_length() + 1
+    if pos + length > len(data):
+        raise EbmlError('Truncated element')
+    value = first if keep_marker else first & (0xFF >> length)
+    all_ones = value == (0xFF >> length)
+    for byte in data[pos + 1 : pos + length]:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return UNKNOWN_SIZE, pos + length
+    return value, pos + length
+
+
+def iter_elements(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[tuple[int, int, int]]:
+    pos = start
+    end = len(data) if end is None else min(end, len(data))
+    while pos < end:
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        size, pos = _read_vint(data, pos, keep_marker=False)
+        yield element_id, pos, size
+        if size == UNKNOWN_SIZE:
+            return
+        pos += size
+
+
+def _uint(data: bytes, pos: int, size: int) -> int:
+    return int.from_bytes(data[pos : pos + size], 'big')
+
+
+def _float(data: bytes, pos: int, size: int) -> Optional[float]:
+    if size == 4:
+        return struct.unpack('>f', data[pos : pos + 4])[0]
+    if size == 8:
+        return struct.unpack('>d', data[pos : pos + 8])[0]
+    return None
+
+
+def _text(data: bytes, pos: int, size: int) -> str:
+    return data[pos : pos + size].rstrip(b'\0').decode('ascii', 'replace')
+
+
+class _Probe:
+    def __init__(self) -> None:
+        self.doc_type: Optional[str] = None
+        self.timecode_scale = 1_000_000
+        self.raw_duration: Optional[float] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.video_codec: Optional[str] = None
+        self.audio_codec: Optional[str] = None
+        self.seen_info = False
+        self.seen_tracks = False
+
+    def info(self) -> MediaInfo:
+        duration = None
+        if self.raw_duration is not None:
+            duration = self.raw_duration * self.timecode_scale / 1e9
+        return MediaInfo(
+            duration,
+            self.width,
+            self.height,
+            self.video_codec,
+            self.audio_codec,
+            self.doc_type,
+        )
+
+    # The seen flags are only set once an element parsed cleanly, so a
+    # damaged copy still lets the SeekHead pointer be tried.
+    def parse_info(self, data: bytes, start: int, end: int) -> None:
+        for element_id, pos, size in iter_elements(data, start, end):
+            if element_id == TIMECODE_SCALE:
+                self.timecode_scale = _uint(data, pos, size) or 1_000_000
+            elif element_id == DURATION:
+                self.raw_duration = _float(data, pos, size)
+        self.seen_info = True
+
+    def parse_tracks(self, data: bytes, start: int, end: int) -> None:
+        for element_id, pos, size in iter_elements(data, start, end):
+            if element_id == TRACK_ENTRY:
+                self.parse_track(data, pos, pos + size)
+        self.seen_tracks = True
+
+    def parse_track(self, data: bytes, start: int, end: int) -> None:
+        track_type = 0
+        codec: Optional[str] = None
+        width: Optional[int] = None
+        height: Optional[int] = None
+        for element_id, pos, size in iter_elements(data, start, end):
+            if element_id == TRACK_TYPE:
+                track_type = _uint(data, pos, size)
+            elif element_id == CODEC_ID:
+                codec = _text(data, pos, size)
+            elif element_id == VIDEO:
+                for child_id, child_pos, child_size in iter_elements(data, pos, pos + size):
+                    if child_id == PIXEL_WIDTH:
+                        width = _uint(data, child_pos, child_size)
+                    elif child_id == PIXEL_HEIGHT:
+                        height = _uint(data, child_pos, child_size)
+        if track_type == TRACK_VIDEO and self.video_codec is None:
+            self.video_codec = codec
+            self.width = width
+            self.height = height
+        elif track_type == TRACK_AUDIO and self.audio_codec is None:
+            self.audio_codec = codec
+
+
+def _read_at(f: BinaryIO, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+def read_media_info(path: str, probe_bytes: int = PROBE_BYTES) -> MediaInfo:
+    with open(path, 'rb') as f:
+        data = f.read(probe_bytes)
+        probe = _Probe()
+        elements = iter_elements(data)
+        element_id, pos, size = next(elements)
+        if element_id != EBML_HEADER:
+            raise EbmlError('Not an EBML file')
+        for child_id, child_pos, child_size in iter_elements(data, pos, pos + size):
+            if child_id == DOC_TYPE:
+                probe.doc_type = _text(data, child_pos, child_size)
+
+        element_id, segment_start, segment_size = next(elements)
+        if element_id != SEGMENT:
+            raise EbmlError('Missing segment')
+        seeks: dict[int, int] = {}
+        try:
+            for element_id, pos, size in iter_elements(data, segment_start):
+                end = pos + size
+                if element_id == CLUSTER or size == UNKNOWN_SIZE or end > len(data):
+                    break
+                if element_id == SEEK_HEAD:
+                    for seek_id, seek_pos, seek_size in iter_elements(data, pos, end):
+                        if seek_id == SEEK:
+                            target = position = None
+                            for child_id, child_pos, child_size in iter_elements(data, seek_pos, seek_pos + seek_size):
+                                if child_id == SEEK_ID:
+                                    target = _uint(data, child_pos, child_size)
+                                elif child_id == SEEK_POSITION:
+                                    position = _uint(data, child_pos, child_size)
+                            if target is not None and position is not None:
+                                seeks[target] = position
+                elif element_id == INFO:
+                    probe.parse_info(data, pos, end)
+                elif element_id == TRACKS:
+                    probe.parse_tracks(data, pos, end)
+                if probe.seen_info and probe.seen_tracks:
+                    break
+        except EbmlError:
+            pass
+
+        # Muxers that write Tracks after a large Void or attachments leave a
+        # SeekHead pointer; follow it with one extra bounded read.
+        for element_id, parse in ((INFO, probe.parse_info), (TRACKS, probe.parse_tracks)):
+            seen = probe.seen_info if element_id == INFO else probe.seen_tracks
+            if seen or element_id not in seeks:
+                continue
+            chunk = _read_at(f, segment_start + seeks[element_id], probe_bytes)
+            try:
+                found_id, pos, size = next(iter_elements(chunk))
+                if found_id == element_id and size != UNKNOWN_SIZE:
+                    parse(chunk, pos, pos + size)
+            except (EbmlError, StopIteration):
+                continue
+        return probe.info()
+
+
+def _probe_one(args: tuple[str, int]) -> Optional[MediaInfo]:
+    path, probe_bytes = args
+    try:
+        return read_media_info(path, probe_bytes)
+    except (OSError, EbmlError, StopIteration, struct.error):
+        return None
+
+
+class MetadataCache:
+    def __init__(self, path: Path, workers: int = 0) -> None:
+        self.path = path
+        self.workers = workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pool_workers = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(path),
+            check_same_thread=False,
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS probes')
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+        self.hits = 0
+        self.probed = 0
+
+    def get(self, path: str, size: int, mtime_ns: int) -> tuple[bool, Optional[MediaInfo]]:
+        with self.lock:
+            if self.conn is None:
+                return False, None
+            row = self.conn.execute(
+                'SELECT size, mtime_ns, ok, duration, width, height, video_codec, '
+                'audio_codec, doc_type FROM probes WHERE path = ?',
+                (path,),
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return False, None
+        return True, MediaInfo(*row[3:]) if row[2] else None
+
+    def put_many(self, rows: Iterable[tuple[str, int, int, Optional[MediaInfo]]]) -> None:
+        values = [
+            (path, size, mtime_ns, 1, *info) if info is not None
+            else (path, size, mtime_ns, 0, None, None, None, None, None, None)
+            for path, size, mtime_ns, info in rows
+        ]
+        with self.lock:
+            if self.conn is None or not values:
+                return
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                values,
+            )
+            self.conn.commit()
+
+    def probe_many(
+        self,
+        paths: Iterable[str],
+        probe_bytes: int = PROBE_BYTES,
+    ) -> dict[str, Optional[MediaInfo]]:
+        results: dict[str, Optional[MediaInfo]] = {}
+        missing: list[tuple[str, int, int]] = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            hit, info = self.get(path, st.st_size, st.st_mtime_ns)
+            if hit:
+                results[path] = info
+                self.hits += 1
+            else:
+                missing.append((path, st.st_size, st.st_mtime_ns))
+        if not missing:
+            return results
+
+        jobs = [(path, probe_bytes) for path, _, _ in missing]
+        if self.workers > 1 and len(jobs) > PROBE_CHUNK_SIZE:
+            chunksize = max(1, min(PROBE_CHUNK_SIZE, len(jobs) // (self.workers * 4)))
+            probed = list(self._get_pool().map(_probe_one, jobs, chunksize=chunksize))
+        else:
+            probed = [_probe_one(job) for job in jobs]
+        self.probed += len(probed)
+
+        rows = []
+        for (path, size, mtime_ns), info in zip(missing, probed):
+            results[path] = info
+            rows.append((path, size, mtime_ns, info))
+        self.put_many(rows)
+        return results
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # The pool outlives single calls so that scans do not pay process
+        # startup for every batch; several root scans may ask at once.
+        with self.lock:
+            if self.pool is None or self.pool_workers != self.workers:
+                if self.pool is not None:
+                    self.pool.shutdown(wait=False)
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                self.pool_workers = self.workers
+            return self.pool
+
+    def close(self) -> None:
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
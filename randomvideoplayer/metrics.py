@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+PREFIX = 'randomvideoplayer_'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(labels: dict[str, str], extra: str = '') -> str:
+    parts = [f'{key}="{value}"' for key, value in labels.items()]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return f'{value:g}' if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help_text: str, labels: dict[str, str]) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def snapshot(self) -> Any:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help_text: str, labels: dict[str, str]) -> None:
+        super().__init__(registry, name, help_text, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        yield self.name, _format_labels(self.labels), self.value
+
+    def snapshot(self) -> Any:
+        return self.value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help_text: str, labels: dict[str, str]) -> None:
+        super().__init__(registry, name, help_text, labels)
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        if not self.registry.enabled:
+            return
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def set_function(self, function: Optional[Callable[[], float]]) -> None:
+        # Evaluated only when metrics are collected, so hot paths pay nothing.
+        self.function = function
+
+    def current(self) -> float:
+        function = self.function
+        if function is None:
+            return self.value
+        try:
+            return float(function())
+        except Exception:
+            return math.nan
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        yield self.name, _format_labels(self.labels), self.current()
+
+    def snapshot(self) -> Any:
+        return self.current()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        help_text: str,
+        labels: dict[str, str],
+        buckets: Sequence[float],
+    ) -> None:
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        if not self.registry.enabled:
+            return
+        slot = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+            total = self.sum
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            yield f'{self.name}_bucket', _format_labels(self.labels, le), cumulative
+        yield f'{self.name}_sum', _format_labels(self.labels), total
+        yield f'{self.name}_count', _format_labels(self.labels), count
+
+    def snapshot(self) -> Any:
+        with self.lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'buckets': dict(zip([_format_value(b) for b in self.buckets + (math.inf,)], self.counts)),
+            }
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+        self.started = 0.0
+
+    def __enter__(self) -> _Timer:
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.metrics: dict[tuple[str, tuple[tuple[str, str], ...]], Metric] = {}
+
+    def _get(self, cls: type, name: str, help_text: str, labels: Optional[dict[str, str]], **kwargs: Any) -> Any:
+        labels = labels or {}
+        key = (PREFIX + name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = cls(self, PREFIX + name, help_text, labels, **kwargs)
+                self.metrics[key] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as {metric.kind}')
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Optional[dict[str, str]] = None) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Optional[dict[str, str]] = None) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        labels: Optional[dict[str, str]] = None,
+    ) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def _sorted(self) -> list[Metric]:
+        with self.lock:
+            return sorted(self.metrics.values(), key=lambda m: (m.name, sorted(m.labels.items())))
+
+    def render_prometheus(self) -> str:
+        lines: list[str] = []
+        last_name = ''
+        for metric in self._sorted():
+            if metric.name != last_name:
+                lines.append(f'# HELP {metric.name} {metric.help_text}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                last_name = metric.name
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        for metric in self._sorted():
+            key = metric.name + _format_labels(metric.labels)
+            result[key] = metric.snapshot()
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help_text: str, labels: Optional[dict[str, str]] = None) -> Counter:
+    return REGISTRY.counter(name, help_text, labels)
+
+
+def gauge(name: str, help_text: str, labels: Optional[dict[str, str]] = None) -> Gauge:
+    return REGISTRY.gauge(name, help_text, labels)
+
+
+def histogram(
+    name: str,
+    help_text: str,
+    buckets: Sequence[float] = LATENCY_BUCKETS,
+    labels: Optional[dict[str, str]] = None,
+) -> Histogram:
+    return REGISTRY.histogram(name, help_text, buckets, labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class MetricsExporter:
+    def __init__(
+        self,
+        registry: MetricsRegistry = REGISTRY,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        json_path: Optional[Path] = None,
+        interval: float = 10.0,
+    ) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.json_path = json_path
+        self.interval = max(0.5, interval)
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.stop_event = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        self.registry.enabled = True
+        if self.port > 0:
+            handler = type('MetricsHandler', (_MetricsHandler,), {'registry': self.registry})
+            self.server = ThreadingHTTPServer((self.host, self.port), handler)
+            self.server.daemon_threads = True
+            self._spawn(self.server.serve_forever, 'metrics-http')
+        if self.json_path is not None:
+            self._spawn(self._dump_loop, 'metrics-json')
+
+    def _spawn(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def dump(self) -> None:
+        if self.json_path is None:
+            return
+        self.json_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.json_path.with_name(self.json_path.name + '.tmp')
+        data = {'time': time.time(), 'metrics': self.registry.snapshot()}
+        tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+        os.replace(tmp_path, self.json_path)
+
+    def _dump_loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.dump()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.registry.enabled = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.threads:
+            thread.join(timeout=5.0)
+        self.threads.clear()
+        try:
+            self.dump()
+        except OSError:
+            pass
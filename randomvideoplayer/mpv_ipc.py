@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import platform
+import secrets
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.metrics import counter, histogram
+
+PropertyCallback = Callable[[str, Any], None]
+EventCallback = Callable[[dict[str, Any]], None]
+
+
+IPC_MESSAGES = counter('ipc_messages_total', 'Messages received from mpv IPC')
+IPC_COMMAND_SECONDS = histogram('ipc_command_seconds', 'Round trip of mpv IPC commands')
+
+
+class MpvIpcError(Exception):
+    pass
+
+
+def make_ipc_address() -> str:
+    name = f'randomvideoplayer-{os.getpid()}-{secrets.token_hex(4)}'
+    if platform.system() == 'Windows':
+        return rf'\\.\pipe\{name}'
+    return os.path.join(tempfile.gettempdir(), f'{name}.sock')
+
+
+class _SocketTransport:
+    def __init__(self, address: str) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(address)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def recv(self, size: int) -> bytes:
+        return self.sock.recv(size)
+
+    def send(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class _PipeTransport:
+    # Overlapped I/O lets the reader thread block in ReadFile while other
+    # threads write to the same pipe handle.
+    def __init__(self, address: str) -> None:
+        import _winapi
+
+        self.winapi = _winapi
+        self.handle = _winapi.CreateFile(
+            address,
+            _winapi.GENERIC_READ | _winapi.GENERIC_WRITE,
+            0,
+            _winapi.NULL,
+            _winapi.OPEN_EXISTING,
+            _winapi.FILE_FLAG_OVERLAPPED,
+            _winapi.NULL,
+        )
+
+    def _wait(self, ov: Any, err: int) -> int:
+        winapi = self.winapi
+        try:
+            if err == winapi.ERROR_IO_PENDING:
+                winapi.WaitForMultipleObjects([ov.event], False, winapi.INFINITE)
+        except BaseException:
+            ov.cancel()
+            raise
+        finally:
+            transferred, err = ov.GetOverlappedResult(True)
+        return transferred
+
+    def recv(self, size: int) -> bytes:
+        try:
+            ov, err = self.winapi.ReadFile(self.handle, size, overlapped=True)
+            self._wait(ov, err)
+        except OSError:
+            return b''
+        return bytes(ov.getbuffer())
+
+    def send(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            ov, err = self.winapi.WriteFile(self.handle, view, overlapped=True)
+            view = view[self._wait(ov, err) :]
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.winapi.CloseHandle(self.handle)
+            self.handle = None
+
+
+class MpvIpcClient:
+    def __init__(self, address: str, logger: Optional[FileLogger] = None) -> None:
+        self.address = address
+        self.logger = logger
+        self.transport: Optional[_SocketTransport | _PipeTransport] = None
+        self.reader_thread: Optional[threading.Thread] = None
+        self.send_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending: dict[int, list[Any]] = {}
+        self.request_ids = itertools.count(1)
+        self.observer_ids = itertools.count(1)
+        self.handlers_lock = threading.Lock()
+        self.property_callbacks: dict[int, tuple[str, PropertyCallback]] = {}
+        self.event_callbacks: dict[str, list[EventCallback]] = {}
+        self.connected = False
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def connect(
+        self,
+        timeout: float = 10.0,
+        alive: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if platform.system() == 'Windows':
+                    self.transport = _PipeTransport(self.address)
+                else:
+                    self.transport = _SocketTransport(self.address)
+                break
+            except OSError as exc:
+                if time.monotonic() >= deadline or (alive is not None and not alive()):
+                    raise MpvIpcError(
+                        f'Could not connect to mpv IPC at "{self.address}": {exc}',
+                    ) from exc
+                time.sleep(0.05)
+        self.connected = True
+        self.reader_thread = threading.Thread(
+            target=self._read_loop,
+            name='mpv-ipc-reader',
+            daemon=True,
+        )
+        self.reader_thread.start()
+
+    def command(self, *args: Any, timeout: float = 5.0) -> Any:
+        started = time.perf_counter()
+        request_id = next(self.request_ids)
+        done = threading.Event()
+        slot: list[Any] = [done, None]
+        with self.pending_lock:
+            self.pending[request_id] = slot
+        try:
+            self._send({'command': list(args), 'request_id': request_id})
+            if not done.wait(timeout):
+                raise MpvIpcError(f'Timed out waiting for mpv reply to {args[0]!r}')
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+        IPC_COMMAND_SECONDS.observe(time.perf_counter() - started)
+        reply = slot[1]
+        if reply is None:
+            raise MpvIpcError('mpv IPC connection closed')
+        if reply.get('error') != 'success':
+            raise MpvIpcError(f'mpv command {args[0]!r} failed: {reply.get("error")}')
+        return reply.get('data')
+
+    def command_nowait(self, *args: Any) -> None:
+        self._send({'command': list(args)})
+
+    def get_property(self, name: str, timeout: float = 5.0) -> Any:
+        return self.command('get_property', name, timeout=timeout)
+
+    def set_property(self, name: str, value: Any) -> None:
+        self.command('set_property', name, value)
+
+    def observe_property(self, name: str, callback: PropertyCallback) -> int:
+        observer_id = next(self.observer_ids)
+        with self.handlers_lock:
+            self.property_callbacks[observer_id] = (name, callback)
+        try:
+            self.command('observe_property', observer_id, name)
+        except MpvIpcError:
+            with self.handlers_lock:
+                self.property_callbacks.pop(observer_id, None)
+            raise
+        return observer_id
+
+    def unobserve_property(self, observer_id: int) -> None:
+        with self.handlers_lock:
+            self.property_callbacks.pop(observer_id, None)
+        self.command('unobserve_property', observer_id)
+
+    def add_event_handler(self, event: str, callback: EventCallback) -> None:
+        with self.handlers_lock:
+            self.event_callbacks.setdefault(event, []).append(callback)
+
+    def remove_event_handler(self, event: str, callback: EventCallback) -> None:
+        with self.handlers_lock:
+            callbacks = self.event_callbacks.get(event, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def request_log_messages(self, level: str) -> None:
+        self.command('request_log_messages', level)
+
+    def skip(self) -> None:
+        self.command('playlist-next', 'force')
+
+    def previous(self) -> None:
+        self.command('playlist-prev', 'force')
+
+    def pause(self) -> None:
+        self.set_property('pause', True)
+
+    def resume(self) -> None:
+        self.set_property('pause', False)
+
+    def toggle_pause(self) -> None:
+        self.command('cycle', 'pause')
+
+    def enqueue(self, path: str, play_next: bool = False) -> None:
+        self.command('loadfile', path, 'insert-next' if play_next else 'append')
+
+    def quit(self) -> None:
+        self.command_nowait('quit')
+
+    def _send(self, message: dict[str, Any]) -> None:
+        if self.transport is None or not self.connected:
+            raise MpvIpcError('mpv IPC is not connected')
+        data = json.dumps(message).encode('utf-8') + b'\n'
+        try:
+            with self.send_lock:
+                self.transport.send(data)
+        except OSError as exc:
+            raise MpvIpcError(f'Failed to send to mpv IPC: {exc}') from exc
+
+    def _read_loop(self) -> None:
+        assert self.transport is not None
+        buffer = b''
+        try:
+            while True:
+                try:
+                    chunk = self.transport.recv(65536)
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if line:
+                        self._dispatch(line)
+        finally:
+            self.connected = False
+            with self.pending_lock:
+                slots = list(self.pending.values())
+            for slot in slots:
+                slot[0].set()
+
+    def _dispatch(self, line: bytes) -> None:
+        IPC_MESSAGES.inc()
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        event = message.get('event')
+        if event is not None:
+            self._dispatch_event(event, message)
+            return
+        request_id = message.get('request_id')
+        if request_id:
+            with self.pending_lock:
+                slot = self.pending.get(request_id)
+            if slot is not None:
+                slot[1] = message
+                slot[0].set()
+
+    def _dispatch_event(self, event: str, message: dict[str, Any]) -> None:
+        with self.handlers_lock:
+            if event == 'property-change':
+                entry = self.property_callbacks.get(message.get('id', 0))
+                callbacks = []
+            else:
+                entry = None
+                callbacks = list(self.event_callbacks.get(event, ()))
+        # A failing handler must not stop the reader thread, but it is
+        # logged so that a broken observer does not go unnoticed.
+        if entry is not None:
+            try:
+                entry[1](entry[0], message.get('data'))
+            except Exception as exc:
+                self._log(f'mpv IPC handler for "{entry[0]}" failed: {exc!r}')
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as exc:
+                self._log(f'mpv IPC handler for "{event}" failed: {exc!r}')
+
+    def close(self) -> None:
+        self.connected = False
+        if self.transport is not None:
+            self.transport.close()
+        if (
+            self.reader_thread is not None
+            and self.reader_thread is not threading.current_thread()
+        ):
+            self.reader_thread.join(timeout=1.0)
+        self.transport = None
+        self.reader_thread = None
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import re
+import time
+from typing import BinaryIO, Callable, Iterator
+
+from randomvideoplayer.metrics import counter
+
+CHUNK_SIZE = 1 << 16
+MAX_LINE = 1 << 14
+PLAYING = b'playing: '
+
+# Needles are searched in the lowercased chunk with bytes.find, which is
+# several times faster than a case-insensitive regex over the same data.
+ERROR_NEEDLES = (b'error', b'failed')
+LINE_END = re.compile(rb'[\r\n]')
+
+OUTPUT_LINES = counter('mpv_output_lines_total', 'Lines read from mpv output')
+OUTPUT_ERRORS = counter('mpv_output_errors_total', 'Error lines in mpv output')
+ERRORS_SUPPRESSED = counter(
+    'mpv_output_errors_suppressed_total',
+    'mpv error lines not forwarded to the app log by the rate limit',
+)
+
+LineCallback = Callable[[str], None]
+
+
+def _decode(line: bytes) -> str:
+    return line.decode('utf-8', 'ignore').strip()
+
+
+def _line_start(data: bytes, pos: int) -> int:
+    # Carriage returns end lines too, so status-line redraws stay apart.
+    return max(data.rfind(b'\n', 0, pos), data.rfind(b'\r', 0, pos)) + 1
+
+
+def _line_end(data: bytes, pos: int) -> int:
+    match = LINE_END.search(data, pos)
+    return match.start() if match is not None else len(data)
+
+
+def match_lines(data: bytes) -> Iterator[tuple[bool, bytes]]:
+    lowered = data.lower()
+    starts: dict[int, bool] = {}
+    for needle in ERROR_NEEDLES:
+        pos = lowered.find(needle)
+        while pos >= 0:
+            starts.setdefault(_line_start(lowered, pos), False)
+            pos = lowered.find(needle, _line_end(lowered, pos))
+    if lowered.startswith(PLAYING):
+        starts[0] = True
+    for needle in (b'\n' + PLAYING, b'\r' + PLAYING):
+        pos = lowered.find(needle)
+        while pos >= 0:
+            starts[pos + 1] = True
+            pos = lowered.find(needle, pos + 1)
+    for start in sorted(starts):
+        yield starts[start], data[start : _line_end(data, start)]
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.suppressed = 0
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.suppressed += 1
+        return False
+
+
+class MpvOutputReader:
+    def __init__(
+        self,
+        on_error: LineCallback,
+        on_playing: LineCallback,
+        parse: Callable[[], bool] = lambda: True,
+        error_rate: float = 10.0,
+        error_burst: int = 50,
+    ) -> None:
+        self.on_error = on_error
+        self.on_playing = on_playing
+        self.parse = parse
+        self.limiter = RateLimiter(error_rate, error_burst)
+        self.carry = b''
+        self.lines = 0
+
+    def run(self, stream: BinaryIO) -> None:
+        read = getattr(stream, 'read1', stream.read)
+        while True:
+            chunk = read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.feed(chunk)
+        self.flush()
+
+    def feed(self, chunk: bytes) -> None:
+        cut = chunk.rfind(b'\n')
+        if cut < 0:
+            # Bounded: a runaway line without newlines is cut, not buffered.
+            self.carry = (self.carry + chunk)[:MAX_LINE]
+            return
+        data = self.carry + chunk[: cut + 1] if self.carry else chunk[: cut + 1]
+        self.carry = chunk[cut + 1 :][:MAX_LINE]
+        lines = data.count(b'\n')
+        self.lines += lines
+        OUTPUT_LINES.inc(lines)
+        if self.parse():
+            self._dispatch(data)
+
+    def flush(self) -> None:
+        data, self.carry = self.carry, b''
+        if data:
+            self.lines += 1
+            OUTPUT_LINES.inc()
+            if self.parse():
+                self._dispatch(data)
+        self._report_suppressed()
+
+    def _dispatch(self, data: bytes) -> None:
+        for playing, raw in match_lines(data):
+            line = _decode(raw)
+            if not line:
+                continue
+            if playing:
+                self.on_playing(line[len(PLAYING) :].strip())
+                continue
+            OUTPUT_ERRORS.inc()
+            if self.limiter.allow():
+                self._report_suppressed()
+                self.on_error(line)
+            else:
+                ERRORS_SUPPRESSED.inc()
+
+    def _report_suppressed(self) -> None:
+        suppressed = self.limiter.suppressed
+        if suppressed:
+            self.limiter.suppressed = 0
+            self.on_error(f'{suppressed} more error lines suppressed')
@@ -1,9 +1,42 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
+import os
+import platform
 import shutil
 
+NETWORK_FILESYSTEMS = {
+    'nfs',
+    'nfs4',
+    'cifs',
+    'smb3',
+    'smbfs',
+    'sshfs',
+    'fuse.sshfs',
+    'fuse.rclone',
+    '9p',
+    'afpfs',
+    'davfs',
+}
+
+DRIVE_REMOTE = 4
+
+
+class CacheSettings(NamedTuple):
+    cache_secs: float
+    readahead_secs: float
+    demuxer_max_mb: int
+
+
+# Short clips on slow storage need the next file buffered well before the
+# current one ends, so slower media get deeper caches.
+STORAGE_CACHE_SETTINGS = {
+    'local': CacheSettings(10.0, 10.0, 0),
+    'rotational': CacheSettings(30.0, 20.0, 300),
+    'network': CacheSettings(60.0, 30.0, 500),
+}
+
 
 def find_mpv_executable(explicit_path: Optional[str]) -> str:
     if explicit_path:
@@ -23,16 +56,103 @@ def find_mpv_executable(explicit_path: Optional[str]) -> str:
     )
 
 
+def _linux_mount_type(path: str) -> Optional[str]:
+    best = ''
+    fstype: Optional[str] = None
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                inside = path == mount_point or path.startswith(
+                    mount_point.rstrip('/') + '/',
+                )
+                if inside and len(mount_point) > len(best):
+                    best = mount_point
+                    fstype = fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+def _linux_rotational(path: str) -> bool:
+    try:
+        dev = os.stat(path).st_dev
+        sys_dev = Path(f'/sys/dev/block/{os.major(dev)}:{os.minor(dev)}').resolve()
+    except OSError:
+        return False
+    # Partitions have no queue directory of their own; use the parent disk.
+    for candidate in (sys_dev, sys_dev.parent):
+        flag = candidate / 'queue' / 'rotational'
+        try:
+            return flag.read_text().strip() == '1'
+        except OSError:
+            continue
+    return False
+
+
+def detect_storage(directory: Path) -> str:
+    path = os.path.realpath(directory)
+    system = platform.system()
+    if system == 'Windows':
+        if path.startswith('\\\\'):
+            return 'network'
+        try:
+            import ctypes
+
+            drive = os.path.splitdrive(path)[0] + '\\'
+            if ctypes.windll.kernel32.GetDriveTypeW(drive) == DRIVE_REMOTE:
+                return 'network'
+        except (AttributeError, OSError):
+            pass
+        return 'local'
+    if system == 'Linux':
+        fstype = _linux_mount_type(path)
+        if fstype in NETWORK_FILESYSTEMS:
+            return 'network'
+        if _linux_rotational(path):
+            return 'rotational'
+    return 'local'
+
+
+def resolve_cache_settings(
+    directory: Path,
+    storage: str = 'auto',
+    cache_secs: float = 0.0,
+    readahead_secs: float = 0.0,
+    demuxer_max_mb: int = 0,
+) -> tuple[str, CacheSettings]:
+    if storage not in STORAGE_CACHE_SETTINGS:
+        storage = detect_storage(directory)
+    auto = STORAGE_CACHE_SETTINGS[storage]
+    return storage, CacheSettings(
+        cache_secs if cache_secs > 0 else auto.cache_secs,
+        readahead_secs if readahead_secs > 0 else auto.readahead_secs,
+        demuxer_max_mb if demuxer_max_mb > 0 else auto.demuxer_max_mb,
+    )
+
+
 def build_mpv_command(
     mpv_executable: str,
     playlist_path: Path,
     fullscreen: bool,
     loop_playlist: bool,
     shuffle: bool,
+    ipc_server: Optional[str] = None,
+    cache: Optional[CacheSettings] = None,
+    screen: Optional[int] = None,
+    playlist_start: Optional[int] = None,
 ) -> list[str]:
+    if cache is None:
+        cache = STORAGE_CACHE_SETTINGS['local']
+
     cmd: list[str] = [mpv_executable]
 
     cmd.append(f'--playlist={playlist_path.resolve().as_posix()}')
+    if playlist_start is not None:
+        cmd.append(f'--playlist-start={playlist_start}')
 
     if shuffle:
         cmd.append('--shuffle')
@@ -41,8 +161,17 @@ def build_mpv_command(
 
     cmd.append('--prefetch-playlist=yes')
     cmd.append('--cache=yes')
-    cmd.append('--cache-secs=10')
-    cmd.append('--demuxer-readahead-secs=10')
+    cmd.append(f'--cache-secs={cache.cache_secs:g}')
+    cmd.append(f'--demuxer-readahead-secs={cache.readahead_secs:g}')
+    if cache.demuxer_max_mb > 0:
+        cmd.append(f'--demuxer-max-bytes={cache.demuxer_max_mb}MiB')
+
+    if ipc_server is not None:
+        cmd.append(f'--input-ipc-server={ipc_server}')
+
+    if screen is not None:
+        cmd.append(f'--screen={screen}')
+        cmd.append(f'--fs-screen={screen}')
 
     if fullscreen:
         cmd.append('--fs')
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import subprocess
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Optional
+
+from randomvideoplayer.backoff import Backoff, restart_delay
+from randomvideoplayer.history import PlaybackTracker
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError, make_ipc_address
+from randomvideoplayer.mpv_utils import (
+    CacheSettings,
+    build_mpv_command,
+    find_mpv_executable,
+)
+from randomvideoplayer.path_table import PathTable
+from randomvideoplayer.session import MPV_RESTARTS, MPV_STARTS, PlaybackSession, SessionError
+from randomvideoplayer.shuffle import RollingQueue
+
+
+class TableSlice:
+    def __init__(self, table: PathTable, indices: array) -> None:
+        self.table = table
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index: int) -> str:
+        return self.table[self.indices[index]]
+
+    def directory(self, index: int) -> str:
+        return self.table.directory(self.indices[index])
+
+
+def partition(table: PathTable, parts: int) -> list[TableSlice]:
+    # Striding keeps every screen's share spread across all directories;
+    # the per-screen scheduler supplies the randomness.
+    count = len(table)
+    return [TableSlice(table, array('I', range(i, count, parts))) for i in range(parts)]
+
+
+class MpvInstance:
+    def __init__(
+        self,
+        orchestrator: Orchestrator,
+        screen: int,
+        entries: TableSlice,
+    ) -> None:
+        self.orchestrator = orchestrator
+        self.screen = screen
+        self.entries = entries
+        config = orchestrator.config
+        self.scheduler = orchestrator.session.create_scheduler(entries)
+        self.backoff = Backoff(
+            initial=config.restart_backoff_initial,
+            maximum=config.restart_backoff_max,
+        )
+        self.process: Optional[subprocess.Popen] = None
+        self.client: Optional[MpvIpcClient] = None
+        self.queue: Optional[RollingQueue] = None
+        self.tracker: Optional[PlaybackTracker] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.restarts = 0
+
+    def _log(self, message: str) -> None:
+        self.orchestrator.session._log(f'[screen {self.screen}] {message}')
+
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self._supervise,
+            name=f'mpv-screen-{self.screen}',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def _supervise(self) -> None:
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                code = self._run_once()
+            except Exception as exc:
+                self._log(f'Instance failed: {exc}')
+                code = None
+            config = self.orchestrator.config
+            if self.stop_event.is_set() or not config.supervise:
+                break
+            delay = restart_delay(
+                self.backoff,
+                code,
+                time.monotonic() - started,
+                config.restart_max_failures,
+            )
+            if delay is None:
+                if code == 0:
+                    self._log('mpv exited normally')
+                else:
+                    self._log(
+                        f'mpv failed {config.restart_max_failures} times in a row, '
+                        'not restarting',
+                    )
+                break
+            self.restarts += 1
+            MPV_RESTARTS.inc()
+            self._log(f'mpv exited with {code}, restarting in {delay:.1f}s')
+            if self.stop_event.wait(delay):
+                break
+
+    def _run_once(self) -> Optional[int]:
+        orchestrator = self.orchestrator
+        config = orchestrator.config
+        queue = RollingQueue(
+            self.scheduler,
+            self.entries,
+            queue_length=config.shuffle_queue_length,
+            logger=orchestrator.session.app_logger,
+        )
+        playlist_path = orchestrator.playlist_path
+        queue_path = playlist_path.with_name(
+            f'{playlist_path.stem}.screen{self.screen}.queue{playlist_path.suffix}',
+        )
+        if queue.write_initial(queue_path) == 0:
+            # Nothing is left to schedule, so mpv is never started.
+            self._log('No entries left to play')
+            self.stop_event.set()
+            return None
+
+        ipc_address = make_ipc_address()
+        cmd = build_mpv_command(
+            mpv_executable=orchestrator.mpv_executable,
+            playlist_path=queue_path,
+            fullscreen=config.fullscreen,
+            loop_playlist=False,
+            shuffle=False,
+            ipc_server=ipc_address,
+            cache=orchestrator.cache,
+            screen=self.screen,
+        )
+        with orchestrator.lock:
+            if self.stop_event.is_set():
+                return None
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        MPV_STARTS.inc()
+        self.queue = queue
+        process = self.process
+        client = MpvIpcClient(ipc_address, logger=orchestrator.session.app_logger)
+        self.client = client
+        try:
+            client.connect(alive=lambda: process.poll() is None)
+            client.add_event_handler('log-message', self._on_log_message)
+            client.request_log_messages('error')
+            if orchestrator.session.history is not None:
+                self.tracker = PlaybackTracker(
+                    orchestrator.session.history,
+                    logger=orchestrator.session.app_logger,
+                )
+                self.tracker.attach(client)
+            client.observe_property('path', self._on_path_change)
+            queue.start(client)
+        except MpvIpcError as exc:
+            # Without IPC the queue never advances, so the run counts as a
+            # failure and the supervisor restarts it with backoff.
+            self._log(f'mpv IPC unavailable: {exc}')
+            with orchestrator.lock:
+                try:
+                    process.terminate()
+                except Exception:
+                    pass
+            try:
+                code = process.wait()
+            finally:
+                self._cleanup()
+            return code or 1
+        try:
+            return process.wait()
+        finally:
+            self._cleanup()
+
+    def _cleanup(self) -> None:
+        if self.tracker is not None:
+            self.tracker.close()
+            self.tracker = None
+        if self.queue is not None:
+            self.queue.stop(wait=False)
+            self.queue = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self.process = None
+
+    def _on_path_change(self, name: str, value: Any) -> None:
+        if not value:
+            return
+        if self.tracker is not None:
+            self.tracker.on_path(value)
+        logger = self.orchestrator.session.playback_logger
+        if logger is not None:
+            logger.log(f'[screen {self.screen}] {value}')
+
+    def _on_log_message(self, event: dict[str, Any]) -> None:
+        text = str(event.get('text', '')).strip()
+        self._log(f'mpv: [{event.get("prefix", "")}] {text}')
+
+    def toggle_pause(self) -> None:
+        client = self.client
+        if client is None:
+            return
+        try:
+            client.toggle_pause()
+        except MpvIpcError as exc:
+            self._log(f'Pause failed: {exc}')
+
+    def skip(self) -> None:
+        client = self.client
+        if client is None:
+            return
+        try:
+            client.skip()
+        except MpvIpcError as exc:
+            self._log(f'Skip failed: {exc}')
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        with self.orchestrator.lock:
+            if self.process is not None:
+                try:
+                    self.process.terminate()
+                except Exception:
+                    pass
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+class Orchestrator:
+    def __init__(
+        self,
+        session: PlaybackSession,
+        screens: int,
+    ) -> None:
+        self.session = session
+        self.config = session.config
+        self.screens = max(1, screens)
+        self.lock = threading.Lock()
+        self.instances: list[MpvInstance] = []
+        self.mpv_executable = ''
+        self.playlist_path = Path(self.config.playlist_path).expanduser()
+        self.cache: Optional[CacheSettings] = None
+
+    def start(self) -> int:
+        config = self.config
+        session = self.session
+        roots = session.resolve_roots()
+        if session.app_logger is None:
+            session.open_loggers()
+        session.open_metrics()
+        session.open_history()
+        try:
+            self.mpv_executable = find_mpv_executable(config.mpv_path.strip() or None)
+        except FileNotFoundError as exc:
+            raise SessionError(str(exc)) from exc
+        storage, self.cache = session.resolve_cache(roots)
+
+        session.set_status('Building playlist...')
+        # One scan feeds every screen; instances only hold index slices.
+        table = session.build_table(roots)
+        if len(table) == 0:
+            raise SessionError(session.no_media_message())
+
+        slices = [part for part in partition(table, self.screens) if len(part) > 0]
+        self.instances = [MpvInstance(self, screen, part) for screen, part in enumerate(slices)]
+        session.set_status(
+            f'Starting {len(self.instances)} mpv instances with {len(table)} files '
+            f'({storage} storage)...',
+        )
+        for instance in self.instances:
+            instance.start()
+        return len(table)
+
+    def toggle_pause(self) -> None:
+        for instance in self.instances:
+            instance.toggle_pause()
+
+    def skip(self) -> None:
+        for instance in self.instances:
+            instance.skip()
+
+    def stop(self) -> None:
+        for instance in self.instances:
+            instance.stop()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for instance in self.instances:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            instance.join(remaining)
+        return not any(i.thread is not None and i.thread.is_alive() for i in self.instances)
+
+    def close(self) -> None:
+        self.stop()
+        self.wait(timeout=5.0)
+        self.session.close()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from array import array
+from itertools import accumulate, islice
+from typing import Iterable, Iterator
+
+ENCODING = 'utf-8'
+ERRORS = 'surrogateescape'
+
+
+class PathTable:
+    def __init__(self) -> None:
+        self.dirs: list[str] = []
+        self.dir_ids: dict[str, int] = {}
+        self.names = bytearray()
+        self.name_offsets = array('Q', [0])
+        self.entry_dirs = array('I')
+
+    def __len__(self) -> int:
+        return len(self.entry_dirs)
+
+    def add_directory(self, directory: str) -> int:
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = len(self.dirs)
+            self.dirs.append(directory)
+            self.dir_ids[directory] = dir_id
+        return dir_id
+
+    def add(self, dir_id: int, name: str) -> int:
+        self.names += name.encode(ENCODING, ERRORS)
+        self.name_offsets.append(len(self.names))
+        self.entry_dirs.append(dir_id)
+        return len(self.entry_dirs) - 1
+
+    def extend(self, dir_id: int, names: Iterable[str]) -> None:
+        encoded = [name.encode(ENCODING, ERRORS) for name in names]
+        if not encoded:
+            return
+        base = len(self.names)
+        self.names += b''.join(encoded)
+        offsets = accumulate(map(len, encoded), initial=base)
+        self.name_offsets.extend(islice(offsets, 1, None))
+        self.entry_dirs.extend([dir_id] * len(encoded))
+
+    def name(self, index: int) -> str:
+        start = self.name_offsets[index]
+        end = self.name_offsets[index + 1]
+        return self.names[start:end].decode(ENCODING, ERRORS)
+
+    def directory(self, index: int) -> str:
+        return self.dirs[self.entry_dirs[index]]
+
+    def __getitem__(self, index: int) -> str:
+        return f'{self.dirs[self.entry_dirs[index]]}/{self.name(index)}'
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self.entry_dirs)):
+            yield self[index]
+
+    def iter_runs(self) -> Iterator[tuple[str, list[str]]]:
+        count = len(self.entry_dirs)
+        start = 0
+        while start < count:
+            dir_id = self.entry_dirs[start]
+            end = start + 1
+            while end < count and self.entry_dirs[end] == dir_id:
+                end += 1
+            chunk = self.names[self.name_offsets[start] : self.name_offsets[end]]
+            text = chunk.decode(ENCODING, ERRORS)
+            offsets = self.name_offsets
+            base = offsets[start]
+            names: list[str] = []
+            if text.isascii():
+                for index in range(start, end):
+                    names.append(text[offsets[index] - base : offsets[index + 1] - base])
+            else:
+                for index in range(start, end):
+                    names.append(self.name(index))
+            yield self.dirs[dir_id], names
+            start = end
+
+    def without(self, entries: set[str]) -> PathTable:
+        table = PathTable()
+        for directory, names in self.iter_runs():
+            prefix = directory + '/'
+            kept = [name for name in names if prefix + name not in entries]
+            table.extend(table.add_directory(directory), kept)
+        return table
+
+    def find_many(self, entries: Iterable[str]) -> dict[str, int]:
+        wanted: dict[int, dict[str, str]] = {}
+        for entry in entries:
+            directory, _, name = entry.rpartition('/')
+            dir_id = self.dir_ids.get(directory)
+            if dir_id is not None:
+                wanted.setdefault(dir_id, {})[name] = entry
+        found: dict[str, int] = {}
+        if not wanted:
+            return found
+        for index, dir_id in enumerate(self.entry_dirs):
+            names = wanted.get(dir_id)
+            if names is not None:
+                entry = names.get(self.name(index))
+                if entry is not None:
+                    found[entry] = index
+        return found
+
+    def nbytes(self) -> int:
+        return (
+            len(self.names)
+            + self.name_offsets.itemsize * len(self.name_offsets)
+            + self.entry_dirs.itemsize * len(self.entry_dirs)
+            + sum(len(d) for d in self.dirs)
+        )
@@ -1,39 +1,308 @@
 from __future__ import annotations
 
+import mmap
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Callable, Generator, Iterable, Iterator, Optional
 
 from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.filters import MediaFilter
+from randomvideoplayer.library_index import LibraryIndex
+from randomvideoplayer.metadata import PROBE_BATCH_SIZE
+from randomvideoplayer.metrics import DURATION_BUCKETS, counter, gauge, histogram
+from randomvideoplayer.path_table import PathTable
+from randomvideoplayer.scanner import walk_directories
 
+WRITE_BUFFER_SIZE = 1 << 20
+WRITE_BATCH_SIZE = 4096
+PLAYLIST_HEADER = '#EXTM3U\n'
 
-def iter_webm_files(directory: Path, recursive: bool) -> Iterable[Path]:
-    if recursive:
-        for root, dirs, files in os.walk(directory):
-            root_path = Path(root)
-            for name in files:
-                if name.lower().endswith('.webm'):
-                    yield root_path / name
+SCAN_SECONDS = histogram('scan_seconds', 'Wall time of library scans', DURATION_BUCKETS)
+SCAN_FILES = counter('scan_files_total', 'Media files accepted by library scans')
+SCAN_DIRECTORIES = counter('scan_directories_total', 'Directories visited by library scans')
+SCAN_RATE = gauge('scan_files_per_second', 'Accepted files per second in the last scan')
+PLAYLIST_WRITE_SECONDS = histogram(
+    'playlist_write_seconds',
+    'Wall time of full playlist writes',
+    DURATION_BUCKETS,
+)
+PLAYLIST_ENTRIES = gauge('playlist_entries', 'Entries in the last written playlist')
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class ScanProgress:
+    def __init__(
+        self,
+        on_update: Optional[Callable[[ScanProgress], None]] = None,
+        interval: float = 0.2,
+    ) -> None:
+        self.on_update = on_update
+        self.interval = interval
+        self.dirs = 0
+        self.files = 0
+        self.started = time.monotonic()
+        self.last_update = 0.0
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def start(self) -> None:
+        # The rate covers the walk, not the config load and cache lookup.
+        with self.lock:
+            self.started = time.monotonic()
+            self.last_update = 0.0
+
+    def dirs_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.dirs / elapsed if elapsed > 0 else 0.0
+
+    def add(self, files: int, dirs: int = 1) -> None:
+        if self.cancel_event.is_set():
+            raise ScanCancelled('Scan cancelled')
+        # Roots are scanned concurrently and share one progress.
+        with self.lock:
+            self.dirs += dirs
+            self.files += files
+            if self.on_update is None:
+                return
+            now = time.monotonic()
+            if now - self.last_update < self.interval:
+                return
+            self.last_update = now
+        self.on_update(self)
+
+
+DEFAULT_FILTER = MediaFilter()
+
+
+def iter_webm_batches(
+    directory: Path,
+    recursive: bool,
+    index: Optional[LibraryIndex] = None,
+    workers: int = 1,
+    follow_symlinks: bool = False,
+    progress: Optional[ScanProgress] = None,
+    media_filter: Optional[MediaFilter] = None,
+) -> Iterator[tuple[str, list[str]]]:
+    if media_filter is None:
+        media_filter = DEFAULT_FILTER
+    if index is not None:
+        walker = index.walk(directory, recursive, workers, follow_symlinks)
     else:
-        with os.scandir(directory) as it:
-            for entry in it:
-                if entry.is_file() and entry.name.lower().endswith('.webm'):
-                    yield directory / entry.name
+        walker = walk_directories(
+            os.path.realpath(directory),
+            recursive,
+            workers,
+            follow_symlinks=follow_symlinks,
+        )
+
+    started = time.perf_counter()
+    found = directories = 0
+    pending: list[tuple[str, list[str]]] = []
+    pending_files = 0
+    try:
+        for current, files in walker:
+            names = media_filter.prefilter(current, files)
+            directories += 1
+            if not media_filter.probes:
+                found += len(names)
+                if progress is not None:
+                    progress.add(len(names))
+                if names:
+                    yield current, names
+                continue
+            # Probing waits for a full batch; directories still count now.
+            if progress is not None:
+                progress.add(0)
+            if names:
+                pending.append((current, names))
+                pending_files += len(names)
+            if pending_files >= PROBE_BATCH_SIZE:
+                batches, pending, pending_files = pending, [], 0
+                found += yield from _probe_batches(media_filter, batches, progress)
+        if pending:
+            found += yield from _probe_batches(media_filter, pending, progress)
+    finally:
+        elapsed = time.perf_counter() - started
+        SCAN_SECONDS.observe(elapsed)
+        SCAN_FILES.inc(found)
+        SCAN_DIRECTORIES.inc(directories)
+        SCAN_RATE.set(found / elapsed if elapsed > 0 else 0.0)
+
+
+def _probe_batches(
+    media_filter: MediaFilter,
+    batches: list[tuple[str, list[str]]],
+    progress: Optional[ScanProgress],
+) -> Generator[tuple[str, list[str]], None, int]:
+    found = 0
+    for current, names in media_filter.filter_probed(batches):
+        found += len(names)
+        if names:
+            yield current, names
+    if progress is not None:
+        progress.add(found, dirs=0)
+    return found
+
+
+def iter_webm_files(
+    directory: Path,
+    recursive: bool,
+    index: Optional[LibraryIndex] = None,
+    workers: int = 1,
+    follow_symlinks: bool = False,
+) -> Iterable[Path]:
+    for current, names in iter_webm_batches(
+        directory,
+        recursive,
+        index,
+        workers,
+        follow_symlinks,
+    ):
+        root_path = Path(current)
+        for name in names:
+            yield root_path / name
+
+
+def _to_posix(path: str) -> str:
+    if os.sep != '/':
+        return path.replace(os.sep, '/')
+    return path
+
+
+def add_batch(table: PathTable, current: str, names: list[str]) -> None:
+    table.extend(table.add_directory(_to_posix(current).rstrip('/')), names)
+
+
+def build_path_table(batches: Iterable[tuple[str, list[str]]]) -> PathTable:
+    table = PathTable()
+    for current, names in batches:
+        add_batch(table, current, names)
+    return table
+
+
+def playlist_entry(path: Path | str) -> str:
+    return _to_posix(os.path.abspath(path))
 
 
 def write_playlist_file(
-    files: Iterable[Path],
+    files: Iterable[Path] | PathTable,
     playlist_path: Path,
     logger: Optional[FileLogger] = None,
 ) -> int:
     if logger is not None:
         logger.log(f'Building playlist at {playlist_path}')
+    started = time.perf_counter()
     playlist_path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and renamed over it, so a crashed or
+    # cancelled build never leaves mpv a truncated playlist.
+    tmp_path = playlist_path.with_name(playlist_path.name + '.tmp')
     count = 0
-    with playlist_path.open('w', encoding='utf-8') as f:
-        for path in files:
-            f.write(path.resolve().as_posix() + '\n')
-            count += 1
+    with tmp_path.open(
+        'w',
+        encoding='utf-8',
+        buffering=WRITE_BUFFER_SIZE,
+    ) as f:
+        f.write(PLAYLIST_HEADER)
+        if isinstance(files, PathTable):
+            for directory, names in files.iter_runs():
+                prefix = directory + '/'
+                f.write(''.join([f'{prefix}{name}\n' for name in names]))
+                count += len(names)
+        else:
+            batch: list[str] = []
+            for path in files:
+                batch.append(playlist_entry(path))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    f.write('\n'.join(batch) + '\n')
+                    count += len(batch)
+                    batch.clear()
+            if batch:
+                f.write('\n'.join(batch) + '\n')
+                count += len(batch)
+    os.replace(tmp_path, playlist_path)
+    PLAYLIST_WRITE_SECONDS.observe(time.perf_counter() - started)
+    PLAYLIST_ENTRIES.set(count)
     if logger is not None:
         logger.log(f'Playlist written to {playlist_path} with {count} entries')
     return count
+
+
+def read_playlist_table(playlist_path: Path) -> PathTable:
+    table = PathTable()
+    current = ''
+    names: list[str] = []
+    with playlist_path.open('r', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            directory, _, name = line.rstrip('\n').rpartition('/')
+            if not name:
+                continue
+            if directory != current:
+                if names:
+                    table.extend(table.add_directory(current), names)
+                current = directory
+                names = []
+            names.append(name)
+    if names:
+        table.extend(table.add_directory(current), names)
+    return table
+
+
+def append_playlist_entries(playlist_path: Path, entries: Iterable[str]) -> int:
+    lines = [entry + '\n' for entry in entries]
+    if lines:
+        with playlist_path.open('a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+    return len(lines)
+
+
+def remove_playlist_entries(playlist_path: Path, entries: Iterable[str]) -> int:
+    # Entries are commented out in place, so the file is never rewritten.
+    targets = [b'\n' + entry.encode('utf-8') + b'\n' for entry in entries]
+    if not targets or not playlist_path.is_file():
+        return 0
+    removed = 0
+    with playlist_path.open('r+b') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0) as mapped:
+            for target in targets:
+                offset = mapped.find(target)
+                if offset >= 0:
+                    mapped[offset + 1] = ord('#')
+                    removed += 1
+            mapped.flush()
+    return removed
+
+
+def playlist_index(playlist_path: Path, entry: str) -> Optional[int]:
+    # mpv skips comment lines, so the index only counts playable entries.
+    target = entry.encode('utf-8') + b'\n'
+    try:
+        with playlist_path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[: len(target)] == target:
+                    return 0
+                offset = mapped.find(b'\n' + target)
+                if offset < 0:
+                    return None
+                prefix = mapped[: offset + 1]
+    except OSError:
+        return None
+    skipped = prefix.count(b'\n#') + prefix.count(b'\n\n') + (1 if prefix[:1] == b'#' else 0)
+    return prefix.count(b'\n') - skipped
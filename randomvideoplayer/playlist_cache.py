@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Sequence
+
+from randomvideoplayer.app_config import AppConfig
+from randomvideoplayer.library_index import MTIME_SETTLE_NS, LibraryIndex
+from randomvideoplayer.playlist_builder import ScanCancelled
+from randomvideoplayer.roots import LibraryRoot
+
+CACHE_VERSION = 2
+PARALLEL_STAT_THRESHOLD = 256
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def scan_fingerprint(config: AppConfig, roots: Sequence[LibraryRoot]) -> Optional[str]:
+    # Age filters move with the clock and symlinked trees live outside the
+    # indexed root, so neither can be vouched for by directory mtimes.
+    if config.min_age_days > 0 or config.max_age_days > 0 or config.follow_symlinks:
+        return None
+    inputs = {
+        'version': CACHE_VERSION,
+        'roots': [[os.path.realpath(root.path), root.recursive] for root in roots],
+        'extensions': sorted(ext.lower() for ext in config.extensions),
+        'include_globs': config.include_globs,
+        'exclude_globs': config.exclude_globs,
+        'min_size_mb': config.min_size_mb,
+        'max_size_mb': config.max_size_mb,
+        'min_duration': config.min_duration,
+        'max_duration': config.max_duration,
+        'min_height': config.min_height,
+        'max_height': config.max_height,
+        'video_codecs': sorted(codec.upper() for codec in config.video_codecs),
+        'dedup_enabled': config.dedup_enabled,
+    }
+    return _digest(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+
+
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def library_signature(
+    index: LibraryIndex,
+    roots: Sequence[LibraryRoot],
+    workers: int = 1,
+    cancel_event: Optional[threading.Event] = None,
+) -> Optional[str]:
+    def stat(path: str) -> int:
+        if cancel_event is not None and cancel_event.is_set():
+            raise ScanCancelled('Scan cancelled')
+        return _mtime_ns(path)
+
+    found: set[str] = set()
+    for root in roots:
+        directories = index.directories(os.path.realpath(root.path), root.recursive)
+        if not directories:
+            return None
+        found.update(directories)
+    paths = sorted(found)
+    if workers > 1 and len(paths) > PARALLEL_STAT_THRESHOLD:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='signature') as pool:
+            mtimes = list(pool.map(stat, paths, chunksize=64))
+    else:
+        mtimes = [stat(path) for path in paths]
+    # A directory that changed within the last mtime tick may change again
+    # without its mtime moving, so such a library is not cacheable yet.
+    settled = time.time_ns() - MTIME_SETTLE_NS
+    if any(mtime > settled for mtime in mtimes):
+        return None
+    hasher = hashlib.blake2b(digest_size=16)
+    for path, mtime in zip(paths, mtimes):
+        hasher.update(f'{path}\0{mtime}\n'.encode('utf-8', 'surrogateescape'))
+    return hasher.hexdigest()
+
+
+def cache_key(fingerprint: str, signature: str) -> str:
+    return _digest(f'{fingerprint}:{signature}'.encode('ascii'))
+
+
+class PlaylistCache:
+    def __init__(self, playlist_path: Path) -> None:
+        self.playlist_path = playlist_path
+        self.meta_path = playlist_path.with_name(playlist_path.name + '.cache.json')
+
+    def lookup(self, key: str) -> Optional[int]:
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding='utf-8'))
+            st = os.stat(self.playlist_path)
+        except (OSError, ValueError):
+            return None
+        # The size and mtime guard against the playlist being edited or
+        # rewritten by something other than the cached build.
+        if (
+            meta.get('key') != key
+            or meta.get('size') != st.st_size
+            or meta.get('mtime_ns') != st.st_mtime_ns
+        ):
+            return None
+        count = meta.get('count')
+        return count if isinstance(count, int) and count > 0 else None
+
+    def store(self, key: str, count: int) -> None:
+        st = os.stat(self.playlist_path)
+        meta = {
+            'key': key,
+            'count': count,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+        }
+        tmp_path = self.meta_path.with_name(self.meta_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp_path, self.meta_path)
+
+    def invalidate(self) -> None:
+        try:
+            self.meta_path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError
+
+READ_CHUNK_SIZE = 1 << 20
+WARMED_MEMORY = 64
+
+PREWARM_MODES = ('auto', 'fadvise', 'read')
+
+
+def _fadvise_available() -> bool:
+    return hasattr(os, 'posix_fadvise') and hasattr(os, 'POSIX_FADV_WILLNEED')
+
+
+class ClipPrewarmer:
+    def __init__(
+        self,
+        count: int,
+        byte_budget: int,
+        mode: str = 'auto',
+        loop: bool = True,
+        logger: Optional[FileLogger] = None,
+    ) -> None:
+        if mode not in PREWARM_MODES:
+            raise ValueError(f'Unknown prewarm mode "{mode}"')
+        self.count = max(1, count)
+        self.file_budget = max(READ_CHUNK_SIZE, byte_budget // self.count)
+        # 'fadvise' falls back to reads where the call is missing (Windows).
+        self.use_fadvise = mode != 'read' and _fadvise_available()
+        self.loop = loop
+        self.logger = logger
+        self.warmed: OrderedDict[str, None] = OrderedDict()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.bytes_warmed = 0
+        self.files_warmed = 0
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def resize(self, count: int, byte_budget: int) -> None:
+        self.count = max(1, count)
+        self.file_budget = max(READ_CHUNK_SIZE, byte_budget // self.count)
+        self.wake.set()
+
+    def start(self, client: MpvIpcClient) -> None:
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(client,),
+            name='clip-prewarm',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        self.wake.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def _on_position(self, name: str, value: Any) -> None:
+        self.wake.set()
+
+    def _run(self, client: MpvIpcClient) -> None:
+        try:
+            client.observe_property('playlist-pos', self._on_position)
+            while not self.stop_event.is_set():
+                self.wake.wait()
+                self.wake.clear()
+                if self.stop_event.is_set():
+                    break
+                for path in self._upcoming(client):
+                    if self.stop_event.is_set() or self.wake.is_set():
+                        break
+                    self._warm(path)
+        except MpvIpcError as exc:
+            self._log(f'Clip prewarm stopped: {exc}')
+        except Exception as exc:
+            self._log(f'Clip prewarm failed: {exc}')
+        finally:
+            self._log(
+                f'Clip prewarm warmed {self.files_warmed} files, '
+                f'{self.bytes_warmed // (1024 * 1024)} MiB',
+            )
+
+    def _upcoming(self, client: MpvIpcClient) -> list[str]:
+        position = client.get_property('playlist-pos')
+        total = client.get_property('playlist-count')
+        if not isinstance(position, int) or not isinstance(total, int) or position < 0:
+            return []
+        paths: list[str] = []
+        for offset in range(1, self.count + 1):
+            index = position + offset
+            if index >= total:
+                if not self.loop or total == 0:
+                    break
+                index %= total
+            try:
+                path = client.get_property(f'playlist/{index}/filename')
+            except MpvIpcError:
+                break
+            if isinstance(path, str) and path not in self.warmed:
+                paths.append(path)
+        return paths
+
+    def _remember(self, path: str) -> None:
+        self.warmed[path] = None
+        self.warmed.move_to_end(path)
+        while len(self.warmed) > max(WARMED_MEMORY, 4 * self.count):
+            self.warmed.popitem(last=False)
+
+    def _warm(self, path: str) -> None:
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except OSError:
+            return
+        try:
+            size = os.fstat(fd).st_size
+            length = min(size, self.file_budget)
+            if self.use_fadvise:
+                # The kernel reads the range asynchronously; nothing is
+                # copied into this process.
+                os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+            else:
+                remaining = length
+                while remaining > 0 and not self.stop_event.is_set():
+                    chunk = os.read(fd, min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                length -= max(0, remaining)
+        except OSError:
+            return
+        finally:
+            os.close(fd)
+        self._remember(path)
+        self.files_warmed += 1
+        self.bytes_warmed += length
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional, TypeVar
+
+from randomvideoplayer.app_config import AppConfig
+
+ENV_VAR = 'RANDOMVIDEOPLAYER_PROFILE'
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+
+T = TypeVar('T')
+
+
+class PhaseStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class Profiler:
+    def __init__(
+        self,
+        enabled: bool = False,
+        cprofile: bool = False,
+        trace_memory: bool = False,
+        report_path: Optional[Path] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.cprofile = cprofile and enabled
+        self.trace_memory = trace_memory and enabled
+        self.report_path = report_path
+        self.phases: dict[str, PhaseStats] = {}
+        self.lock = threading.Lock()
+        self.profile: Optional[cProfile.Profile] = None
+        self.started_tracing = False
+        self.errors: list[str] = []
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> Profiler:
+        enabled = config.profiling_enabled
+        cprofile = config.profile_cprofile
+        trace_memory = config.profile_tracemalloc
+        # The environment turns profiling on for one run without touching
+        # the saved config, e.g. RANDOMVIDEOPLAYER_PROFILE=cprofile,tracemalloc.
+        value = os.environ.get(ENV_VAR, '').strip().lower()
+        if value and value not in ('0', 'false', 'no', 'off'):
+            options = {option.strip() for option in value.split(',')}
+            enabled = True
+            cprofile = cprofile or 'cprofile' in options
+            trace_memory = trace_memory or 'tracemalloc' in options
+        log_path = Path(config.logging_path.strip() or 'randomvideoplayer.log').expanduser()
+        report_path = log_path.with_name(log_path.name + '.profile.txt')
+        return cls(enabled, cprofile, trace_memory, report_path)
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.cprofile and self.profile is None:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as exc:
+                # Another profiler already owns this thread.
+                self.errors.append(f'cProfile unavailable: {exc}')
+            else:
+                self.profile = profile
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def iterate(self, name: str, iterator: Iterator[T]) -> Iterator[T]:
+        if not self.enabled:
+            yield from iterator
+            return
+        # Only time spent producing items is charged, not the consumer's work.
+        try:
+            while True:
+                wall = time.perf_counter()
+                cpu = time.process_time()
+                try:
+                    item = next(iterator)
+                finally:
+                    wall = time.perf_counter() - wall
+                    self._record(name, wall, time.process_time() - cpu, call=False)
+                yield item
+        except StopIteration:
+            return
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            self._record(name, 0.0, 0.0)
+
+    def _record(self, name: str, wall: float, cpu: float, call: bool = True) -> None:
+        with self.lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats()
+            stats.calls += call
+            stats.wall += wall
+            stats.cpu += cpu
+
+    def stop(self) -> None:
+        # cProfile only sees the thread that enabled it, so it covers the
+        # start sequence and is stopped once playback is up.
+        if self.profile is not None:
+            self.profile.disable()
+
+    def render(self) -> str:
+        out = io.StringIO()
+        now = datetime.now().isoformat(timespec='seconds')
+        out.write(f'# RandomVideoPlayer profile {now} pid={os.getpid()}\n')
+        out.write('# cpu is process time, so it includes scan and worker threads\n')
+        out.write(f'{"phase":<20} {"calls":>6} {"wall_ms":>10} {"cpu_ms":>10}\n')
+        with self.lock:
+            phases = list(self.phases.items())
+        for name, stats in phases:
+            out.write(f'{name:<20} {stats.calls:>6} {stats.wall * 1000:>10.1f} {stats.cpu * 1000:>10.1f}\n')
+        for error in self.errors:
+            out.write(f'# {error}\n')
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            out.write(f'\ntracemalloc: current={current / 2**20:.1f} MiB peak={peak / 2**20:.1f} MiB\n')
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, module.__file__)
+                for module in (cProfile, pstats, tracemalloc)
+            ] + [tracemalloc.Filter(False, __file__)])
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                frame = stat.traceback[0]
+                out.write(f'{stat.size / 1024:>10.1f} KiB {stat.count:>8} {frame.filename}:{frame.lineno}\n')
+        if self.profile is not None:
+            stats_path = self.stats_path()
+            out.write(f'\ncProfile: top {TOP_FUNCTIONS} by cumulative time')
+            out.write(f' (full stats in {stats_path})\n' if stats_path is not None else '\n')
+            stats = pstats.Stats(self.profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def stats_path(self) -> Optional[Path]:
+        if self.report_path is None:
+            return None
+        return self.report_path.with_name(self.report_path.name.removesuffix('.txt') + '.prof')
+
+    def write_report(self) -> Optional[Path]:
+        if not self.enabled or self.report_path is None:
+            return None
+        self.stop()
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        stats_path = self.stats_path()
+        if self.profile is not None and stats_path is not None:
+            self.profile.dump_stats(str(stats_path))
+        tmp_path = self.report_path.with_name(self.report_path.name + '.tmp')
+        tmp_path.write_text(self.render(), encoding='utf-8')
+        os.replace(tmp_path, self.report_path)
+        return self.report_path
+
+    def close(self) -> None:
+        self.stop()
+        self.profile = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError
+
+MIN_RESUME_SECS = 1.0
+
+
+class PlaybackState(NamedTuple):
+    directory: str
+    path: str
+    position: int
+    time_pos: float
+
+
+def load_state(path: Path) -> Optional[PlaybackState]:
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+        state = PlaybackState(
+            str(data['directory']),
+            str(data['path']),
+            int(data['position']),
+            float(data['time_pos']),
+        )
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    return state
+
+
+def save_state(path: Path, state: PlaybackState) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(state._asdict()), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def seek_when_loaded(client: MpvIpcClient, state: PlaybackState) -> None:
+    if state.time_pos < MIN_RESUME_SECS:
+        return
+    once = threading.Lock()
+
+    def seek(event: Optional[dict[str, Any]] = None) -> None:
+        if once.acquire(blocking=False):
+            client.remove_event_handler('file-loaded', seek)
+            client.command_nowait('seek', state.time_pos, 'absolute')
+
+    client.add_event_handler('file-loaded', seek)
+    # The file may have loaded before the handler was registered.
+    try:
+        if (
+            client.get_property('path') == state.path
+            and client.get_property('time-pos') is not None
+        ):
+            seek()
+    except MpvIpcError:
+        pass
+
+
+class StatePoller:
+    def __init__(
+        self,
+        path: Path,
+        directory: str,
+        interval: float,
+        logger: Optional[FileLogger] = None,
+    ) -> None:
+        self.path = path
+        self.directory = directory
+        self.interval = max(0.5, interval)
+        self.logger = logger
+        self.state: Optional[PlaybackState] = None
+        self.saved: Optional[PlaybackState] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def start(self, client: MpvIpcClient) -> None:
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(client,),
+            name='playback-state',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def _run(self, client: MpvIpcClient) -> None:
+        # Polling a few properties on a timer costs one small write per
+        # interval, however fast mpv moves through short clips.
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll(client)
+            except MpvIpcError:
+                if not client.connected:
+                    break
+            except OSError as exc:
+                self._log(f'Failed to save playback state: {exc}')
+
+    def poll(self, client: MpvIpcClient) -> None:
+        path = client.get_property('path')
+        position = client.get_property('playlist-pos')
+        time_pos = client.get_property('time-pos')
+        if not isinstance(path, str) or not isinstance(position, int):
+            return
+        if not isinstance(time_pos, (int, float)):
+            time_pos = 0.0
+        self.state = PlaybackState(self.directory, path, position, float(time_pos))
+        saved = self.saved
+        if (
+            saved is not None
+            and saved.path == path
+            and saved.position == position
+            and abs(saved.time_pos - time_pos) < MIN_RESUME_SECS
+        ):
+            return
+        save_state(self.path, self.state)
+        self.saved = self.state
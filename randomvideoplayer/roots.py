@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Sequence, TypeVar
+
+from randomvideoplayer.app_config import AppConfig, root_problem
+
+T = TypeVar('T')
+
+_DONE = object()
+
+
+class LibraryRoot(NamedTuple):
+    path: Path
+    weight: float
+    recursive: bool
+
+
+def _parse_root(item: Any, recursive: bool) -> LibraryRoot:
+    problem = root_problem(item)
+    if problem is not None:
+        raise ValueError(f'{item!r}: {problem}')
+    if isinstance(item, str):
+        item = {'path': item}
+    return LibraryRoot(
+        Path(item['path'].strip()).expanduser(),
+        float(item.get('weight', 1.0)),
+        item.get('recursive', recursive),
+    )
+
+
+def library_roots(config: AppConfig) -> list[LibraryRoot]:
+    if config.roots:
+        return [_parse_root(item, config.recursive) for item in config.roots]
+    if not config.directory.strip():
+        return []
+    return [LibraryRoot(Path(config.directory).expanduser(), 1.0, config.recursive)]
+
+
+def roots_key(roots: Sequence[LibraryRoot]) -> str:
+    return os.pathsep.join(str(root.path) for root in roots)
+
+
+class RootMatcher:
+    def __init__(self, roots: Sequence[LibraryRoot]) -> None:
+        # Table directories are POSIX forms of real paths, like the scanner's.
+        prefixes = [
+            (os.path.realpath(root.path).replace(os.sep, '/').rstrip('/'), index)
+            for index, root in enumerate(roots)
+        ]
+        self.prefixes = sorted(prefixes, key=lambda item: len(item[0]), reverse=True)
+        self.cache: dict[str, int] = {}
+
+    def __call__(self, directory: str) -> int:
+        found = self.cache.get(directory)
+        if found is not None:
+            return found
+        found = 0
+        for prefix, index in self.prefixes:
+            if directory == prefix or directory.startswith(prefix + '/'):
+                found = index
+                break
+        self.cache[directory] = found
+        return found
+
+
+def merge_batches(sources: Sequence[Iterator[T]]) -> Iterator[tuple[int, T]]:
+    if len(sources) == 1:
+        for item in sources[0]:
+            yield 0, item
+        return
+
+    # Each root is drained by its own thread, so a slow volume only delays
+    # its own batches; the consumer sees batches in arrival order.
+    results: queue.SimpleQueue = queue.SimpleQueue()
+    stop = threading.Event()
+
+    def produce(index: int, source: Iterator[T]) -> None:
+        error = None
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                results.put((index, item, None))
+        except BaseException as exc:
+            error = exc
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+            results.put((index, _DONE, error))
+
+    threads = [
+        threading.Thread(
+            target=produce,
+            args=(index, source),
+            name=f'scan-root-{index}',
+            daemon=True,
+        )
+        for index, source in enumerate(sources)
+    ]
+    for thread in threads:
+        thread.start()
+
+    remaining = len(sources)
+    try:
+        while remaining:
+            index, item, error = results.get()
+            if item is _DONE:
+                remaining -= 1
+                if error is not None:
+                    raise error
+                continue
+            yield index, item
+    finally:
+        stop.set()
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5.0)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+Listing = tuple[list[str], list[str], list[str]]
+ListDirectory = Callable[[str], Optional[Listing]]
+
+
+def list_directory(path: str) -> Optional[Listing]:
+    subdirs: list[str] = []
+    files: list[str] = []
+    links: list[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            links.append(entry.name)
+                        else:
+                            subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return subdirs, files, links
+
+
+class ChildResolver:
+    def __init__(self, root: str, follow_symlinks: bool) -> None:
+        self.follow_symlinks = follow_symlinks
+        self.seen = {root} if follow_symlinks else set()
+
+    def children(self, path: str, listing: Listing) -> list[str]:
+        subdirs, _, links = listing
+        children = [os.path.join(path, name) for name in subdirs]
+        if not self.follow_symlinks:
+            return children
+        # Linked directories are canonicalised so that loops and trees
+        # reachable through several links are only walked once.
+        for name in links:
+            children.append(os.path.realpath(os.path.join(path, name)))
+        unseen = []
+        for child in children:
+            if child not in self.seen:
+                self.seen.add(child)
+                unseen.append(child)
+        return unseen
+
+
+def walk_directories(
+    root: str,
+    recursive: bool,
+    workers: int = 1,
+    list_dir: ListDirectory = list_directory,
+    follow_symlinks: bool = False,
+) -> Iterator[tuple[str, list[str]]]:
+    if not recursive:
+        listing = list_dir(root)
+        if listing is not None:
+            yield root, listing[1]
+        return
+
+    if follow_symlinks:
+        # Followed links are compared by real path, so the root has to be
+        # one too or a link back to it walks the tree a second time.
+        root = os.path.realpath(root)
+    resolver = ChildResolver(root, follow_symlinks)
+    if workers <= 1:
+        yield from _walk_serial(root, list_dir, resolver)
+    else:
+        yield from _walk_parallel(root, list_dir, resolver, workers)
+
+
+def _walk_serial(
+    root: str,
+    list_dir: ListDirectory,
+    resolver: ChildResolver,
+) -> Iterator[tuple[str, list[str]]]:
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        listing = list_dir(current)
+        if listing is None:
+            continue
+        yield current, listing[1]
+        stack.extend(reversed(resolver.children(current, listing)))
+
+
+def _walk_parallel(
+    root: str,
+    list_dir: ListDirectory,
+    resolver: ChildResolver,
+    workers: int,
+) -> Iterator[tuple[str, list[str]]]:
+    results: queue.SimpleQueue = queue.SimpleQueue()
+    stop = threading.Event()
+
+    def task(path: str) -> None:
+        if stop.is_set():
+            results.put((path, None, None))
+            return
+        try:
+            results.put((path, list_dir(path), None))
+        except BaseException as exc:
+            results.put((path, None, exc))
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    pool.submit(task, root)
+    outstanding = 1
+    try:
+        while outstanding:
+            path, listing, error = results.get()
+            outstanding -= 1
+            if error is not None:
+                raise error
+            if listing is None:
+                continue
+            for child in resolver.children(path, listing):
+                pool.submit(task, child)
+                outstanding += 1
+            yield path, listing[1]
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
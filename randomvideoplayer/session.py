@@ -0,0 +1,1239 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from dataclasses import replace
+from itertools import chain
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from randomvideoplayer.app_config import (
+    CACHE_FIELDS,
+    CONFIG_PATH,
+    DEDUP_INDEX_PATH,
+    FILTER_FIELDS,
+    LIVE_FIELDS,
+    LIBRARY_INDEX_PATH,
+    METADATA_CACHE_PATH,
+    PLAYBACK_STATE_PATH,
+    PREWARM_FIELDS,
+    AppConfig,
+)
+from randomvideoplayer.backoff import Backoff, restart_delay
+from randomvideoplayer.config_watcher import ConfigWatcher
+from randomvideoplayer.dedup import DedupIndex, find_duplicates
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.filters import MediaFilter, metadata_predicates
+from randomvideoplayer.history import PlaybackHistory, PlaybackTracker
+from randomvideoplayer.library_index import LibraryIndex
+from randomvideoplayer.metadata import MetadataCache
+from randomvideoplayer.metrics import (
+    DURATION_BUCKETS,
+    REGISTRY,
+    MetricsExporter,
+    counter,
+    gauge,
+    histogram,
+)
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError, make_ipc_address
+from randomvideoplayer.mpv_output import MpvOutputReader
+from randomvideoplayer.mpv_utils import (
+    CacheSettings,
+    build_mpv_command,
+    find_mpv_executable,
+    resolve_cache_settings,
+)
+from randomvideoplayer.path_table import PathTable
+from randomvideoplayer.playlist_builder import (
+    ScanCancelled,
+    ScanProgress,
+    add_batch,
+    build_path_table,
+    iter_webm_batches,
+    playlist_index,
+    read_playlist_table,
+    write_playlist_file,
+)
+from randomvideoplayer.playlist_cache import (
+    PlaylistCache,
+    cache_key,
+    library_signature,
+    scan_fingerprint,
+)
+from randomvideoplayer.prewarm import ClipPrewarmer
+from randomvideoplayer.profiling import Profiler
+from randomvideoplayer.resume import PlaybackState, StatePoller, load_state, seek_when_loaded
+from randomvideoplayer.roots import (
+    LibraryRoot,
+    RootMatcher,
+    library_roots,
+    merge_batches,
+    roots_key,
+)
+from randomvideoplayer.shuffle import RollingQueue, ShuffleScheduler, WeightedScheduler
+from randomvideoplayer.streaming import PlaylistStreamer
+from randomvideoplayer.watcher import LibraryWatcher, LivePlaylistUpdater
+
+StatusCallback = Callable[[str], None]
+ExitCallback = Callable[[int], None]
+ReadyCallback = Callable[[], None]
+ProgressCallback = Callable[[ScanProgress], None]
+
+START_SECONDS = histogram(
+    'start_seconds',
+    'Time from a start request until mpv is spawned',
+    DURATION_BUCKETS,
+)
+MPV_STARTS = counter('mpv_starts_total', 'mpv processes spawned')
+MPV_RESTARTS = counter('mpv_restarts_total', 'mpv processes restarted after a crash')
+MPV_EXITS = counter('mpv_exits_total', 'mpv processes that exited')
+MPV_ERRORS = counter('mpv_errors_total', 'Clips mpv failed to play')
+MPV_LOG_ERRORS = counter('mpv_log_errors_total', 'Error messages mpv sent over IPC')
+PLAYLIST_CACHE_HITS = counter('playlist_cache_hits_total', 'Starts that reused a cached playlist')
+PLAYLIST_CACHE_MISSES = counter('playlist_cache_misses_total', 'Starts that rebuilt the playlist')
+CLIPS_STARTED = counter('clips_started_total', 'Clips mpv started to open')
+CLIP_START_SECONDS = histogram(
+    'clip_start_seconds',
+    'Time from mpv opening a clip until playback begins',
+)
+
+
+class SessionError(Exception):
+    pass
+
+
+class SessionCancelled(SessionError):
+    pass
+
+
+class PlaybackSession:
+    def __init__(
+        self,
+        config: AppConfig,
+        on_status: Optional[StatusCallback] = None,
+        on_exit: Optional[ExitCallback] = None,
+        on_ipc_ready: Optional[ReadyCallback] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        self.config = config
+        self.on_status = on_status
+        self.on_exit = on_exit
+        self.on_ipc_ready = on_ipc_ready
+        self.progress = ScanProgress(on_update=on_progress)
+        self.lock = threading.Lock()
+
+        self.mpv_process: Optional[subprocess.Popen] = None
+        self.mpv_thread: Optional[threading.Thread] = None
+        self.feeder: Optional[PlaylistStreamer | RollingQueue] = None
+        self.ipc_client: Optional[MpvIpcClient] = None
+        self.watchers: list[LibraryWatcher] = []
+        self.updater: Optional[LivePlaylistUpdater] = None
+        self.ipc_failed = False
+        self.current_path: Optional[str] = None
+        self.app_logger: Optional[FileLogger] = None
+        self.playback_logger: Optional[FileLogger] = None
+        self.history: Optional[PlaybackHistory] = None
+        self.tracker: Optional[PlaybackTracker] = None
+        self.metadata: Optional[MetadataCache] = None
+        self.prewarmer: Optional[ClipPrewarmer] = None
+        self.config_watcher: Optional[ConfigWatcher] = None
+        self.media_filter: Optional[MediaFilter] = None
+        self.poller: Optional[StatePoller] = None
+        self.metrics_exporter: Optional[MetricsExporter] = None
+        self.clip_started: Optional[float] = None
+        self.resume: Optional[PlaybackState] = None
+        self.timings: dict[str, float] = {}
+        self.profiler = Profiler.from_config(config)
+
+        self.roots: list[LibraryRoot] = []
+        self.matcher = RootMatcher([])
+        self.library_key = ''
+        self.scan_done = True
+        self.scan_error: Optional[Exception] = None
+        self.playlist_path = Path()
+        self.mpv_playlist_path = Path()
+        self.mpv_executable = ''
+        self.cache: Optional[CacheSettings] = None
+        self.backoff = Backoff(
+            initial=config.restart_backoff_initial,
+            maximum=config.restart_backoff_max,
+        )
+        self.spawned_at = 0.0
+        self.restarts = 0
+        self.stop_event = threading.Event()
+        self.exited = threading.Event()
+        self.exit_code: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self.mpv_process is not None and self.mpv_process.poll() is None
+
+    def _log(self, message: str) -> None:
+        if self.app_logger is not None:
+            self.app_logger.log(message)
+
+    def set_status(self, text: str) -> None:
+        self._log(text)
+        if self.on_status is not None:
+            self.on_status(text)
+
+    def create_logger(self, enabled: bool, path: str) -> FileLogger:
+        return FileLogger(
+            enabled=enabled,
+            path=Path(path).expanduser() if enabled else None,
+            async_mode=self.config.log_async,
+            queue_size=self.config.log_queue_size,
+            batch_size=self.config.log_batch_size,
+            flush_interval=self.config.log_flush_interval,
+            overflow=self.config.log_overflow,
+        )
+
+    def open_loggers(self) -> None:
+        self.app_logger = self.create_logger(
+            self.config.logging_enabled,
+            self.config.logging_path,
+        )
+        self.playback_logger = self.create_logger(
+            self.config.playback_log_enabled,
+            self.config.playback_log_path,
+        )
+
+    def open_metrics(self) -> None:
+        if not self.config.metrics_enabled or self.metrics_exporter is not None:
+            return
+        json_path = self.config.metrics_json_path.strip()
+        exporter = MetricsExporter(
+            host=self.config.metrics_host,
+            port=self.config.metrics_port,
+            json_path=Path(json_path).expanduser() if json_path else None,
+            interval=self.config.metrics_interval,
+        )
+        for name, logger in (('app', self.app_logger), ('playback', self.playback_logger)):
+            if logger is None:
+                continue
+            labels = {'log': name}
+            gauge('log_queue_depth', 'Records waiting for the log writer', labels).set_function(
+                lambda logger=logger: len(logger.queue),
+            )
+            gauge('log_records_dropped', 'Records dropped by a full log queue', labels).set_function(
+                lambda logger=logger: logger.dropped,
+            )
+        try:
+            exporter.start()
+        except OSError as exc:
+            self._log(f'Metrics endpoint unavailable: {exc}')
+        self.metrics_exporter = exporter
+
+    def open_history(self) -> None:
+        if not self.config.history_enabled or self.history is not None:
+            return
+        try:
+            self.history = PlaybackHistory(
+                Path(self.config.history_path).expanduser(),
+                max_rows=self.config.history_max_rows,
+            )
+        except (OSError, sqlite3.Error) as exc:
+            self._log(f'Playback history unavailable: {exc}')
+
+    def open_media_filter(self) -> MediaFilter:
+        if self.media_filter is None:
+            if metadata_predicates(self.config) and self.metadata is None:
+                self.metadata = MetadataCache(
+                    METADATA_CACHE_PATH,
+                    workers=self.config.metadata_workers,
+                )
+            self.media_filter = MediaFilter.from_config(self.config, self.metadata)
+        return self.media_filter
+
+    def no_media_message(self) -> str:
+        config = self.config
+        names = list(config.extensions) or ['media']
+        if len(names) > 1:
+            names = [', '.join(names[:-1]), names[-1]]
+        message = f'No {" or ".join(names)} files found.'
+        filtered = (
+            config.include_globs
+            or config.exclude_globs
+            or config.min_size_mb > 0
+            or config.max_size_mb > 0
+            or config.min_age_days > 0
+            or config.max_age_days > 0
+            or metadata_predicates(config)
+        )
+        if filtered:
+            message += ' The configured filters may have excluded every file.'
+        return message
+
+    def resolve_roots(self) -> list[LibraryRoot]:
+        try:
+            roots = library_roots(self.config)
+        except (AttributeError, TypeError, ValueError) as exc:
+            raise SessionError(f'Invalid library roots: {exc}') from exc
+        if self.config.roots and self.config.directory.strip():
+            self._log('Library roots from the config override the video directory setting')
+        if len(roots) == 1 and not roots[0].path.is_dir():
+            raise SessionError(f'"{roots[0].path}" is not a directory.')
+        found = []
+        for root in roots:
+            if root.path.is_dir():
+                found.append(root)
+            else:
+                self._log(f'Skipping library root "{root.path}": not a directory')
+        if not found:
+            raise SessionError('No library directory found.')
+        self.roots = found
+        self.matcher = RootMatcher(found)
+        return found
+
+    def resolve_cache(self, roots: Sequence[LibraryRoot]) -> tuple[str, CacheSettings]:
+        # With several roots, mpv is sized for the slowest storage.
+        resolved = [
+            resolve_cache_settings(
+                root.path,
+                storage=self.config.storage_profile,
+                cache_secs=self.config.mpv_cache_secs,
+                readahead_secs=self.config.mpv_readahead_secs,
+                demuxer_max_mb=self.config.mpv_demuxer_max_mb,
+            )
+            for root in roots
+        ]
+        return max(resolved, key=lambda item: item[1].readahead_secs)
+
+    def iter_root_batches(
+        self,
+        roots: Sequence[LibraryRoot],
+        progress: Optional[ScanProgress] = None,
+    ) -> Iterator[tuple[int, tuple[str, list[str]]]]:
+        if progress is None:
+            progress = self.progress
+        index: Optional[LibraryIndex] = None
+        try:
+            if self.config.library_index_enabled:
+                index = LibraryIndex(LIBRARY_INDEX_PATH)
+            media_filter = self.open_media_filter()
+            progress.start()
+            batches = merge_batches([
+                iter_webm_batches(
+                    root.path,
+                    recursive=root.recursive,
+                    index=index,
+                    workers=self.config.scan_workers,
+                    follow_symlinks=self.config.follow_symlinks,
+                    progress=progress,
+                    media_filter=media_filter,
+                )
+                for root in roots
+            ])
+            yield from self.profiler.iterate('scan', batches)
+        finally:
+            if index is not None:
+                index.close()
+                self._log(
+                    f'Library index: {index.dirs_cached} directories cached, '
+                    f'{index.dirs_listed} listed',
+                )
+            if self.media_filter is not None and self.media_filter.rejected:
+                self._log(f'Filters rejected {self.media_filter.rejected} files')
+
+    def iter_library_batches(
+        self,
+        roots: Sequence[LibraryRoot],
+        progress: Optional[ScanProgress] = None,
+    ) -> Iterator[tuple[str, list[str]]]:
+        for _, batch in self.iter_root_batches(roots, progress):
+            yield batch
+
+    def iter_library_files(self, roots: Sequence[LibraryRoot]) -> Iterator[Path]:
+        for current, names in self.iter_library_batches(roots):
+            root_path = Path(current)
+            for name in names:
+                yield root_path / name
+
+    def build_table(self, roots: Sequence[LibraryRoot]) -> PathTable:
+        if len(roots) == 1:
+            table = build_path_table(self.iter_library_batches(roots))
+        else:
+            # Batches arrive interleaved; grouping them keeps the playlist
+            # in root order and identical between runs.
+            grouped: list[list[tuple[str, list[str]]]] = [[] for _ in roots]
+            for root_id, batch in self.iter_root_batches(roots):
+                grouped[root_id].append(batch)
+            table = build_path_table(chain.from_iterable(grouped))
+        if not self.config.dedup_enabled:
+            return table
+        self.set_status(f'Checking {len(table)} files for duplicates...')
+        index = DedupIndex(DEDUP_INDEX_PATH)
+        try:
+            with self.profiler.phase('dedup'):
+                redundant = find_duplicates(
+                    table,
+                    index=index,
+                    workers=self.config.scan_workers,
+                    log=self._log,
+                    cancel_event=self.progress.cancel_event,
+                )
+        finally:
+            index.close()
+        return table.without(redundant) if redundant else table
+
+    def write_playlist(self, table: PathTable, playlist_path: Path) -> int:
+        with self.profiler.phase('write_playlist'):
+            return write_playlist_file(table, playlist_path, logger=self.app_logger)
+
+    def create_scheduler(
+        self,
+        entries: PathTable,
+        complete: bool = True,
+    ) -> ShuffleScheduler | WeightedScheduler:
+        if len(self.roots) > 1 or not complete:
+            matcher = self.matcher
+            weights = [root.weight for root in self.roots]
+            if len(weights) > 1:
+                group_of: Callable[[int], int] = lambda index: matcher(entries.directory(index))
+            else:
+                # One group still gives a streaming scan wait_for and finish.
+                weights = [1.0]
+                group_of = lambda index: 0
+            return WeightedScheduler(
+                weights,
+                group_of,
+                count=len(entries),
+                no_repeat_window=self.config.shuffle_no_repeat_window,
+                loop=self.config.loop_playlist,
+                weight_horizon=self.config.shuffle_weight_horizon,
+                complete=complete,
+            )
+        return ShuffleScheduler(
+            len(entries),
+            no_repeat_window=self.config.shuffle_no_repeat_window,
+            loop=self.config.loop_playlist,
+            weight_horizon=self.config.shuffle_weight_horizon,
+        )
+
+    def create_shuffle_queue(
+        self,
+        table: PathTable,
+        playlist_path: Path,
+        first: Optional[str] = None,
+        scheduler: Optional[ShuffleScheduler | WeightedScheduler] = None,
+    ) -> tuple[RollingQueue, Path]:
+        if scheduler is None:
+            scheduler = self.create_scheduler(table)
+        if self.history is not None and self.config.shuffle_no_repeat_window > 0:
+            recent = self.history.recent_paths(self.config.shuffle_no_repeat_window)
+            found = table.find_many(recent)
+            scheduler.mark_played([found[path] for path in reversed(recent) if path in found])
+        queue = RollingQueue(
+            scheduler,
+            table,
+            queue_length=self.config.shuffle_queue_length,
+            logger=self.app_logger,
+        )
+        queue_path = playlist_path.with_name(
+            f'{playlist_path.stem}.queue{playlist_path.suffix}',
+        )
+        queue.write_initial(queue_path, first=first)
+        return queue, queue_path
+
+    def load_resume(self, key: str) -> Optional[PlaybackState]:
+        if not self.config.resume_on_start:
+            return None
+        state = load_state(PLAYBACK_STATE_PATH)
+        if state is None or state.directory != key or not os.path.isfile(state.path):
+            return None
+        return state
+
+    def playlist_cache_key(self, roots: Sequence[LibraryRoot]) -> Optional[str]:
+        if not self.config.playlist_cache_enabled or not self.config.library_index_enabled:
+            return None
+        fingerprint = scan_fingerprint(self.config, roots)
+        if fingerprint is None:
+            return None
+        try:
+            index = LibraryIndex(LIBRARY_INDEX_PATH)
+        except sqlite3.Error as exc:
+            self._log(f'Playlist cache unavailable: {exc}')
+            return None
+        try:
+            with self.profiler.phase('cache_key'):
+                signature = library_signature(
+                    index,
+                    roots,
+                    workers=self.config.scan_workers,
+                    cancel_event=self.progress.cancel_event,
+                )
+        finally:
+            index.close()
+        return cache_key(fingerprint, signature) if signature is not None else None
+
+    def cached_playlist(
+        self,
+        cache: PlaylistCache,
+        key: Optional[str],
+        first: Optional[str],
+        use_engine: bool,
+    ) -> Optional[tuple[int, Optional[RollingQueue], Path]]:
+        count = cache.lookup(key) if key is not None else None
+        if count is None:
+            return None
+        self._log(f'Reusing cached playlist {cache.playlist_path} with {count} entries')
+        PLAYLIST_CACHE_HITS.inc()
+        if not use_engine:
+            return count, None, cache.playlist_path
+        table = read_playlist_table(cache.playlist_path)
+        queue, queue_path = self.create_shuffle_queue(table, cache.playlist_path, first=first)
+        return len(table), queue, queue_path
+
+    def stream_shuffled(
+        self,
+        roots: Sequence[LibraryRoot],
+        playlist_path: Path,
+        cache: PlaylistCache,
+        key: Optional[str],
+        first: Optional[str],
+    ) -> tuple[int, RollingQueue, Path]:
+        if self.config.dedup_enabled:
+            self._log('Dedup needs the full library and is skipped while streaming')
+        table = PathTable()
+        scheduler = self.create_scheduler(table, complete=False)
+        self.scan_done = False
+        self.scan_error = None
+        threading.Thread(
+            target=self.fill_table,
+            args=(self.iter_library_batches(roots), table, scheduler, playlist_path, cache, key),
+            name='library-scan',
+            daemon=True,
+        ).start()
+        # Playback starts as soon as any root delivered enough clips; the
+        # rest join the shuffle while mpv is already playing.
+        count = scheduler.wait_for(self.config.stream_initial_count)
+        if self.progress.cancelled:
+            raise ScanCancelled('Scan cancelled')
+        if count == 0 and self.scan_error is not None:
+            raise self.scan_error
+        queue, queue_path = self.create_shuffle_queue(
+            table,
+            playlist_path,
+            first=first,
+            scheduler=scheduler,
+        )
+        return count, queue, queue_path
+
+    def fill_table(
+        self,
+        batches: Iterator[tuple[str, list[str]]],
+        table: PathTable,
+        scheduler: WeightedScheduler,
+        playlist_path: Path,
+        cache: PlaylistCache,
+        key: Optional[str],
+    ) -> None:
+        try:
+            for current, names in batches:
+                if self.stop_event.is_set():
+                    return
+                add_batch(table, current, names)
+                scheduler.extend(len(names))
+            count = self.write_playlist(table, playlist_path)
+            self._log(f'Library scan finished with {count} files')
+            if key is not None and count > 0:
+                cache.store(key, count)
+        except ScanCancelled:
+            self._log('Library scan cancelled')
+        except Exception as exc:
+            self.scan_error = exc
+            self._log(f'Library scan failed: {exc}')
+        finally:
+            batches.close()
+            scheduler.finish()
+            self.finish_scan()
+
+    def finish_scan(self) -> None:
+        with self.lock:
+            self.scan_done = True
+            watchers = list(self.watchers)
+        for watcher in watchers:
+            if watcher.thread is None:
+                watcher.start()
+
+    def build_playlist(
+        self,
+        roots: Sequence[LibraryRoot],
+        playlist_path: Path,
+        first: Optional[str] = None,
+    ) -> tuple[int, Optional[PlaylistStreamer | RollingQueue], Path]:
+        # Root weights are applied by the shuffle engine, so weighted
+        # libraries always use it and start playing while slow roots are
+        # still being scanned. The engine streams a single root as well.
+        weighted = len(roots) > 1 and self.config.shuffle
+        use_engine = self.config.shuffle and (self.config.shuffle_engine or weighted)
+        feeder: Optional[PlaylistStreamer | RollingQueue] = None
+        mpv_playlist_path = playlist_path
+        cache = PlaylistCache(playlist_path)
+        try:
+            # The key is taken before the scan: a directory that changes
+            # while it runs moves its mtime, so the next lookup misses
+            # instead of reusing a playlist that predates the change.
+            key = self.playlist_cache_key(roots)
+            cached = self.cached_playlist(cache, key, first, use_engine)
+            if cached is not None:
+                return cached
+            PLAYLIST_CACHE_MISSES.inc()
+            cache.invalidate()
+            streaming = self.config.streaming_launch or (weighted and not self.config.dedup_enabled)
+            if use_engine and streaming:
+                count, feeder, mpv_playlist_path = self.stream_shuffled(
+                    roots,
+                    playlist_path,
+                    cache,
+                    key,
+                    first,
+                )
+            elif self.config.streaming_launch and not use_engine:
+                if self.config.dedup_enabled:
+                    self._log('Dedup needs the full library and is skipped while streaming')
+                feeder = PlaylistStreamer(
+                    self.iter_library_files(roots),
+                    playlist_path,
+                    shuffle=self.config.shuffle,
+                    initial_count=self.config.stream_initial_count,
+                    lookahead=self.config.stream_lookahead,
+                    logger=self.app_logger,
+                )
+                count = feeder.write_initial()
+            else:
+                table = self.build_table(roots)
+                count = self.write_playlist(table, playlist_path)
+                if key is not None and count > 0:
+                    cache.store(key, count)
+                if use_engine and count > 0:
+                    feeder, mpv_playlist_path = self.create_shuffle_queue(
+                        table,
+                        playlist_path,
+                        first=first,
+                    )
+        except ScanCancelled as exc:
+            if feeder is not None:
+                feeder.stop()
+            self._log('Playlist build cancelled')
+            raise SessionCancelled('Cancelled') from exc
+        except Exception as exc:
+            if feeder is not None:
+                feeder.stop()
+            msg = f'Failed to write playlist: {exc}'
+            self._log(msg)
+            raise SessionError(msg) from exc
+        return count, feeder, mpv_playlist_path
+
+    def start(self) -> int:
+        self.profiler.start()
+        try:
+            with self.profiler.phase('start_playback'):
+                return self.start_playback()
+        finally:
+            self.write_profile()
+
+    def write_profile(self) -> None:
+        try:
+            path = self.profiler.write_report()
+        except OSError as exc:
+            self._log(f'Profile report failed: {exc}')
+            return
+        if path is not None:
+            self._log(f'Profile report written to {path}')
+
+    def start_playback(self) -> int:
+        if self.mpv_process is not None:
+            raise SessionError('mpv is already running.')
+        requested = time.perf_counter()
+
+        roots = self.resolve_roots()
+        playlist_path = Path(self.config.playlist_path).expanduser()
+
+        if self.app_logger is None:
+            self.open_loggers()
+        self.open_metrics()
+        self.open_history()
+
+        library = ', '.join(
+            f'{root.path} (weight={root.weight:g}, recursive={root.recursive})'
+            for root in roots
+        )
+        self._log(
+            f'Start playback with roots={library}, fullscreen={self.config.fullscreen}, '
+            f'loop={self.config.loop_playlist}, shuffle={self.config.shuffle}',
+        )
+
+        started = time.perf_counter()
+        try:
+            with self.profiler.phase('find_mpv'):
+                self.mpv_executable = find_mpv_executable(
+                    self.config.mpv_path.strip() or None,
+                )
+        except FileNotFoundError as exc:
+            self._log(str(exc))
+            raise SessionError(str(exc)) from exc
+        self.timings['find_mpv'] = time.perf_counter() - started
+
+        self.set_status('Building playlist...')
+
+        started = time.perf_counter()
+        self.library_key = roots_key(roots)
+        resume = self.load_resume(self.library_key)
+        with self.profiler.phase('build_playlist'):
+            count, feeder, mpv_playlist_path = self.build_playlist(
+                roots,
+                playlist_path,
+                first=resume.path if resume is not None else None,
+            )
+        self.timings['build_playlist'] = time.perf_counter() - started
+
+        if count == 0:
+            if feeder is not None:
+                feeder.stop()
+            raise SessionError(self.no_media_message())
+
+        self.playlist_path = playlist_path
+        self.mpv_playlist_path = mpv_playlist_path
+        storage, self.cache = self.resolve_cache(roots)
+        self._log(
+            f'Storage profile {storage}: cache={self.cache.cache_secs:g}s, '
+            f'readahead={self.cache.readahead_secs:g}s',
+        )
+
+        playlist_start: Optional[int] = None
+        if resume is not None and isinstance(feeder, PlaylistStreamer):
+            resume = None
+        elif resume is not None and feeder is None:
+            playlist_start = playlist_index(playlist_path, resume.path)
+            if playlist_start is None:
+                resume = None
+        if resume is not None:
+            self._log(f'Resuming {resume.path} at {resume.time_pos:.1f}s')
+
+        self.set_status(f'Starting mpv with {count} files...')
+        started = time.perf_counter()
+        with self.profiler.phase('spawn_mpv'):
+            self.spawn(feeder, mpv_playlist_path, resume, playlist_start)
+        self.timings['spawn_mpv'] = time.perf_counter() - started
+
+        if self.config.watch_library:
+            self.start_watchers(roots, playlist_path, feeder)
+        if self.config.config_reload:
+            self.config_watcher = ConfigWatcher(
+                CONFIG_PATH,
+                self.apply_config,
+                interval=self.config.config_reload_interval,
+                logger=self.app_logger,
+            )
+            self.config_watcher.start()
+        self.set_status('mpv running')
+        START_SECONDS.observe(time.perf_counter() - requested)
+        return count
+
+    def spawn(
+        self,
+        feeder: Optional[PlaylistStreamer | RollingQueue],
+        mpv_playlist_path: Path,
+        resume: Optional[PlaybackState] = None,
+        playlist_start: Optional[int] = None,
+    ) -> None:
+        use_engine = isinstance(feeder, RollingQueue)
+        # Resuming a shuffled playlist starts mpv in file order at the saved
+        # entry and shuffles over IPC, so the entry keeps playing.
+        reshuffle = self.config.shuffle and feeder is None and playlist_start is not None
+        ipc_address = make_ipc_address()
+        cmd = build_mpv_command(
+            mpv_executable=self.mpv_executable,
+            playlist_path=mpv_playlist_path,
+            fullscreen=self.config.fullscreen,
+            loop_playlist=self.config.loop_playlist and not use_engine,
+            shuffle=self.config.shuffle and feeder is None and not reshuffle,
+            ipc_server=ipc_address,
+            cache=self.cache,
+            playlist_start=playlist_start,
+        )
+
+        self._log(
+            f'Starting mpv: exe={self.mpv_executable}, playlist={mpv_playlist_path}',
+        )
+
+        # Cancel, stop and close take the same lock, so mpv is never spawned
+        # after the caller has given up on this session.
+        with self.lock:
+            try:
+                if self.progress.cancelled or self.stop_event.is_set():
+                    raise ScanCancelled('Scan cancelled')
+                self.mpv_process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+            except ScanCancelled as exc:
+                if feeder is not None:
+                    feeder.stop()
+                self._log('Playback start cancelled')
+                raise SessionCancelled('Cancelled') from exc
+            except Exception as exc:
+                msg = f'Failed to start mpv: {exc}'
+                self._log(msg)
+                self.mpv_process = None
+                if feeder is not None:
+                    feeder.stop()
+                raise SessionError(msg) from exc
+        self.spawned_at = time.monotonic()
+        MPV_STARTS.inc()
+
+        self.feeder = feeder
+        self.resume = resume
+        self.ipc_failed = False
+        self.current_path = None
+        self.ipc_client = MpvIpcClient(ipc_address, logger=self.app_logger)
+        if self.config.prewarm_enabled:
+            self.prewarmer = ClipPrewarmer(
+                self.config.prewarm_count,
+                self.config.prewarm_budget_mb * 1024 * 1024,
+                mode=self.config.prewarm_mode,
+                loop=self.config.loop_playlist and not use_engine,
+                logger=self.app_logger,
+            )
+        if self.config.state_poll_interval > 0:
+            self.poller = StatePoller(
+                PLAYBACK_STATE_PATH,
+                self.library_key,
+                self.config.state_poll_interval,
+                logger=self.app_logger,
+            )
+        threading.Thread(
+            target=self.connect_ipc,
+            args=(self.ipc_client, feeder, resume, reshuffle),
+            name='mpv-ipc-connect',
+            daemon=True,
+        ).start()
+
+        self.mpv_thread = threading.Thread(
+            target=self.read_mpv_output,
+            daemon=True,
+        )
+        self.mpv_thread.start()
+
+    def respawn(
+        self,
+        feeder: Optional[PlaylistStreamer | RollingQueue],
+        state: Optional[PlaybackState],
+    ) -> None:
+        if isinstance(feeder, RollingQueue):
+            queue = RollingQueue(
+                feeder.scheduler,
+                feeder.entries,
+                queue_length=self.config.shuffle_queue_length,
+                logger=self.app_logger,
+            )
+            queue.write_initial(
+                self.mpv_playlist_path,
+                first=state.path if state is not None else None,
+            )
+            self.spawn(queue, self.mpv_playlist_path, state)
+            return
+
+        if isinstance(feeder, PlaylistStreamer) and not feeder.scan_done:
+            # A streaming playlist is only complete once its scan finished.
+            self.set_status('Scan was interrupted, rebuilding playlist...')
+            try:
+                self.write_playlist(self.build_table(self.roots), self.playlist_path)
+            except ScanCancelled as exc:
+                raise SessionCancelled('Cancelled') from exc
+            except Exception as exc:
+                raise SessionError(f'Failed to write playlist: {exc}') from exc
+            for watcher in self.watchers:
+                if watcher.thread is None:
+                    watcher.start()
+
+        playlist_start = None
+        if state is not None:
+            playlist_start = playlist_index(self.playlist_path, state.path)
+        self.spawn(
+            None,
+            self.playlist_path,
+            state if playlist_start is not None else None,
+            playlist_start,
+        )
+
+    def supervise(self, code: int) -> bool:
+        if not self.config.supervise or self.stop_event.is_set():
+            return False
+        limit = self.config.restart_max_failures
+        delay = restart_delay(self.backoff, code, time.monotonic() - self.spawned_at, limit)
+        if delay is None:
+            if code != 0:
+                self._log(f'mpv failed {limit} times in a row, not restarting')
+            return False
+
+        state = self.poller.state if self.poller is not None else None
+        if state is None:
+            state = self.resume
+        resumed = self.resume
+        if (
+            state is not None
+            and resumed is not None
+            and self.backoff.failures > 1
+            and state.path == resumed.path
+        ):
+            # mpv died again before getting past the resumed clip.
+            self._log(f'Not resuming {state.path} again')
+            state = None
+        feeder = self.feeder
+        self.release_playback(wait=True)
+
+        self.set_status(f'mpv exited with code {code}, restarting in {delay:.1f}s...')
+        if self.stop_event.wait(delay):
+            return False
+        try:
+            self.respawn(feeder, state)
+        except SessionError as exc:
+            self._log(f'Restart failed: {exc}')
+            return False
+        self.restarts += 1
+        MPV_RESTARTS.inc()
+        self.set_status(f'mpv restarted ({self.restarts} restarts)')
+        return True
+
+    def start_watchers(
+        self,
+        roots: Sequence[LibraryRoot],
+        playlist_path: Path,
+        feeder: Optional[PlaylistStreamer | RollingQueue],
+    ) -> None:
+        queue = feeder if isinstance(feeder, RollingQueue) else None
+        self.updater = LivePlaylistUpdater(
+            playlist_path,
+            shuffle=self.config.shuffle,
+            table=queue.entries if queue is not None else None,
+            scheduler=queue.scheduler if queue is not None else None,
+            logger=self.app_logger,
+        )
+        watchers = [
+            LibraryWatcher(
+                root.path,
+                recursive=root.recursive,
+                on_change=self.updater.apply,
+                interval=self.config.watch_interval,
+                backend=self.config.watch_backend,
+                follow_symlinks=self.config.follow_symlinks,
+                index_path=LIBRARY_INDEX_PATH if self.config.library_index_enabled else None,
+                logger=self.app_logger,
+                media_filter=self.open_media_filter(),
+            )
+            for root in roots
+        ]
+        with self.lock:
+            self.watchers = watchers
+            deferred = not self.scan_done
+        if isinstance(feeder, PlaylistStreamer) and not feeder.scan_done:
+            feeder.on_finished = self.finish_scan
+        elif not deferred:
+            for watcher in watchers:
+                watcher.start()
+
+    def apply_config(self, changes: dict[str, Any]) -> None:
+        live = {name: value for name, value in changes.items() if name in LIVE_FIELDS}
+        pending = sorted(set(changes) - set(live))
+        if pending:
+            self._log(f'Config changes to {", ".join(pending)} apply on the next start')
+        if not live:
+            return
+        self.config = replace(self.config, **live)
+        self._log(f'Applying config changes: {", ".join(sorted(live))}')
+        if self.metadata is not None:
+            self.metadata.workers = self.config.metadata_workers
+        if live.keys() & CACHE_FIELDS:
+            self.apply_cache()
+        if live.keys() & PREWARM_FIELDS and self.prewarmer is not None:
+            self.prewarmer.resize(
+                self.config.prewarm_count,
+                self.config.prewarm_budget_mb * 1024 * 1024,
+            )
+        if live.keys() & FILTER_FIELDS:
+            self.apply_filters()
+
+    def apply_cache(self) -> None:
+        if not self.roots:
+            return
+        storage, self.cache = self.resolve_cache(self.roots)
+        client = self.ipc_client
+        if client is None or not client.connected:
+            return
+        try:
+            client.set_property('cache-secs', self.cache.cache_secs)
+            client.set_property('demuxer-readahead-secs', self.cache.readahead_secs)
+            if self.cache.demuxer_max_mb > 0:
+                client.set_property('demuxer-max-bytes', f'{self.cache.demuxer_max_mb}MiB')
+        except MpvIpcError as exc:
+            self._log(f'Failed to update mpv cache settings: {exc}')
+            return
+        self._log(
+            f'Storage profile {storage}: cache={self.cache.cache_secs:g}s, '
+            f'readahead={self.cache.readahead_secs:g}s',
+        )
+
+    def apply_filters(self) -> None:
+        self.media_filter = None
+        media_filter = self.open_media_filter()
+        with self.lock:
+            watchers = list(self.watchers)
+        for watcher in watchers:
+            watcher.media_filter = media_filter
+        feeder = self.feeder
+        # Only the shuffle engine can change entries mpv has not queued
+        # yet; an mpv-owned playlist picks the filters up on the next start.
+        if isinstance(feeder, RollingQueue) and isinstance(feeder.entries, PathTable):
+            threading.Thread(
+                target=self.refilter,
+                args=(feeder,),
+                name='refilter',
+                daemon=True,
+            ).start()
+        else:
+            self._log('Filter changes apply to the playlist on the next start')
+
+    def refilter(self, queue: RollingQueue) -> None:
+        # The library is scanned again so that a looser filter brings back
+        # files the playlist never had or has been skipping.
+        found = PathTable()
+        batches = self.iter_library_batches(self.roots, progress=ScanProgress())
+        try:
+            for current, names in batches:
+                if queue.stop_event.is_set():
+                    return
+                add_batch(found, current, names)
+        except Exception as exc:
+            self._log(f'Re-filtering the playlist failed: {exc}')
+            return
+        finally:
+            batches.close()
+        # Watchers add to the same table, so their updater's lock is held.
+        lock = self.updater.lock if self.updater is not None else self.lock
+        with lock:
+            table = queue.entries
+            scheduler = queue.scheduler
+            known = table.find_many(found)
+            kept = set(known.values())
+            dropped = [index for index in range(len(table)) if index not in kept]
+            for index in dropped:
+                scheduler.discard(index)
+            scheduler.restore(kept)
+            added = [entry for entry in found if entry not in known]
+            for entry in added:
+                directory, _, name = entry.rpartition('/')
+                table.add(table.add_directory(directory), name)
+                scheduler.add()
+        self._log(
+            f'Filters now skip {len(dropped)} of {len(table)} playlist entries, '
+            f'{len(added)} files added',
+        )
+
+    def connect_ipc(
+        self,
+        client: MpvIpcClient,
+        feeder: Optional[PlaylistStreamer | RollingQueue],
+        resume: Optional[PlaybackState] = None,
+        reshuffle: bool = False,
+    ) -> None:
+        process = self.mpv_process
+        try:
+            client.connect(alive=lambda: process is not None and process.poll() is None)
+            client.add_event_handler('end-file', self.on_end_file)
+            client.add_event_handler('log-message', self.on_log_message)
+            client.request_log_messages('error')
+            if REGISTRY.enabled:
+                client.add_event_handler('start-file', self.on_start_file)
+                client.add_event_handler('playback-restart', self.on_playback_restart)
+            if self.history is not None:
+                self.tracker = PlaybackTracker(self.history, logger=self.app_logger)
+                self.tracker.attach(client)
+            client.observe_property('path', self.on_path_change)
+            if self.updater is not None:
+                self.updater.attach(client)
+            if reshuffle:
+                client.command_nowait('playlist-shuffle')
+            if resume is not None:
+                seek_when_loaded(client, resume)
+        except MpvIpcError as exc:
+            self.ipc_failed = True
+            self._log(f'mpv IPC unavailable, falling back to output: {exc}')
+            if feeder is not None:
+                feeder.stop(wait=False)
+            return
+        if feeder is not None:
+            feeder.start(client)
+        if self.prewarmer is not None:
+            self.prewarmer.start(client)
+        if self.poller is not None:
+            self.poller.start(client)
+        if self.on_ipc_ready is not None:
+            self.on_ipc_ready()
+
+    def on_path_change(self, name: str, value: Any) -> None:
+        if not value:
+            return
+        self.current_path = value
+        if self.tracker is not None:
+            self.tracker.on_path(value)
+        if self.playback_logger is not None:
+            self.playback_logger.log(value)
+
+    def on_start_file(self, event: dict[str, Any]) -> None:
+        CLIPS_STARTED.inc()
+        self.clip_started = time.perf_counter()
+
+    def on_playback_restart(self, event: dict[str, Any]) -> None:
+        # Seeks also restart playback; only the first one after a file
+        # starts measures clip start latency.
+        started = self.clip_started
+        if started is not None:
+            self.clip_started = None
+            CLIP_START_SECONDS.observe(time.perf_counter() - started)
+
+    def on_end_file(self, event: dict[str, Any]) -> None:
+        if event.get('reason') == 'error':
+            MPV_ERRORS.inc()
+            self._log(
+                f'mpv: failed to play {self.current_path}: '
+                f'{event.get("file_error", "unknown error")}',
+            )
+
+    def on_log_message(self, event: dict[str, Any]) -> None:
+        text = str(event.get('text', '')).strip()
+        MPV_LOG_ERRORS.inc()
+        self._log(f'mpv: [{event.get("prefix", "")}] {text}')
+
+    def cancel(self) -> None:
+        with self.lock:
+            self.progress.cancel()
+
+    def toggle_pause(self) -> None:
+        if self.ipc_client is None:
+            return
+        try:
+            self.ipc_client.toggle_pause()
+        except MpvIpcError as exc:
+            self._log(f'Pause failed: {exc}')
+
+    def skip(self) -> None:
+        if self.ipc_client is None:
+            return
+        try:
+            self.ipc_client.skip()
+        except MpvIpcError as exc:
+            self._log(f'Skip failed: {exc}')
+
+    def read_mpv_output(self) -> None:
+        assert self.mpv_process is not None
+        proc = self.mpv_process
+        if proc.stdout is None:
+            return
+
+        # Output is only parsed when IPC is down; otherwise it is just
+        # drained so mpv never blocks on a full pipe.
+        reader = MpvOutputReader(
+            self.on_output_error,
+            self.on_output_playing,
+            parse=lambda: self.ipc_failed,
+            error_rate=self.config.mpv_error_log_rate,
+            error_burst=self.config.mpv_error_log_burst,
+        )
+        reader.run(proc.stdout)
+
+        code = proc.wait()
+        MPV_EXITS.inc()
+        self._log(f'mpv exited with code {code}')
+        if self.supervise(code):
+            return
+        self.exit_code = code
+        self.exited.set()
+        if self.on_exit is not None:
+            self.on_exit(code)
+
+    def on_output_error(self, line: str) -> None:
+        self._log(f'mpv: {line}')
+
+    def on_output_playing(self, path: str) -> None:
+        if self.playback_logger is not None:
+            self.playback_logger.log(path)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        if self.mpv_thread is None or not self.exited.wait(timeout):
+            return None
+        return self.exit_code
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        with self.lock:
+            if self.mpv_process is None:
+                return
+            self._log('Stop playback requested by user')
+            try:
+                self.mpv_process.terminate()
+            except Exception:
+                pass
+
+    def release(self, wait: bool = True) -> None:
+        self.mpv_process = None
+        if self.config_watcher is not None:
+            self.config_watcher.stop(wait=wait)
+            self.config_watcher = None
+        with self.lock:
+            watchers = self.watchers
+            self.watchers = []
+        for watcher in watchers:
+            watcher.stop(wait=wait)
+        self.updater = None
+        self.release_playback(wait)
+
+    def release_playback(self, wait: bool = True) -> None:
+        if self.poller is not None:
+            self.poller.stop(wait=wait)
+            self.poller = None
+        if self.tracker is not None:
+            self.tracker.close()
+            self.tracker = None
+        if self.prewarmer is not None:
+            self.prewarmer.stop(wait=wait)
+            self.prewarmer = None
+        if self.feeder is not None:
+            self.feeder.stop(wait=wait)
+            self.feeder = None
+        if self.ipc_client is not None:
+            self.ipc_client.close()
+            self.ipc_client = None
+
+    def close(self) -> None:
+        self.stop_event.set()
+        with self.lock:
+            self.progress.cancel()
+            if self.mpv_process is not None:
+                try:
+                    self.mpv_process.terminate()
+                except Exception:
+                    pass
+        self.release(wait=True)
+        if self.profiler.phases:
+            # Background scans may have finished after the start report.
+            self.write_profile()
+        self.profiler.close()
+        if self.app_logger is not None:
+            self.app_logger.close()
+        if self.playback_logger is not None:
+            self.playback_logger.close()
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        if self.metadata is not None:
+            self.metadata.close()
+            self.metadata = None
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()
+            self.metrics_exporter = None
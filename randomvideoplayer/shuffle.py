@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import random
+import threading
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError
+
+MAX_WEIGHT_TRIES = 64
+
+
+class ShuffleScheduler:
+    def __init__(
+        self,
+        count: int = 0,
+        no_repeat_window: int = 0,
+        loop: bool = True,
+        weight_horizon: int = 0,
+        min_weight: float = 0.05,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.available = array('I', range(count))
+        self.last_played = array('I', bytes(4 * count))
+        self.recent: deque[int] = deque()
+        self.removed: set[int] = set()
+        self.lock = threading.Lock()
+        self.no_repeat_window = max(0, no_repeat_window)
+        self.loop = loop
+        self.weight_horizon = max(0, weight_horizon)
+        self.min_weight = min(1.0, max(0.001, min_weight))
+        self.rng = rng or random.Random()
+        self.tick = 0
+
+    def __len__(self) -> int:
+        return len(self.last_played)
+
+    def add(self) -> int:
+        with self.lock:
+            index = len(self.last_played)
+            self.last_played.append(0)
+            self.available.append(index)
+            return index
+
+    def extend(self, count: int) -> int:
+        with self.lock:
+            start = len(self.last_played)
+            self.last_played.frombytes(bytes(4 * count))
+            self.available.extend(range(start, start + count))
+            return start
+
+    def discard(self, index: int) -> None:
+        with self.lock:
+            if 0 <= index < len(self.last_played):
+                self.removed.add(index)
+
+    def restore(self, indices: Iterable[int]) -> None:
+        with self.lock:
+            back = self.removed.intersection(indices)
+            if not back:
+                return
+            self.removed -= back
+            # Discarded entries leave the pool lazily, so only those that
+            # are already gone from it are put back.
+            pooled = set(self.available)
+            pooled.update(self.recent)
+            self.available.extend(index for index in sorted(back) if index not in pooled)
+
+    def mark_played(self, indices: Sequence[int]) -> None:
+        with self.lock:
+            played = [i for i in indices if 0 <= i < len(self.last_played)]
+            if not played:
+                return
+            for index in played:
+                self.tick += 1
+                self.last_played[index] = self.tick
+            if not self.loop:
+                # Without looping the held entries never come back in this
+                # run, so only as many as the repeat window allows are held.
+                window = self._window()
+                played = played[-window:] if window else []
+            held = set(played)
+            self.available = array('I', [i for i in self.available if i not in held])
+            if not self.loop:
+                return
+            self.recent.extend(played)
+            window = self._window()
+            while len(self.recent) > window:
+                self._release(self.recent.popleft())
+
+    def _window(self) -> int:
+        # Holding back more than half the library would make the tail of
+        # the order predictable, so the window is capped.
+        return min(self.no_repeat_window, len(self.last_played) // 2)
+
+    def _weight(self, index: int) -> float:
+        last = self.last_played[index]
+        if last == 0:
+            return 1.0
+        age = self.tick - last
+        return max(self.min_weight, min(1.0, age / self.weight_horizon))
+
+    def _pick_slot(self) -> int:
+        size = len(self.available)
+        slot = self.rng.randrange(size)
+        if self.weight_horizon == 0:
+            return slot
+        for _ in range(MAX_WEIGHT_TRIES):
+            if self.rng.random() < self._weight(self.available[slot]):
+                break
+            slot = self.rng.randrange(size)
+        return slot
+
+    def _release(self, index: int) -> None:
+        if index not in self.removed:
+            self.available.append(index)
+
+    def next(self) -> Optional[int]:
+        with self.lock:
+            while True:
+                if not self.available:
+                    if not self.loop or not self.recent:
+                        return None
+                    self._release(self.recent.popleft())
+                    continue
+
+                slot = self._pick_slot()
+                index = self.available[slot]
+                self.available[slot] = self.available[-1]
+                self.available.pop()
+                if index not in self.removed:
+                    break
+
+            self.tick += 1
+            self.last_played[index] = self.tick
+            if self.loop:
+                self.recent.append(index)
+                window = self._window()
+                while len(self.recent) > window:
+                    self._release(self.recent.popleft())
+            return index
+
+
+class WeightedScheduler:
+    def __init__(
+        self,
+        weights: Sequence[float],
+        group_of: Callable[[int], int],
+        count: int = 0,
+        no_repeat_window: int = 0,
+        loop: bool = True,
+        weight_horizon: int = 0,
+        complete: bool = True,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.rng = rng or random.Random()
+        self.weights = [max(0.0, weight) for weight in weights]
+        # Each group shuffles its own entries, so a group's share of plays
+        # follows its weight rather than its size.
+        self.groups = [
+            ShuffleScheduler(
+                no_repeat_window=no_repeat_window,
+                loop=loop,
+                weight_horizon=weight_horizon,
+                rng=self.rng,
+            )
+            for _ in self.weights
+        ]
+        self.members = [array('I') for _ in self.weights]
+        self.group_ids = array('H')
+        self.local_ids = array('I')
+        self.group_of = group_of
+        self.cond = threading.Condition()
+        self.complete = complete
+        self.extend(count)
+
+    def __len__(self) -> int:
+        return len(self.group_ids)
+
+    def extend(self, count: int) -> None:
+        with self.cond:
+            start = len(self.group_ids)
+            new_groups = [self.group_of(index) for index in range(start, start + count)]
+            counts = [0] * len(self.groups)
+            for group in new_groups:
+                counts[group] += 1
+            next_local = [
+                self.groups[group].extend(counts[group]) if counts[group] else 0
+                for group in range(len(self.groups))
+            ]
+            for index, group in enumerate(new_groups, start):
+                self.group_ids.append(group)
+                self.local_ids.append(next_local[group])
+                next_local[group] += 1
+                self.members[group].append(index)
+            self.cond.notify_all()
+
+    def add(self) -> int:
+        self.extend(1)
+        return len(self.group_ids) - 1
+
+    def discard(self, index: int) -> None:
+        if 0 <= index < len(self.group_ids):
+            self.groups[self.group_ids[index]].discard(self.local_ids[index])
+
+    def restore(self, indices: Iterable[int]) -> None:
+        restored: list[list[int]] = [[] for _ in self.groups]
+        for index in indices:
+            if 0 <= index < len(self.group_ids):
+                restored[self.group_ids[index]].append(self.local_ids[index])
+        for group, local in zip(self.groups, restored):
+            if local:
+                group.restore(local)
+
+    def mark_played(self, indices: Sequence[int]) -> None:
+        played: list[list[int]] = [[] for _ in self.groups]
+        for index in indices:
+            if 0 <= index < len(self.group_ids):
+                played[self.group_ids[index]].append(self.local_ids[index])
+        for group, local in zip(self.groups, played):
+            if local:
+                group.mark_played(local)
+
+    def finish(self) -> None:
+        with self.cond:
+            self.complete = True
+            self.cond.notify_all()
+
+    def wait_for(self, count: int, timeout: Optional[float] = None) -> int:
+        with self.cond:
+            self.cond.wait_for(
+                lambda: len(self.group_ids) >= count or self.complete,
+                timeout,
+            )
+            return len(self.group_ids)
+
+    def _pick_group(self, skipped: set[int]) -> Optional[int]:
+        eligible = [
+            (group, weight)
+            for group, weight in enumerate(self.weights)
+            if weight > 0 and group not in skipped and len(self.groups[group]) > 0
+        ]
+        if not eligible:
+            return None
+        target = self.rng.random() * sum(weight for _, weight in eligible)
+        for group, weight in eligible:
+            target -= weight
+            if target < 0:
+                return group
+        return eligible[-1][0]
+
+    def next(self) -> Optional[int]:
+        with self.cond:
+            while True:
+                skipped: set[int] = set()
+                while True:
+                    group = self._pick_group(skipped)
+                    if group is None:
+                        break
+                    local = self.groups[group].next()
+                    if local is not None:
+                        return self.members[group][local]
+                    skipped.add(group)
+                if self.complete:
+                    return None
+                # A streaming scan may still deliver entries for empty groups.
+                self.cond.wait(0.5)
+
+
+class RollingQueue:
+    def __init__(
+        self,
+        scheduler: ShuffleScheduler | WeightedScheduler,
+        entries: Sequence[str],
+        queue_length: int,
+        logger: Optional[FileLogger] = None,
+        keep_history: int = 2,
+        trim_threshold: int = 32,
+    ) -> None:
+        self.scheduler = scheduler
+        self.entries = entries
+        self.queue_length = max(1, queue_length)
+        self.logger = logger
+        self.keep_history = max(1, keep_history)
+        self.trim_threshold = max(self.keep_history + 1, trim_threshold)
+        self.exhausted = False
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def _next_entry(self) -> Optional[str]:
+        index = self.scheduler.next()
+        if index is None:
+            self.exhausted = True
+            return None
+        return self.entries[index]
+
+    def write_initial(self, queue_path: Path, first: Optional[str] = None) -> int:
+        initial: list[str] = [first] if first is not None else []
+        while len(initial) <= self.queue_length:
+            entry = self._next_entry()
+            if entry is None:
+                break
+            initial.append(entry)
+        queue_path.parent.mkdir(parents=True, exist_ok=True)
+        with queue_path.open('w', encoding='utf-8') as f:
+            for entry in initial:
+                f.write(entry + '\n')
+        return len(initial)
+
+    def start(self, client: MpvIpcClient) -> None:
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(client,),
+            name='rolling-queue',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def _on_position(self, name: str, value: Any) -> None:
+        self.wake.set()
+
+    def _run(self, client: MpvIpcClient) -> None:
+        try:
+            client.observe_property('playlist-pos', self._on_position)
+            while not self.stop_event.is_set():
+                self.wake.wait()
+                self.wake.clear()
+                if self.stop_event.is_set():
+                    break
+                self._refill(client)
+        except MpvIpcError as exc:
+            self._log(f'Shuffle queue stopped: {exc}')
+        except Exception as exc:
+            self._log(f'Shuffle queue failed: {exc}')
+        finally:
+            self._close_entries()
+
+    def _close_entries(self) -> None:
+        close = getattr(self.entries, 'close', None)
+        if close is not None:
+            close()
+
+    def _refill(self, client: MpvIpcClient) -> None:
+        position = client.get_property('playlist-pos')
+        count = client.get_property('playlist-count')
+        if not isinstance(position, int) or position < 0:
+            return
+
+        ahead = count - position - 1
+        while ahead < self.queue_length and not self.exhausted:
+            entry = self._next_entry()
+            if entry is None:
+                break
+            client.command_nowait('loadfile', entry, 'append')
+            ahead += 1
+
+        if position >= self.trim_threshold:
+            for _ in range(position - self.keep_history):
+                client.command_nowait('playlist-remove', 0)
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is None:
+            self._close_entries()
+            return
+        if wait and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
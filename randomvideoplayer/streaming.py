@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import random
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError
+from randomvideoplayer.playlist_builder import PLAYLIST_HEADER, playlist_entry
+
+
+class PlaylistStreamer:
+    def __init__(
+        self,
+        files: Iterable[Path],
+        playlist_path: Path,
+        shuffle: bool,
+        initial_count: int,
+        lookahead: int,
+        logger: Optional[FileLogger] = None,
+        on_finished: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.files: Iterator[Path] = iter(files)
+        self.on_finished = on_finished
+        self.playlist_path = playlist_path
+        self.shuffle = shuffle
+        self.initial_count = max(1, initial_count)
+        self.lookahead = max(1, lookahead)
+        self.logger = logger
+        self.rng = random.Random()
+        self.playlist_file: Optional[TextIO] = None
+        self.pending: list[str] = []
+        self.sent = 0
+        self.count = 0
+        self.position = 0
+        self.scan_done = False
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.client: Optional[MpvIpcClient] = None
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def _add(self, entry: str) -> None:
+        assert self.playlist_file is not None
+        self.playlist_file.write(entry + '\n')
+        self.count += 1
+        self.pending.append(entry)
+        if self.shuffle:
+            # Inside-out Fisher-Yates: the pending pool stays a uniform
+            # permutation of everything discovered so far.
+            j = self.rng.randrange(len(self.pending))
+            self.pending[-1], self.pending[j] = self.pending[j], self.pending[-1]
+
+    def write_initial(self) -> int:
+        self._log(f'Streaming playlist at {self.playlist_path}')
+        initial: list[str] = []
+        for path in self.files:
+            initial.append(playlist_entry(path))
+            if len(initial) >= self.initial_count:
+                break
+        else:
+            self.scan_done = True
+        if self.shuffle:
+            self.rng.shuffle(initial)
+
+        self.playlist_path.parent.mkdir(parents=True, exist_ok=True)
+        self.playlist_file = self.playlist_path.open('w', encoding='utf-8')
+        self.playlist_file.write(PLAYLIST_HEADER)
+        for entry in initial:
+            self.playlist_file.write(entry + '\n')
+        self.playlist_file.flush()
+        self.count = self.sent = len(initial)
+        self._log(f'Initial playlist has {self.count} entries')
+        if self.scan_done:
+            self._close_files()
+        return self.count
+
+    def start(self, client: MpvIpcClient) -> None:
+        if self.scan_done:
+            return
+        self.client = client
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(client,),
+            name='playlist-streamer',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def _on_position(self, name: str, value: Any) -> None:
+        if isinstance(value, int) and value >= 0:
+            self.position = value
+
+    def _run(self, client: MpvIpcClient) -> None:
+        observer_id: Optional[int] = None
+        try:
+            if self.shuffle:
+                observer_id = client.observe_property(
+                    'playlist-pos',
+                    self._on_position,
+                )
+            self._stream(client)
+            self._log(
+                f'Streaming finished: {self.count} entries discovered, '
+                f'{self.sent} sent to mpv',
+            )
+        except MpvIpcError as exc:
+            self._log(f'Playlist streaming stopped: {exc}')
+        except Exception as exc:
+            self._log(f'Playlist streaming failed: {exc}')
+        finally:
+            self._close_files()
+            if observer_id is not None and client.connected:
+                try:
+                    client.unobserve_property(observer_id)
+                except MpvIpcError:
+                    pass
+            self.client = None
+
+    def _stream(self, client: MpvIpcClient) -> None:
+        for path in self.files:
+            if self.stop_event.is_set():
+                return
+            self._add(playlist_entry(path))
+            if not self.shuffle:
+                self._send_pending(client, len(self.pending))
+                continue
+            queued = self.sent - self.position - 1
+            if queued < self.lookahead:
+                self._send_pending(client, self.lookahead - queued)
+        self.scan_done = True
+        self._close_files()
+        if not self.stop_event.is_set():
+            self._send_pending(client, len(self.pending))
+            # mpv handles commands in order, so one round trip confirms
+            # that every append was processed.
+            client.get_property('playlist-count', timeout=30.0)
+            if self.on_finished is not None:
+                self.on_finished()
+
+    def _send_pending(self, client: MpvIpcClient, limit: int) -> None:
+        while self.pending and limit > 0:
+            entry = self.pending.pop()
+            client.command_nowait('loadfile', entry, 'append')
+            if self.shuffle:
+                # Each entry lands at a random upcoming slot, so the unplayed
+                # tail stays a uniform shuffle instead of following discovery
+                # order, and loop-playlist repeats that order.
+                target = self.rng.randint(min(self.position + 1, self.sent), self.sent)
+                if target < self.sent:
+                    client.command_nowait('playlist-move', self.sent, target)
+            self.sent += 1
+            limit -= 1
+
+    def _close_files(self) -> None:
+        close = getattr(self.files, 'close', None)
+        if close is not None:
+            close()
+        if self.playlist_file is not None:
+            self.playlist_file.close()
+            self.playlist_file = None
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        if self.thread is None:
+            self._close_files()
+            return
+        if wait and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
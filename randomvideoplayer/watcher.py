@@ -0,0 +1,434 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import platform
+import random
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from randomvideoplayer.file_logger import FileLogger
+from randomvideoplayer.filters import MediaFilter
+from randomvideoplayer.library_index import MTIME_SETTLE_NS, LibraryIndex
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError
+from randomvideoplayer.path_table import PathTable
+from randomvideoplayer.playlist_builder import (
+    DEFAULT_FILTER,
+    append_playlist_entries,
+    playlist_entry,
+    remove_playlist_entries,
+)
+from randomvideoplayer.scanner import ChildResolver, ListDirectory, list_directory
+from randomvideoplayer.shuffle import ShuffleScheduler, WeightedScheduler
+
+ChangeCallback = Callable[[list[str], list[str]], None]
+
+SEPARATOR = '\0'
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class _DirState:
+    __slots__ = ('mtime_ns', 'subdirs', 'names')
+
+    def __init__(self, mtime_ns: int, subdirs: list[str], names: list[str]) -> None:
+        self.mtime_ns = mtime_ns
+        self.subdirs = SEPARATOR.join(subdirs)
+        self.names = SEPARATOR.join(names)
+
+    def subdir_set(self) -> set[str]:
+        return set(self.subdirs.split(SEPARATOR)) if self.subdirs else set()
+
+    def name_set(self) -> set[str]:
+        return set(self.names.split(SEPARATOR)) if self.names else set()
+
+
+def _entry(directory: str, name: str) -> str:
+    return playlist_entry(os.path.join(directory, name))
+
+
+def _stat_mtime(path: str) -> Optional[int]:
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if time.time_ns() - mtime_ns < MTIME_SETTLE_NS:
+        return -1
+    return mtime_ns
+
+
+class _Inotify:
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.rm_watch = libc.inotify_rm_watch
+        self.rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths: dict[int, str] = {}
+        self.wds: dict[str, int] = {}
+
+    def watch(self, path: str) -> None:
+        wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            raise OSError(err, f'inotify_add_watch failed for "{path}": {os.strerror(err)}')
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def forget(self, path: str) -> None:
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list[tuple[str, int, str]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events: list[tuple[str, int, str]] = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            raw_name = data[offset : offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append(('', mask, ''))
+                continue
+            path = self.paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                self.wds.pop(path, None)
+                continue
+            events.append((path, mask, os.fsdecode(raw_name)))
+        return events
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class LibraryWatcher:
+    def __init__(
+        self,
+        directory: Path,
+        recursive: bool,
+        on_change: ChangeCallback,
+        interval: float = 2.0,
+        backend: str = 'auto',
+        follow_symlinks: bool = False,
+        index_path: Optional[Path] = None,
+        logger: Optional[FileLogger] = None,
+        media_filter: Optional[MediaFilter] = None,
+    ) -> None:
+        self.root = os.path.realpath(directory)
+        self.media_filter = media_filter or DEFAULT_FILTER
+        self.recursive = recursive
+        self.on_change = on_change
+        self.interval = max(0.2, interval)
+        self.backend = backend
+        self.follow_symlinks = follow_symlinks
+        self.index_path = index_path
+        self.logger = logger
+        self.states: dict[str, _DirState] = {}
+        self.resolver = ChildResolver(self.root, follow_symlinks)
+        self.inotify: Optional[_Inotify] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self._run,
+            name='library-watcher',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self.stop_event.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def _run(self) -> None:
+        try:
+            self._load_snapshot()
+            if self.stop_event.is_set():
+                return
+            if self.backend in ('auto', 'inotify') and platform.system() == 'Linux':
+                try:
+                    self._start_inotify()
+                except OSError as exc:
+                    self._close_inotify()
+                    self._log(f'inotify unavailable, polling instead: {exc}')
+            self._log(
+                f'Watching {len(self.states)} directories under {self.root} '
+                f'({"inotify" if self.inotify is not None else "polling"})',
+            )
+            if self.inotify is not None:
+                self._poll_once()
+                self._inotify_loop()
+            else:
+                self._poll_loop()
+        except Exception as exc:
+            self._log(f'Library watcher failed: {exc}')
+        finally:
+            self._close_inotify()
+
+    def _load_snapshot(self) -> None:
+        index: Optional[LibraryIndex] = None
+        list_dir: ListDirectory = list_directory
+        if self.index_path is not None:
+            index = LibraryIndex(self.index_path)
+            list_dir = index.list_directory
+        try:
+            self._walk(self.root, list_dir, None)
+        finally:
+            if index is not None:
+                index.close()
+
+    def _walk(
+        self,
+        directory: str,
+        list_dir: ListDirectory,
+        added: Optional[list[str]],
+    ) -> None:
+        stack = [directory]
+        while stack and not self.stop_event.is_set():
+            current = stack.pop()
+            if self.inotify is not None:
+                self.inotify.watch(current)
+            mtime_ns = _stat_mtime(current)
+            listing = list_dir(current)
+            if mtime_ns is None or listing is None:
+                continue
+            subdirs, files, _ = listing
+            names = self.media_filter.filter_batch(current, files)
+            self.states[current] = _DirState(mtime_ns, subdirs, names)
+            if added is not None:
+                added.extend(_entry(current, name) for name in names)
+            if self.recursive:
+                stack.extend(self.resolver.children(current, listing))
+
+    def _drop_tree(self, directory: str, removed: list[str]) -> None:
+        prefix = directory + os.sep
+        for path in [p for p in self.states if p == directory or p.startswith(prefix)]:
+            state = self.states.pop(path)
+            removed.extend(_entry(path, name) for name in state.name_set())
+            self.resolver.seen.discard(path)
+            if self.inotify is not None:
+                self.inotify.forget(path)
+
+    def _rescan_directory(self, path: str, added: list[str], removed: list[str]) -> None:
+        state = self.states.get(path)
+        if state is None:
+            return
+        mtime_ns = _stat_mtime(path)
+        listing = list_directory(path) if mtime_ns is not None else None
+        if listing is None:
+            self._drop_tree(path, removed)
+            return
+        subdirs, files, _ = listing
+        names = self.media_filter.filter_batch(path, files)
+        old_names = state.name_set()
+        new_names = set(names)
+        added.extend(_entry(path, name) for name in new_names - old_names)
+        removed.extend(_entry(path, name) for name in old_names - new_names)
+
+        old_subdirs = state.subdir_set()
+        self.states[path] = _DirState(mtime_ns, subdirs, names)
+        if not self.recursive:
+            return
+        for name in old_subdirs - set(subdirs):
+            self._drop_tree(os.path.join(path, name), removed)
+        for child in self.resolver.children(path, listing):
+            if child not in self.states:
+                self._walk(child, list_directory, added)
+
+    def _emit(self, added: list[str], removed: list[str]) -> None:
+        if not added and not removed:
+            return
+        self._log(f'Library changed: {len(added)} added, {len(removed)} removed')
+        try:
+            self.on_change(added, removed)
+        except Exception as exc:
+            self._log(f'Applying library changes failed: {exc}')
+
+    def _poll_once(self) -> None:
+        added: list[str] = []
+        removed: list[str] = []
+        for path, state in list(self.states.items()):
+            if self.stop_event.is_set():
+                return
+            if path not in self.states:
+                continue
+            if state.mtime_ns == -1 or _stat_mtime(path) != state.mtime_ns:
+                self._rescan_directory(path, added, removed)
+        self._emit(added, removed)
+
+    def _poll_loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self._poll_once()
+
+    def _start_inotify(self) -> None:
+        self.inotify = _Inotify()
+        for path in list(self.states):
+            self.inotify.watch(path)
+
+    def _close_inotify(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _inotify_loop(self) -> None:
+        assert self.inotify is not None
+        dirty: set[str] = set()
+        deadline: Optional[float] = None
+        while not self.stop_event.is_set():
+            timeout = 0.5 if deadline is None else max(0.0, deadline - time.monotonic())
+            for path, mask, name in self.inotify.read(timeout):
+                if not path:
+                    dirty.update(self.states)
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    dirty.add(os.path.dirname(path))
+                elif mask & IN_ISDIR or self.media_filter.match_name(name):
+                    dirty.add(path)
+                if deadline is None and dirty:
+                    # Events are coalesced briefly so that bulk copies
+                    # produce one change notification.
+                    deadline = time.monotonic() + 0.5
+            if deadline is not None and time.monotonic() >= deadline:
+                added: list[str] = []
+                removed: list[str] = []
+                for path in sorted(dirty):
+                    if path in self.states:
+                        self._rescan_directory(path, added, removed)
+                dirty.clear()
+                deadline = None
+                self._emit(added, removed)
+
+
+class LivePlaylistUpdater:
+    def __init__(
+        self,
+        playlist_path: Path,
+        shuffle: bool,
+        table: Optional[PathTable] = None,
+        scheduler: Optional[ShuffleScheduler | WeightedScheduler] = None,
+        logger: Optional[FileLogger] = None,
+    ) -> None:
+        self.playlist_path = playlist_path
+        self.shuffle = shuffle
+        self.table = table
+        self.scheduler = scheduler
+        self.logger = logger
+        self.client: Optional[MpvIpcClient] = None
+        self.rng = random.Random()
+        # Each library root has its own watcher thread; their changes go
+        # through here one at a time, since the PathTable and the playlist
+        # file edits are not safe to interleave.
+        self.lock = threading.Lock()
+
+    def attach(self, client: MpvIpcClient) -> None:
+        self.client = client
+
+    def apply(self, added: list[str], removed: list[str]) -> None:
+        with self.lock:
+            self._apply(added, removed)
+
+    def _remove_from_mpv(self, client: MpvIpcClient, removed: set[str]) -> None:
+        # mpv's order differs from the file once entries were shuffled or
+        # moved, so indices come from its own playlist. The clip that is
+        # playing already has its file open and is left alone.
+        playlist = client.get_property('playlist')
+        if not isinstance(playlist, list):
+            return
+        indices = [
+            index
+            for index, item in enumerate(playlist)
+            if isinstance(item, dict)
+            and item.get('filename') in removed
+            and not item.get('current')
+        ]
+        for index in reversed(indices):
+            client.command_nowait('playlist-remove', index)
+
+    def _apply(self, added: list[str], removed: list[str]) -> None:
+        append_playlist_entries(self.playlist_path, added)
+        remove_playlist_entries(self.playlist_path, removed)
+
+        if self.table is not None and self.scheduler is not None:
+            for entry in added:
+                directory, _, name = entry.rpartition('/')
+                self.table.add(self.table.add_directory(directory), name)
+                self.scheduler.add()
+            for index in self.table.find_many(removed).values():
+                self.scheduler.discard(index)
+            return
+
+        client = self.client
+        if client is None or not client.connected or not (added or removed):
+            return
+        try:
+            if removed:
+                self._remove_from_mpv(client, set(removed))
+            for entry in added:
+                client.command('loadfile', entry, 'append')
+                if self.shuffle:
+                    count = client.get_property('playlist-count')
+                    position = client.get_property('playlist-pos')
+                    if not isinstance(position, int) or position < 0:
+                        position = 0
+                    # The new entry sits at count - 1; every upcoming slot,
+                    # including staying last, is equally likely.
+                    target = self.rng.randint(min(position + 1, count - 1), count - 1)
+                    if target < count - 1:
+                        client.command('playlist-move', count - 1, target)
+        except MpvIpcError as exc:
+            if self.logger is not None:
+                self.logger.log(f'Failed to push library changes to mpv: {exc}')
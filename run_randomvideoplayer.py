@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from randomvideoplayer.gui import run_app
+from randomvideoplayer.__main__ import main
 
 if __name__ == '__main__':
-    run_app()
+    main()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from randomvideoplayer import app_config
+from randomvideoplayer.app_config import (
+    CONFIG_VERSION,
+    AppConfig,
+    migrate_config,
+    parse_config,
+    validate_changes,
+)
+
+
+def test_values_outside_their_bounds_fall_back_to_defaults() -> None:
+    config, problems = parse_config({
+        'screens': 0,
+        'metrics_port': 70000,
+        'scan_workers': 1000,
+        'min_size_mb': -1,
+        'watch_interval': float('nan'),
+        'shuffle_queue_length': 8,
+    })
+    defaults = AppConfig()
+    assert config.screens == defaults.screens
+    assert config.metrics_port == defaults.metrics_port
+    assert config.scan_workers == defaults.scan_workers
+    assert config.min_size_mb == defaults.min_size_mb
+    assert config.watch_interval == defaults.watch_interval
+    assert config.shuffle_queue_length == 8
+    assert len(problems) == 5
+
+
+def test_wrong_types_and_choices_are_rejected() -> None:
+    config, problems = parse_config({
+        'recursive': 'yes',
+        'screens': True,
+        'storage_profile': 'tape',
+        'extensions': ['.webm', 3],
+    })
+    assert config == AppConfig()
+    assert len(problems) == 4
+
+
+def test_malformed_roots_are_dropped_one_by_one() -> None:
+    config, problems = parse_config({
+        'roots': [
+            '/a',
+            {'path': '/b', 'weight': 'heavy'},
+            {'path': '/c', 'weight': None},
+            {'path': '/d', 'weight': 2, 'recursive': True},
+            {'path': '/e', 'recursive': 'no'},
+            {'weight': 1},
+        ],
+    })
+    assert config.roots == ['/a', {'path': '/d', 'weight': 2, 'recursive': True}]
+    assert len(problems) == 4
+
+
+def test_newer_versions_keep_known_settings() -> None:
+    config, problems = parse_config({
+        'version': CONFIG_VERSION + 1,
+        'screens': 2,
+        'added_later': True,
+    })
+    assert config.screens == 2
+    assert any('newer version' in problem for problem in problems)
+    assert any('added_later' in problem for problem in problems)
+
+
+@pytest.mark.parametrize('version', ['1', -1, True, 1.5])
+def test_invalid_versions_are_read_as_current(version: Any) -> None:
+    data, problems = migrate_config({'version': version, 'screens': 2})
+    assert data == {'screens': 2}
+    assert len(problems) == 1
+
+
+def test_older_versions_run_each_migration_step(monkeypatch: pytest.MonkeyPatch) -> None:
+    def rename(data: dict[str, Any]) -> dict[str, Any]:
+        data = dict(data)
+        data['directory'] = data.pop('folder')
+        return data
+
+    monkeypatch.setitem(app_config._MIGRATIONS, CONFIG_VERSION - 1, rename)
+    config, problems = parse_config({'version': CONFIG_VERSION - 1, 'folder': '/videos'})
+    assert config.directory == '/videos'
+    assert problems == []
+
+
+def test_overrides_are_checked_like_the_file() -> None:
+    assert validate_changes({'screens': 2, 'metrics_port': 9464}) == []
+    assert len(validate_changes({'screens': 0, 'metrics_port': 70000})) == 2
+    assert validate_changes({'roots': [{'path': '/a', 'weight': -1}]})
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+import pytest
+
+from randomvideoplayer.mpv_ipc import MpvIpcClient, MpvIpcError, make_ipc_address
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, 'AF_UNIX'),
+    reason='needs AF_UNIX sockets',
+)
+
+
+class FakeMpv:
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.properties: dict[str, Any] = {'playlist-count': 3, 'playlist-pos': 1}
+        self.commands: list[list[Any]] = []
+        self.received = threading.Condition()
+        self.held: set[str] = set()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(address)
+        self.server.listen(1)
+        self.conn: Optional[socket.socket] = None
+        self.send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        conn, _ = self.server.accept()
+        self.conn = conn
+        buffer = b''
+        while True:
+            try:
+                chunk = conn.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                self._handle(json.loads(line))
+
+    def _handle(self, message: dict[str, Any]) -> None:
+        command = message['command']
+        with self.received:
+            self.commands.append(command)
+            self.received.notify_all()
+        request_id = message.get('request_id')
+        if request_id is None or command[0] in self.held:
+            return
+        reply: dict[str, Any] = {'request_id': request_id, 'error': 'success', 'data': None}
+        if command[0] == 'get_property':
+            if command[1] in self.properties:
+                reply['data'] = self.properties[command[1]]
+            else:
+                reply['error'] = 'property not found'
+        elif command[0] == 'set_property':
+            self.properties[command[1]] = command[2]
+        # Replies arrive in the opposite order to the requests, like mpv
+        # answering an async command after a later synchronous one.
+        delay = 0.05 if command[:2] == ['get_property', 'playlist-count'] else 0.0
+        threading.Timer(delay, self.send, args=(reply,)).start()
+
+    def send(self, message: dict[str, Any]) -> None:
+        assert self.conn is not None
+        with self.send_lock:
+            self.conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> list[list[Any]]:
+        with self.received:
+            self.received.wait_for(lambda: len(self.commands) >= count, timeout)
+            return list(self.commands)
+
+    def disconnect(self) -> None:
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.shutdown(socket.SHUT_RDWR)
+            conn.close()
+
+    def close(self) -> None:
+        self.disconnect()
+        self.server.close()
+        try:
+            os.unlink(self.address)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def mpv() -> Iterator[tuple[FakeMpv, MpvIpcClient]]:
+    address = make_ipc_address()
+    server = FakeMpv(address)
+    client = MpvIpcClient(address)
+    client.connect(timeout=5.0)
+    try:
+        yield server, client
+    finally:
+        client.close()
+        server.close()
+
+
+def test_replies_are_matched_to_their_requests(mpv: tuple[FakeMpv, MpvIpcClient]) -> None:
+    server, client = mpv
+    results: dict[str, Any] = {}
+
+    def fetch(name: str) -> None:
+        results[name] = client.get_property(name)
+
+    threads = [
+        threading.Thread(target=fetch, args=(name,))
+        for name in ('playlist-count', 'playlist-pos')
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5.0)
+    assert results == {'playlist-count': 3, 'playlist-pos': 1}
+
+
+def test_error_reply_raises(mpv: tuple[FakeMpv, MpvIpcClient]) -> None:
+    server, client = mpv
+    with pytest.raises(MpvIpcError, match='property not found'):
+        client.get_property('no-such-property')
+    client.set_property('pause', True)
+    assert server.properties['pause'] is True
+
+
+def test_property_changes_reach_their_observer(mpv: tuple[FakeMpv, MpvIpcClient]) -> None:
+    server, client = mpv
+    seen: list[tuple[str, Any]] = []
+    events: list[dict[str, Any]] = []
+    changed = threading.Event()
+
+    def on_pos(name: str, value: Any) -> None:
+        seen.append((name, value))
+        changed.set()
+
+    pos_id = client.observe_property('playlist-pos', on_pos)
+    pause_id = client.observe_property('pause', lambda name, value: seen.append((name, value)))
+    client.add_event_handler('end-file', events.append)
+    assert server.wait_for(2)[:2] == [
+        ['observe_property', pos_id, 'playlist-pos'],
+        ['observe_property', pause_id, 'pause'],
+    ]
+
+    server.send({'event': 'end-file', 'reason': 'eof'})
+    server.send({'event': 'property-change', 'id': pos_id, 'name': 'playlist-pos', 'data': 2})
+    assert changed.wait(5.0)
+    assert seen == [('playlist-pos', 2)]
+    assert events == [{'event': 'end-file', 'reason': 'eof'}]
+
+    client.unobserve_property(pos_id)
+    changed.clear()
+    server.send({'event': 'property-change', 'id': pos_id, 'name': 'playlist-pos', 'data': 3})
+    server.send({'event': 'property-change', 'id': pause_id, 'name': 'pause', 'data': True})
+    deadline = time.monotonic() + 5.0
+    while len(seen) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert seen == [('playlist-pos', 2), ('pause', True)]
+
+
+def test_command_nowait_sends_without_request_id(mpv: tuple[FakeMpv, MpvIpcClient]) -> None:
+    server, client = mpv
+    client.command_nowait('loadfile', '/clips/a.webm', 'append')
+    client.command_nowait('playlist-move', 3, 2)
+    assert server.wait_for(2) == [
+        ['loadfile', '/clips/a.webm', 'append'],
+        ['playlist-move', 3, 2],
+    ]
+    # A following synchronous command still gets its own reply.
+    assert client.get_property('playlist-pos') == 1
+
+
+def test_disconnect_unblocks_pending_commands(mpv: tuple[FakeMpv, MpvIpcClient]) -> None:
+    server, client = mpv
+    server.held.add('playlist-next')
+    errors: list[Exception] = []
+
+    def skip() -> None:
+        try:
+            client.skip()
+        except MpvIpcError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=skip) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    server.wait_for(3)
+    started = time.monotonic()
+    server.disconnect()
+    for thread in threads:
+        thread.join(timeout=5.0)
+    assert time.monotonic() - started < 2.0
+    assert len(errors) == 3
+    assert all('connection closed' in str(exc) for exc in errors)
+    assert not client.connected
+    with pytest.raises(MpvIpcError, match='not connected'):
+        client.command_nowait('quit')
+
+
+class ListLogger:
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def log(self, message: str) -> None:
+        self.lines.append(message)
+
+
+def test_failing_handler_is_logged_and_others_still_run() -> None:
+    address = make_ipc_address()
+    server = FakeMpv(address)
+    logger = ListLogger()
+    client = MpvIpcClient(address, logger=logger)  # type: ignore[arg-type]
+    client.connect(timeout=5.0)
+    try:
+        seen = threading.Event()
+
+        def broken(event: dict[str, Any]) -> None:
+            raise RuntimeError('tracker exploded')
+
+        client.add_event_handler('end-file', broken)
+        client.add_event_handler('end-file', lambda event: seen.set())
+        server.send({'event': 'end-file', 'reason': 'error'})
+        assert seen.wait(5.0)
+        assert any('tracker exploded' in line for line in logger.lines)
+        # The reader thread survived and still matches replies.
+        assert client.get_property('playlist-pos') == 1
+    finally:
+        client.close()
+        server.close()
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from randomvideoplayer.path_table import PathTable
+from randomvideoplayer.playlist_builder import (
+    add_batch,
+    playlist_index,
+    read_playlist_table,
+    remove_playlist_entries,
+    write_playlist_file,
+)
+
+
+def make_table(tmp_path: Path) -> PathTable:
+    table = PathTable()
+    add_batch(table, str(tmp_path / 'a'), ['1.webm', '2.webm'])
+    add_batch(table, str(tmp_path / 'b'), ['3.webm'])
+    add_batch(table, str(tmp_path / 'a' / 'c'), ['4.webm', 'space name.webm'])
+    return table
+
+
+def test_table_round_trips_through_the_playlist_file(tmp_path: Path) -> None:
+    table = make_table(tmp_path)
+    playlist = tmp_path / 'playlist.m3u'
+    assert write_playlist_file(table, playlist) == 5
+    assert playlist.read_text(encoding='utf-8').startswith('#EXTM3U\n')
+    assert not playlist.with_name(playlist.name + '.tmp').exists()
+    assert list(read_playlist_table(playlist)) == list(table)
+
+
+def test_removed_entries_are_commented_out_and_not_counted(tmp_path: Path) -> None:
+    table = make_table(tmp_path)
+    entries = list(table)
+    playlist = tmp_path / 'playlist.m3u'
+    write_playlist_file(table, playlist)
+    size = playlist.stat().st_size
+
+    assert remove_playlist_entries(playlist, [entries[1], entries[3], '/missing.webm']) == 2
+    assert playlist.stat().st_size == size
+    assert list(read_playlist_table(playlist)) == [entries[0], entries[2], entries[4]]
+
+    assert playlist_index(playlist, entries[0]) == 0
+    assert playlist_index(playlist, entries[1]) is None
+    assert playlist_index(playlist, entries[2]) == 1
+    assert playlist_index(playlist, entries[4]) == 2
+    assert playlist_index(playlist, '/missing.webm') is None
+
+
+def test_playlist_index_without_a_header(tmp_path: Path) -> None:
+    playlist = tmp_path / 'playlist.m3u'
+    playlist.write_text('/x/1.webm\n/x/2.webm\n', encoding='utf-8')
+    assert playlist_index(playlist, '/x/1.webm') == 0
+    assert remove_playlist_entries(playlist, ['/x/1.webm']) == 0
+    assert playlist_index(playlist, '/x/2.webm') == 1
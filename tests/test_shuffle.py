@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import random
+
+from randomvideoplayer.shuffle import ShuffleScheduler, WeightedScheduler
+
+
+def test_no_repeat_window_holds_recent_entries() -> None:
+    scheduler = ShuffleScheduler(10, no_repeat_window=4, rng=random.Random(1))
+    played = [scheduler.next() for _ in range(500)]
+    assert None not in played
+    assert set(played) == set(range(10))
+    for position, index in enumerate(played):
+        assert index not in played[max(0, position - 4) : position]
+
+
+def test_no_repeat_window_is_capped_at_half_the_library() -> None:
+    scheduler = ShuffleScheduler(4, no_repeat_window=100, rng=random.Random(2))
+    played = [scheduler.next() for _ in range(100)]
+    assert None not in played
+    for position, index in enumerate(played):
+        assert index not in played[max(0, position - 2) : position]
+
+
+def test_without_loop_every_entry_plays_once_then_stops() -> None:
+    scheduler = ShuffleScheduler(6, no_repeat_window=2, loop=False, rng=random.Random(3))
+    played = [scheduler.next() for _ in range(6)]
+    assert sorted(played) == list(range(6))
+    assert scheduler.next() is None
+    assert scheduler.next() is None
+
+
+def test_discarded_entries_are_skipped_until_restored() -> None:
+    scheduler = ShuffleScheduler(5, rng=random.Random(4))
+    scheduler.discard(1)
+    scheduler.discard(3)
+    assert {scheduler.next() for _ in range(200)} == {0, 2, 4}
+    scheduler.restore([3])
+    assert {scheduler.next() for _ in range(200)} == {0, 2, 3, 4}
+
+
+def test_weighted_scheduler_follows_weights_not_group_sizes() -> None:
+    # Group 0 holds 2 entries and group 1 holds 10; plays split 3:1 anyway.
+    scheduler = WeightedScheduler(
+        [3.0, 1.0],
+        lambda index: 0 if index < 2 else 1,
+        count=12,
+        rng=random.Random(5),
+    )
+    draws = 8000
+    first = sum(1 for _ in range(draws) if scheduler.next() < 2)
+    assert abs(first / draws - 0.75) < 0.02
+
+
+def test_weighted_scheduler_skips_zero_weight_groups() -> None:
+    scheduler = WeightedScheduler(
+        [1.0, 0.0],
+        lambda index: index % 2,
+        count=10,
+        rng=random.Random(6),
+    )
+    assert {scheduler.next() for _ in range(200)} == {0, 2, 4, 6, 8}
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable
+
+import pytest
+
+from randomvideoplayer.library_index import LibraryIndex
+from randomvideoplayer.scanner import walk_directories
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, 'symlink') or os.name == 'nt',
+    reason='needs directory symlinks',
+)
+
+Walk = Callable[[Path, bool, Path], Iterable[tuple[str, list[str]]]]
+
+
+@pytest.fixture
+def library(tmp_path: Path) -> Path:
+    root = tmp_path / 'library'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'shared').mkdir()
+    (root / 'a.webm').touch()
+    (root / 'sub' / 'b.webm').touch()
+    (root / 'shared' / 'c.webm').touch()
+    os.symlink('.', root / 'sub' / 'self')
+    os.symlink('..', root / 'sub' / 'up')
+    os.symlink(root / 'shared', root / 'link1')
+    os.symlink(root / 'shared', root / 'link2')
+    os.symlink(root, tmp_path / 'root-link')
+    return root
+
+
+def walk_serial(root: Path, follow: bool, tmp_path: Path) -> Iterable[tuple[str, list[str]]]:
+    return walk_directories(str(root), True, workers=1, follow_symlinks=follow)
+
+
+def walk_parallel(root: Path, follow: bool, tmp_path: Path) -> Iterable[tuple[str, list[str]]]:
+    return walk_directories(str(root), True, workers=4, follow_symlinks=follow)
+
+
+def walk_indexed(root: Path, follow: bool, tmp_path: Path) -> Iterable[tuple[str, list[str]]]:
+    index = LibraryIndex(tmp_path / 'index.sqlite3')
+    try:
+        # The second walk is served from the index rows of the first.
+        list(index.walk(root, True, workers=4, follow_symlinks=follow))
+        return list(index.walk(root, True, workers=4, follow_symlinks=follow))
+    finally:
+        index.close()
+
+
+def found(batches: Iterable[tuple[str, list[str]]]) -> Counter[str]:
+    return Counter(
+        os.path.realpath(os.path.join(directory, name))
+        for directory, names in batches
+        for name in names
+    )
+
+
+@pytest.mark.parametrize('walk', [walk_serial, walk_parallel, walk_indexed])
+@pytest.mark.parametrize('via_link', [False, True], ids=['root', 'symlinked-root'])
+def test_loops_and_shared_links_yield_each_file_once(
+    library: Path,
+    tmp_path: Path,
+    walk: Walk,
+    via_link: bool,
+) -> None:
+    root = tmp_path / 'root-link' if via_link else library
+    real = os.path.realpath(library)
+    expected = Counter(
+        os.path.join(real, name)
+        for name in ('a.webm', os.path.join('sub', 'b.webm'), os.path.join('shared', 'c.webm'))
+    )
+    assert found(walk(root, True, tmp_path)) == expected
+
+
+@pytest.mark.parametrize('walk', [walk_serial, walk_parallel, walk_indexed])
+def test_links_are_skipped_without_follow(library: Path, tmp_path: Path, walk: Walk) -> None:
+    result = found(walk(tmp_path / 'root-link', False, tmp_path))
+    assert sorted(result.values()) == [1, 1, 1]
+    assert {os.path.basename(path) for path in result} == {'a.webm', 'b.webm', 'c.webm'}